@@ -1,17 +1,52 @@
 from __future__ import annotations
+import argparse
+import atexit
+import bisect
+import codecs
+import concurrent.futures
+import contextlib
+import copy
+import csv
+import functools
+import heapq
+import io
+import itertools
 import json
 import os
 import re
-from datetime import datetime
-from typing import Dict, List, Optional, Any, Set
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from datetime import date, datetime, timedelta
+from operator import itemgetter
+from typing import Dict, List, Optional, Any, Set, Tuple, Callable, Iterable, Iterator
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import filedialog, messagebox
 import customtkinter as ctk
 import hashlib
 import secrets
+import shutil
+import tempfile
+
+try:
+    import numpy as np # Opcional: solo lo usa el motor de análisis (MatrizAsistencia)
+except ImportError:
+    np = None
 
 ARCHIVO_DATOS = "datos.json" # Guarda datos (alumnos, cursos, sesiones, etc.) POR USUARIO
 ARCHIVO_USUARIOS = "usuarios.json" # Guarda datos de inicio de sesión (hash, salt, id, etc.)
+DIRECTORIO_DATOS = "datos" # Un archivo por usuario (datos/<user_id>.json) y su .resumen.json + indice.json
+ARCHIVO_SQLITE = "asistencia.db" # Base de datos para el almacenamiento SQLite (opcional)
+LIMITE_JOURNAL = 5000 # Registros del journal antes de compactarlo en datos.json
+SNAPSHOTS_ROTADOS = 3 # Copias anteriores que se conservan de cada archivo (datos.json.1, .2, ...)
+UMBRAL_PANTALLA_CARGA = 5 * 1024 * 1024 # Bytes a cargar desde los que se muestra la pantalla de carga
+ESPERA_ESCRITURA = 0.5 # Segundos sin cambios antes de que la escritura diferida guarde
+LIMITE_BUSQUEDA = 100 # Alumnos que muestra la búsqueda mientras se escribe
+PERIODOS_RESUMEN = ("semana", "mes") # Periodos de los resúmenes de asistencia por curso (tendencias)
 
 # Funciones de Utilidad
 
@@ -46,9 +81,82 @@ def hash_password(password: str, salt: Optional[str] = None) -> (str, str):
 
 
 # Clases principales
-class Estudiante:
+# --- Representación compacta de RUTs ---
+class TablaRuts:
+    """
+    RUT <-> ordinal. Cada RUT se guarda una sola vez (str internado) y la asistencia de las
+    sesiones se guarda como array('I') ordenado de ordinales: 4 bytes por alumno en vez de
+    un str propio más una entrada de set en cada sesión.
+    La tabla solo crece: las sesiones en memoria guardan ordinales, así que un RUT nunca se
+    quita ni su ordinal se reutiliza, aunque se libere el usuario o se elimine el alumno.
+    Tiene una entrada por RUT distinto que el proceso haya visto (alumnos de los usuarios
+    cargados y de los shards que recorren exportar_asistencia o el reporte con procesos=1),
+    unos 175 bytes cada una: ~17 MB por cada 100.000 RUTs distintos. Volver a cargar los mismos
+    alumnos no la hace crecer. len(TABLA_RUTS) muestra su tamaño actual.
+    """
+    def __init__(self):
+        self._ordinales: Dict[str, int] = {}
+        self._ruts: List[str] = []
+        self._bloqueo = threading.Lock()
+
+    def ordinal(self, rut: str) -> int:
+        i = self._ordinales.get(rut)
+        if i is None:
+            with self._bloqueo:
+                i = self._ordinales.get(rut)
+                if i is None:
+                    # Primero la lista, para que un ordinal publicado siempre tenga su RUT
+                    self._ruts.append(sys.intern(rut))
+                    i = self._ordinales[rut] = len(self._ruts) - 1
+        return i
+
+    def __len__(self) -> int:
+        return len(self._ruts)
+
+    def internar(self, rut: str) -> str:
+        """La instancia compartida del RUT (la misma en alumnos, cursos y sesiones)."""
+        return self._ruts[self.ordinal(rut)]
+
+    def codificar(self, ruts: Iterable[str]) -> array:
+        return array('I', sorted(set(map(self.ordinal, ruts))))
+
+    def decodificar(self, ordinales: array) -> Set[str]:
+        return set(map(self._ruts.__getitem__, ordinales))
+
+    def contiene(self, ordinales: array, rut: str) -> bool:
+        i = self._ordinales.get(rut)
+        if i is None:
+            return False
+        j = bisect.bisect_left(ordinales, i)
+        return j < len(ordinales) and ordinales[j] == i
+
+
+# Compartida por todas las entidades del proceso (ver en TablaRuts cuánto crece)
+TABLA_RUTS = TablaRuts()
+
+
+class EntidadPersistible:
+    """
+    Base de Estudiante, Curso y Sesion. `version` sube cada vez que un mutador de
+    SistemaAsistencia modifica la entidad; el guardado reutiliza el JSON ya serializado
+    mientras la versión no cambie.
+    """
+    __slots__ = ("version", "_fragmento")
+
+    def __init__(self):
+        self.version = 0
+        self._fragmento: Optional[Tuple[int, bool, str]] = None # (version, compacto, json)
+
+    def marcar_modificado(self):
+        self.version += 1
+
+
+class Estudiante(EntidadPersistible):
+    __slots__ = ("rut", "nombre")
+
     def __init__(self, rut: str, nombre: str):
-        self.rut = rut
+        super().__init__()
+        self.rut = TABLA_RUTS.internar(rut)
         self.nombre = nombre
 
     def to_dict(self) -> Dict[str, Any]:
@@ -59,13 +167,16 @@ class Estudiante:
         return Estudiante(d["rut"], d["nombre"])
 
 
-class Curso:
+class Curso(EntidadPersistible):
+    __slots__ = ("codigo", "nombre", "horario", "estudiantes_ruts", "cerrado", "min_asistencia")
+
     def __init__(self, codigo: str, nombre: str, horario: Optional[str] = "", estudiantes_ruts: Optional[List[str]] = None, cerrado: bool = False, min_asistencia: float = 60.0):
+        super().__init__()
         self.codigo = codigo
         self.nombre = nombre
         self.horario = horario
         # **NUEVA FUNCIONALIDAD** - Estudiantes asignados al curso
-        self.estudiantes_ruts = set(estudiantes_ruts) if estudiantes_ruts else set()
+        self.estudiantes_ruts = set(map(TABLA_RUTS.internar, estudiantes_ruts)) if estudiantes_ruts else set()
         # **NUEVA FUNCIONALIDAD** - Curso cerrado
         self.cerrado = cerrado
         # **NUEVA FUNCIONALIDAD** - Mínimo de asistencia
@@ -93,14 +204,44 @@ class Curso:
         )
 
 
-class Sesion:
+class Sesion(EntidadPersistible):
+    """
+    La asistencia se guarda compacta (ordinales de TABLA_RUTS). ruts_presentes y
+    ruts_justificados entregan un set nuevo en cada lectura: para modificarlos hay que
+    asignar el set completo, y para consultar un solo alumno conviene esta_presente(rut).
+    """
+    __slots__ = ("id", "codigo_curso", "fecha", "_presentes", "_justificados")
+
     def __init__(self, id: int, codigo_curso: str, fecha: datetime, ruts_presentes: List[str], ruts_justificados: Optional[List[str]] = None):
+        super().__init__()
         self.id = id
         self.codigo_curso = codigo_curso
         self.fecha = fecha
-        self.ruts_presentes = set(ruts_presentes)
+        self.ruts_presentes = ruts_presentes
         # **NUEVA FUNCIONALIDAD** - Inasistencias justificadas
-        self.ruts_justificados = set(ruts_justificados) if ruts_justificados else set()
+        self.ruts_justificados = ruts_justificados or ()
+
+    @property
+    def ruts_presentes(self) -> Set[str]:
+        return TABLA_RUTS.decodificar(self._presentes)
+
+    @ruts_presentes.setter
+    def ruts_presentes(self, ruts: Iterable[str]):
+        self._presentes = TABLA_RUTS.codificar(ruts)
+
+    @property
+    def ruts_justificados(self) -> Set[str]:
+        return TABLA_RUTS.decodificar(self._justificados)
+
+    @ruts_justificados.setter
+    def ruts_justificados(self, ruts: Iterable[str]):
+        self._justificados = TABLA_RUTS.codificar(ruts)
+
+    def esta_presente(self, rut: str) -> bool:
+        return TABLA_RUTS.contiene(self._presentes, rut)
+
+    def esta_justificado(self, rut: str) -> bool:
+        return TABLA_RUTS.contiene(self._justificados, rut)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -122,102 +263,2355 @@ class Sesion:
         )
 
 
+def datos_usuario_vacios() -> Dict[str, Any]:
+    """Estructura de datos inicial de un usuario (profesor)."""
+    return {
+        "estudiantes": {},
+        "cursos": {},
+        "sesiones": {},
+        "siguiente_id_sesion": 1
+    }
+
+
+def datos_usuario_desde_dict(user_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Reconstruye los objetos de Estudiante, Curso y Sesion de un usuario."""
+    return {
+        "estudiantes": {st["rut"]: Estudiante.from_dict(st) for st in user_data.get("estudiantes", [])},
+        "cursos": {co["codigo"]: Curso.from_dict(co) for co in user_data.get("cursos", [])},
+        "sesiones": {sess["id"]: Sesion.from_dict(sess) for sess in user_data.get("sesiones", [])},
+        "siguiente_id_sesion": user_data.get("siguiente_id_sesion", 1)
+    }
+
+
+def datos_usuario_a_dict(data: Dict[str, Any]) -> Dict[str, Any]:
+    return { 
+        "estudiantes": [s.to_dict() for s in data["estudiantes"].values()],
+        "cursos": [c.to_dict() for c in data["cursos"].values()],
+        "sesiones": [s.to_dict() for s in data["sesiones"].values()],
+        "siguiente_id_sesion": data["siguiente_id_sesion"]
+    }
+
+
+# --- Serialización JSON en streaming ---
+# Se escribe entidad por entidad: la memoria extra durante un guardado es la de una sola
+# entidad, no la de una copia completa de los datos como dicts/listas.
+
+def _json_entidad(d: Dict[str, Any], compacto: bool) -> str:
+    return json.dumps(d, ensure_ascii=False, separators=(",", ":") if compacto else None)
+
+
+def _fragmento_entidad(entidad: EntidadPersistible, compacto: bool) -> Tuple[str, bool]:
+    """Retorna (json, recodificada): solo se llama a to_dict() si la entidad cambió desde el último guardado."""
+    cache = entidad._fragmento
+    if cache is not None and cache[0] == entidad.version and cache[1] == compacto:
+        return cache[2], False
+    texto = _json_entidad(entidad.to_dict(), compacto)
+    entidad._fragmento = (entidad.version, compacto, texto)
+    return texto, True
+
+
+def escribir_datos_usuario_stream(f, datos: Dict[str, Any], compacto: bool = False, sangria: str = "") -> Tuple[int, int]:
+    """
+    Escribe el objeto JSON de un usuario (mismo formato que datos_usuario_a_dict).
+    Retorna (entidades recodificadas, entidades reutilizadas del cache).
+    """
+    salto = "" if compacto else "\n"
+    sangria_clave = "" if compacto else sangria + "  "
+    sangria_entidad = "" if compacto else sangria + "    "
+    dos_puntos = ":" if compacto else ": "
+    
+    recodificadas = reutilizadas = 0
+    f.write("{" + salto)
+    for clave in ("estudiantes", "cursos", "sesiones"):
+        f.write(f'{sangria_clave}"{clave}"{dos_puntos}[')
+        primero = True
+        for entidad in datos[clave].values():
+            texto, recodificada = _fragmento_entidad(entidad, compacto)
+            if recodificada:
+                recodificadas += 1
+            else:
+                reutilizadas += 1
+            f.write(("" if primero else ",") + salto + sangria_entidad + texto)
+            primero = False
+        f.write(("" if primero else salto + sangria_clave) + "]," + salto)
+    f.write(f'{sangria_clave}"siguiente_id_sesion"{dos_puntos}{datos["siguiente_id_sesion"]}{salto}{sangria}}}')
+    return recodificadas, reutilizadas
+
+
+def escribir_datos_stream(f, datos_por_usuario: Dict[int, Dict[str, Any]], compacto: bool = False) -> Tuple[int, int]:
+    """Escribe datos_por_usuario completo como JSON, usuario por usuario y sesión por sesión."""
+    salto = "" if compacto else "\n"
+    sangria = "" if compacto else "  "
+    recodificadas = reutilizadas = 0
+    f.write("{")
+    for i, (user_id, datos) in enumerate(datos_por_usuario.items()):
+        f.write(("," if i else "") + salto + sangria + f'"{user_id}"' + (":" if compacto else ": "))
+        r, c = escribir_datos_usuario_stream(f, datos, compacto, sangria)
+        recodificadas += r
+        reutilizadas += c
+    f.write(salto + "}" + salto)
+    return recodificadas, reutilizadas
+
+
+class _UsuariosEnStream:
+    """Adapta un iterador de (user_id, datos) a lo único que usa escribir_datos_stream: items()."""
+
+    def __init__(self, pares: Iterable[Tuple[int, Dict[str, Any]]]):
+        self._pares = pares
+
+    def items(self) -> Iterable[Tuple[int, Dict[str, Any]]]:
+        return self._pares
+
+
+# --- Carga JSON en streaming ---
+class LectorJSONIncremental:
+    """
+    Recorre un archivo JSON por bloques. La estructura (objetos/arreglos de primer nivel) se
+    lee token a token y cada valor interno se decodifica completo con raw_decode, así que en
+    memoria solo hay un bloque del archivo y el valor que se está leyendo.
+    """
+    TAMANO_BLOQUE = 1 << 16
+
+    def __init__(self, f, progreso: Optional[Callable[[int, int], None]] = None, total: int = 0):
+        self.f = f # Abierto en modo binario
+        self.progreso = progreso
+        self.total = total
+        self.bytes_leidos = 0
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self._decodificador_utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._decodificador_json = json.JSONDecoder()
+
+    def _rellenar(self) -> bool:
+        bloque = self.f.read(self.TAMANO_BLOQUE)
+        if not bloque:
+            self.eof = True
+            self.buffer = self.buffer[self.pos:] + self._decodificador_utf8.decode(b"", final=True)
+            self.pos = 0
+            return False
+        self.bytes_leidos += len(bloque)
+        self.buffer = self.buffer[self.pos:] + self._decodificador_utf8.decode(bloque)
+        self.pos = 0
+        if self.progreso:
+            self.progreso(self.bytes_leidos, self.total)
+        return True
+
+    def siguiente_caracter(self) -> str:
+        """Retorna (sin consumir) el próximo carácter que no sea espacio; "" al final del archivo."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._rellenar():
+                return ""
+
+    def esperar(self, caracter: str):
+        encontrado = self.siguiente_caracter()
+        if encontrado != caracter:
+            raise json.JSONDecodeError(f"Se esperaba '{caracter}'", self.buffer, self.pos)
+        self.pos += 1
+
+    def leer_valor(self) -> Any:
+        """Decodifica un valor JSON completo (entidad, número, texto...)."""
+        self.siguiente_caracter()
+        while True:
+            try:
+                valor, fin = self._decodificador_json.raw_decode(self.buffer, self.pos)
+                # Si el valor termina justo al final del bloque podría seguir (ej: un número)
+                if fin < len(self.buffer) or self.eof:
+                    self.pos = fin
+                    return valor
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._rellenar()
+
+    def _separador(self, cierre: str) -> bool:
+        """Consume "," (retorna True) o el cierre (retorna False)."""
+        caracter = self.siguiente_caracter()
+        if caracter not in (",", cierre):
+            raise json.JSONDecodeError(f"Se esperaba ',' o '{cierre}'", self.buffer, self.pos)
+        self.pos += 1
+        return caracter == ","
+
+    def iterar_objeto(self) -> Iterator[str]:
+        """Genera las claves de un objeto; el llamador debe leer el valor de cada una."""
+        self.esperar("{")
+        if self.siguiente_caracter() == "}":
+            self.pos += 1
+            return
+        while True:
+            clave = self.leer_valor()
+            self.esperar(":")
+            yield clave
+            if not self._separador("}"):
+                return
+
+    def iterar_arreglo(self) -> Iterator[Any]:
+        """Genera cada elemento (completo) de un arreglo."""
+        self.esperar("[")
+        if self.siguiente_caracter() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.leer_valor()
+            if not self._separador("]"):
+                return
+
+
+def _leer_datos_usuario_stream(lector: LectorJSONIncremental) -> Dict[str, Any]:
+    """Construye los objetos de un usuario a medida que se leen sus registros."""
+    datos = datos_usuario_vacios()
+    for clave in lector.iterar_objeto():
+        if clave == "estudiantes":
+            for d in lector.iterar_arreglo():
+                datos["estudiantes"][d["rut"]] = Estudiante.from_dict(d)
+        elif clave == "cursos":
+            for d in lector.iterar_arreglo():
+                datos["cursos"][d["codigo"]] = Curso.from_dict(d)
+        elif clave == "sesiones":
+            for d in lector.iterar_arreglo():
+                datos["sesiones"][d["id"]] = Sesion.from_dict(d)
+        elif clave == "siguiente_id_sesion":
+            datos["siguiente_id_sesion"] = lector.leer_valor()
+        else:
+            lector.leer_valor() # Clave desconocida: se ignora
+    return datos
+
+
+def iterar_datos_stream(ruta: str, progreso: Optional[Callable[[int, int], None]] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Genera (user_id, datos) de un datos.json sin cargar nunca el árbol JSON completo."""
+    with open(ruta, "rb") as f:
+        lector = LectorJSONIncremental(f, progreso, os.path.getsize(ruta))
+        for clave in lector.iterar_objeto():
+            try:
+                user_id = int(clave)
+            except ValueError:
+                lector.leer_valor()
+                continue
+            yield user_id, _leer_datos_usuario_stream(lector)
+        if lector.siguiente_caracter() != "":
+            raise json.JSONDecodeError("Datos extra al final del archivo", lector.buffer, lector.pos)
+
+
+def cargar_datos_usuario_stream(ruta: str, progreso: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """Carga un archivo con los datos de un solo usuario (shard) en streaming."""
+    with open(ruta, "rb") as f:
+        lector = LectorJSONIncremental(f, progreso, os.path.getsize(ruta))
+        datos = _leer_datos_usuario_stream(lector)
+        if lector.siguiente_caracter() != "":
+            raise json.JSONDecodeError("Datos extra al final del archivo", lector.buffer, lector.pos)
+        return datos
+
+
+# --- Formato binario de shards (sesiones compactas) ---
+# Archivo: MAGIA_BINARIO, u32 largo + cabecera JSON (estudiantes, cursos, siguiente_id_sesion
+# en el mismo formato de siempre) y el bloque de sesiones:
+#   tabla de RUTs del usuario (u32 cantidad, cada uno u8 largo + bytes) y tabla de códigos de
+#   curso (igual, con u16 largo); luego u32 cantidad de sesiones y por cada una
+#   id (i64), índice de curso (u32), fecha en microsegundos desde 1970 (i64) y dos mapas de
+#   bits (presentes, justificados) sobre los ordinales de la tabla de RUTs. Cada mapa se
+#   recorta a los bytes con bits (u32 byte inicial, u32 largo), así un curso de 30 alumnos
+#   no paga la tabla completa del profesor.
+MAGIA_BINARIO = b"ASIS1\n"
+EPOCA = datetime(1970, 1, 1)
+_CABECERA_SESION = struct.Struct("<qIq")
+_CABECERA_MAPA = struct.Struct("<II")
+_BITS_A_BYTES = bytes.maketrans(b"01", b"\x00\x01")
+
+
+def _codificar_mapa(ruts: Set[str], ordinales: Dict[str, int], potencias: List[int]) -> bytes:
+    # Los bits son distintos, así que la suma equivale al OR (y se hace en C)
+    bits = sum(map(potencias.__getitem__, map(ordinales.__getitem__, ruts)))
+    if not bits:
+        return _CABECERA_MAPA.pack(0, 0)
+    inicio = ((bits & -bits).bit_length() - 1) // 8
+    bits >>= inicio * 8
+    largo = (bits.bit_length() + 7) // 8
+    return _CABECERA_MAPA.pack(inicio, largo) + bits.to_bytes(largo, "little")
+
+
+def _decodificar_mapa(buffer: bytes, pos: int, tabla: List[str]) -> Tuple[Set[str], int]:
+    inicio, largo = _CABECERA_MAPA.unpack_from(buffer, pos)
+    pos += _CABECERA_MAPA.size
+    if pos + largo > len(buffer):
+        raise ValueError("Mapa de bits truncado")
+    bits = int.from_bytes(buffer[pos:pos + largo], "little")
+    if not bits:
+        return set(), pos + largo
+    # Un byte 0/1 por ordinal (el bit menos significativo primero) para filtrar la tabla con compress
+    seleccion = format(bits, "b")[::-1].encode("ascii").translate(_BITS_A_BYTES)
+    base = inicio * 8
+    return set(itertools.compress(tabla[base:base + len(seleccion)], seleccion)), pos + largo
+
+
+def _escribir_tabla(partes: List[bytes], textos: List[str], formato_largo: str):
+    partes.append(struct.pack("<I", len(textos)))
+    for texto in textos:
+        codificado = texto.encode("utf-8")
+        partes.append(struct.pack(formato_largo, len(codificado)) + codificado)
+
+
+def _leer_tabla(buffer: bytes, pos: int, formato_largo: str) -> Tuple[List[str], int]:
+    (cantidad,) = struct.unpack_from("<I", buffer, pos)
+    pos += 4
+    tam_largo = struct.calcsize(formato_largo)
+    textos = []
+    for _ in range(cantidad):
+        (largo,) = struct.unpack_from(formato_largo, buffer, pos)
+        pos += tam_largo
+        textos.append(buffer[pos:pos + largo].decode("utf-8"))
+        pos += largo
+    return textos, pos
+
+
+def codificar_sesiones(sesiones: Dict[int, Sesion]) -> bytes:
+    """Codifica las sesiones de un usuario en el bloque binario (ver formato arriba)."""
+    # Cada sesión se decodifica una sola vez (ruts_presentes arma un set nuevo en cada lectura)
+    asistencia = [(s, s.ruts_presentes, s.ruts_justificados) for s in sesiones.values()]
+    tabla_ruts = sorted(set().union(*(presentes | justificados for _, presentes, justificados in asistencia)))
+    ordinales = {rut: i for i, rut in enumerate(tabla_ruts)}
+    potencias = [1 << i for i in range(len(tabla_ruts))]
+    tabla_codigos = sorted({s.codigo_curso for s in sesiones.values()})
+    indice_codigo = {codigo: i for i, codigo in enumerate(tabla_codigos)}
+    
+    partes: List[bytes] = []
+    _escribir_tabla(partes, tabla_ruts, "<B")
+    _escribir_tabla(partes, tabla_codigos, "<H")
+    partes.append(struct.pack("<I", len(sesiones)))
+    for sess, presentes, justificados in asistencia:
+        # Fechas sin zona horaria, como las crea la aplicación
+        microsegundos = (sess.fecha - EPOCA) // timedelta(microseconds=1)
+        partes.append(_CABECERA_SESION.pack(sess.id, indice_codigo[sess.codigo_curso], microsegundos))
+        partes.append(_codificar_mapa(presentes, ordinales, potencias))
+        partes.append(_codificar_mapa(justificados, ordinales, potencias))
+    return b"".join(partes)
+
+
+def decodificar_sesiones(buffer: bytes, pos: int = 0) -> Tuple[Dict[int, Sesion], int]:
+    """Inverso de codificar_sesiones. Retorna (sesiones, posición final)."""
+    tabla_ruts, pos = _leer_tabla(buffer, pos, "<B")
+    tabla_codigos, pos = _leer_tabla(buffer, pos, "<H")
+    (cantidad,) = struct.unpack_from("<I", buffer, pos)
+    pos += 4
+    sesiones = {}
+    for _ in range(cantidad):
+        sesion_id, indice_codigo, microsegundos = _CABECERA_SESION.unpack_from(buffer, pos)
+        pos += _CABECERA_SESION.size
+        presentes, pos = _decodificar_mapa(buffer, pos, tabla_ruts)
+        justificados, pos = _decodificar_mapa(buffer, pos, tabla_ruts)
+        sesiones[sesion_id] = Sesion(sesion_id, tabla_codigos[indice_codigo], EPOCA + timedelta(microseconds=microsegundos), presentes, justificados)
+    return sesiones, pos
+
+
+def escribir_datos_usuario_binario(f, datos: Dict[str, Any], compacto: bool = False) -> Tuple[int, int]:
+    """Escribe un shard binario (f abierto en modo binario). Retorna (recodificadas, reutilizadas)."""
+    cabecera = io.StringIO()
+    sin_sesiones = {"estudiantes": datos["estudiantes"], "cursos": datos["cursos"], "sesiones": {}, "siguiente_id_sesion": datos["siguiente_id_sesion"]}
+    recodificadas, reutilizadas = escribir_datos_usuario_stream(cabecera, sin_sesiones, compacto)
+    cabecera_bytes = cabecera.getvalue().encode("utf-8")
+    f.write(MAGIA_BINARIO + struct.pack("<I", len(cabecera_bytes)) + cabecera_bytes)
+    f.write(codificar_sesiones(datos["sesiones"]))
+    # El bloque de sesiones se codifica completo en cada guardado
+    return recodificadas + len(datos["sesiones"]), reutilizadas
+
+
+def cargar_datos_usuario_binario(ruta: str, progreso: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """Carga un shard binario. Un archivo truncado o dañado lanza ValueError."""
+    with open(ruta, "rb") as f:
+        buffer = f.read()
+    if progreso:
+        progreso(len(buffer), len(buffer))
+    if not buffer.startswith(MAGIA_BINARIO):
+        raise ValueError("No es un shard binario")
+    try:
+        pos = len(MAGIA_BINARIO)
+        (largo,) = struct.unpack_from("<I", buffer, pos)
+        pos += 4
+        datos = _leer_datos_usuario_stream(LectorJSONIncremental(io.BytesIO(buffer[pos:pos + largo])))
+        datos["sesiones"], pos = decodificar_sesiones(buffer, pos + largo)
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"Shard binario dañado: {e}") from e
+    if pos != len(buffer):
+        raise ValueError("Datos extra al final del shard binario")
+    return datos
+
+
+# --- Escritura atómica de archivos ---
+def escribir_atomico(ruta: str, escribir, rotaciones: int = SNAPSHOTS_ROTADOS, sincronizar: bool = True, binario: bool = False) -> Any:
+    """
+    Reemplaza `ruta` sin dejarla nunca a medias: escribir(f) escribe en un archivo temporal
+    del mismo directorio, se hace fsync y recién entonces se renombra sobre el original.
+    La versión anterior queda como ruta.1 (y las previas como ruta.2 ... ruta.N).
+    Retorna lo que retorne escribir(f).
+    """
+    resultado, confirmar = preparar_escritura_atomica(ruta, escribir, rotaciones, sincronizar, binario)
+    confirmar()
+    return resultado
+
+
+def preparar_escritura_atomica(ruta: str, escribir, rotaciones: int = SNAPSHOTS_ROTADOS, sincronizar: bool = True, binario: bool = False) -> Tuple[Any, Callable[[], None]]:
+    """
+    Primera mitad de escribir_atomico: escribir(f) escribe en streaming el archivo temporal.
+    Retorna (lo que retorne escribir(f), confirmar); confirmar() hace el fsync, la rotación y
+    el rename (la parte lenta), así puede llamarse después de soltar un bloqueo.
+    """
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    fd, ruta_tmp = tempfile.mkstemp(prefix=os.path.basename(ruta) + ".", suffix=".tmp", dir=directorio)
+    try:
+        with (os.fdopen(fd, "wb") if binario else os.fdopen(fd, "w", encoding="utf-8")) as f:
+            resultado = escribir(f)
+    except BaseException:
+        os.remove(ruta_tmp)
+        raise
+        
+    def confirmar():
+        try:
+            if sincronizar:
+                with open(ruta_tmp, "rb") as f:
+                    os.fsync(f.fileno())
+                    
+            if rotaciones and os.path.exists(ruta):
+                for i in range(rotaciones - 1, 0, -1):
+                    if os.path.exists(f"{ruta}.{i}"):
+                        os.replace(f"{ruta}.{i}", f"{ruta}.{i + 1}")
+                # Enlace duro: el archivo vivo nunca deja de existir durante la rotación
+                try:
+                    os.link(ruta, f"{ruta}.1")
+                except OSError:
+                    shutil.copy2(ruta, f"{ruta}.1")
+                    
+            os.replace(ruta_tmp, ruta)
+        except BaseException:
+            if os.path.exists(ruta_tmp):
+                os.remove(ruta_tmp)
+            raise
+            
+        if sincronizar and os.name == "posix":
+            # Persistir también la entrada del directorio (el rename)
+            fd_dir = os.open(directorio, os.O_RDONLY)
+            try:
+                os.fsync(fd_dir)
+            finally:
+                os.close(fd_dir)
+    return resultado, confirmar
+
+
+def _leer_json(ruta: str) -> Any:
+    with open(ruta, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def leer_json_con_respaldo(ruta: str, rotaciones: int = SNAPSHOTS_ROTADOS, avisos: Optional[List[str]] = None, leer: Callable[[str], Any] = _leer_json) -> Any:
+    """
+    Lee `ruta` con leer(ruta); si está dañada usa el snapshot rotado válido más nuevo
+    (ruta.1, ruta.2, ...). Retorna None si no hay archivo. Un archivo dañado sin respaldos
+    se renombra a ruta.danado (para no perderlo) y se retorna None.
+    """
+    if not os.path.exists(ruta):
+        return None
+    for candidato in [ruta] + [f"{ruta}.{i}" for i in range(1, rotaciones + 1)]:
+        if not os.path.exists(candidato):
+            continue
+        try:
+            contenido = leer(candidato)
+        except ValueError: # JSONDecodeError y UnicodeDecodeError
+            continue
+        if candidato != ruta and avisos is not None:
+            avisos.append(f"{ruta} estaba dañado; se recuperó desde {candidato}.")
+        return contenido
+        
+    os.replace(ruta, ruta + ".danado")
+    if avisos is not None:
+        avisos.append(f"{ruta} estaba dañado y no había respaldos válidos; se guardó como {ruta}.danado.")
+    return None
+
+
+def eliminar_con_respaldos(ruta: str, rotaciones: int = SNAPSHOTS_ROTADOS):
+    for candidato in [ruta] + [f"{ruta}.{i}" for i in range(1, rotaciones + 1)]:
+        if os.path.exists(candidato):
+            os.remove(candidato)
+
+
+# --- Almacenamiento (persistencia intercambiable) ---
+# Un almacenamiento sabe cargar/guardar usuarios y datos_por_usuario completos, y registrar
+# cambios puntuales. cambios es una lista de (tipo, clave), con tipo "estudiantes", "cursos",
+# "sesiones", "siguiente_id_sesion" o "usuario" (usuario eliminado con todos sus datos).
+# Si la entidad ya no existe en datos_por_usuario, el cambio corresponde a una eliminación.
+# preparar_cambios() separa registrar_cambios() en dos fases: serializa lo modificado (con los
+# datos bloqueados) y retorna la función que escribe en disco, que se llama sin el bloqueo
+# del sistema para no congelar la interfaz. Las escrituras se serializan con _bloqueo_escritura.
+# Los almacenamientos con carga_perezosa = True no cargan los datos en cargar_datos(); cada
+# usuario se lee con cargar_datos_usuario() cuando se necesita (ej: al iniciar sesión).
+
+class AlmacenamientoJSON:
+    """Guarda todo en datos.json / usuarios.json, opcionalmente con journal de cambios."""
+    carga_perezosa = False
+
+    def __init__(self, archivo_datos: str = ARCHIVO_DATOS, archivo_usuarios: str = ARCHIVO_USUARIOS, usar_journal: bool = False, limite_journal: int = LIMITE_JOURNAL, rotaciones: int = SNAPSHOTS_ROTADOS, sincronizar: bool = True, compacto: bool = False):
+        self.archivo_datos = archivo_datos
+        self.archivo_usuarios = archivo_usuarios
+        # Guardados atómicos (temporal + fsync + rename) con N snapshots rotados
+        self.rotaciones = rotaciones
+        self.sincronizar = sincronizar
+        self.avisos: List[str] = [] # Recuperaciones desde snapshots, para mostrar al usuario
+        self.compacto = compacto # Separadores JSON compactos (archivo más chico, menos legible)
+        self._bloqueo_escritura = threading.Lock() # Un guardado a la vez (ver preparar_cambios)
+
+        # **NUEVA FUNCIONALIDAD** - Journal de cambios (write-ahead)
+        # Si está activo, cada mutación agrega registros pequeños a "datos.json.journal"
+        # en vez de reescribir datos.json completo. La compactación los vuelca al snapshot.
+        self.usar_journal = usar_journal
+        self.limite_journal = limite_journal
+        self.archivo_journal = archivo_datos + ".journal"
+        self._registros_journal = 0 # Registros acumulados desde la última compactación
+
+        # **NUEVA FUNCIONALIDAD** - Entidades recodificadas por guardado (el resto sale del cache)
+        self.estadisticas_serializacion = {"escrituras": 0, "recodificadas_ultimo": 0, "reutilizadas_ultimo": 0, "recodificadas_total": 0}
+
+    def _escribir(self, ruta: str, escribir, binario: bool = False) -> Any:
+        return escribir_atomico(ruta, escribir, self.rotaciones, self.sincronizar, binario)
+
+    def _preparar_escritura(self, ruta: str, escribir, binario: bool = False) -> Tuple[Any, Callable[[], None]]:
+        return preparar_escritura_atomica(ruta, escribir, self.rotaciones, self.sincronizar, binario)
+
+    def _anotar_serializacion(self, recodificadas: int, reutilizadas: int):
+        e = self.estadisticas_serializacion
+        e["escrituras"] += 1
+        e["recodificadas_ultimo"] = recodificadas
+        e["reutilizadas_ultimo"] = reutilizadas
+        e["recodificadas_total"] += recodificadas
+
+    def _leer(self, ruta: str, leer: Callable[[str], Any] = _leer_json) -> Any:
+        return leer_json_con_respaldo(ruta, self.rotaciones, self.avisos, leer)
+
+    def cargar_usuarios(self) -> Dict[str, Dict[str, Any]]:
+        usuarios = self._leer(self.archivo_usuarios)
+        if usuarios is None:
+            usuarios = {}
+            self.guardar_usuarios(usuarios)
+        return usuarios
+
+    def cargar_datos(self, progreso: Optional[Callable[[int, int], None]] = None) -> Dict[int, Dict[str, Any]]:
+        # Carga en streaming: los objetos se construyen mientras se lee el archivo
+        datos_por_usuario = self._leer(self.archivo_datos, lambda ruta: dict(iterar_datos_stream(ruta, progreso)))
+        if datos_por_usuario is None:
+            datos_por_usuario = {}
+
+        # Reaplicar los cambios del journal sobre el último snapshot
+        self._reproducir_journal(datos_por_usuario)
+        if self.usar_journal and self._registros_journal >= self.limite_journal:
+            self.guardar_datos(datos_por_usuario)
+        return datos_por_usuario
+
+    def guardar_datos(self, datos_por_usuario: Dict[int, Dict[str, Any]]):
+        self._preparar_snapshot(datos_por_usuario)()
+
+    def _preparar_snapshot(self, datos_por_usuario: Dict[int, Dict[str, Any]]) -> Callable[[], None]:
+        # Se serializa en streaming al temporal (la memoria no crece con los datos); solo el
+        # fsync y el rename quedan para la función retornada
+        resultado, confirmar = self._preparar_escritura(self.archivo_datos, lambda f: escribir_datos_stream(f, datos_por_usuario, self.compacto))
+        
+        def escribir():
+            with self._bloqueo_escritura:
+                confirmar()
+                self._anotar_serializacion(*resultado)
+                # El snapshot ya contiene todo lo registrado en el journal
+                if self._registros_journal or os.path.exists(self.archivo_journal):
+                    open(self.archivo_journal, "w", encoding="utf-8").close()
+                    self._registros_journal = 0
+        return escribir
+
+    def guardar_usuarios(self, usuarios: Dict[str, Dict[str, Any]]):
+        self._escribir(self.archivo_usuarios, lambda f: json.dump(usuarios, f, ensure_ascii=False, indent=2))
+
+    def registrar_cambios(self, datos_por_usuario: Dict[int, Dict[str, Any]], user_id: int, cambios: List[Tuple[str, Any]]):
+        self.preparar_cambios(datos_por_usuario, user_id, cambios)()
+
+    def preparar_cambios(self, datos_por_usuario: Dict[int, Dict[str, Any]], user_id: int, cambios: List[Tuple[str, Any]]) -> Callable[[], None]:
+        if self.usar_journal:
+            return self._preparar_journal(datos_por_usuario, user_id, cambios)
+        return self._preparar_snapshot(datos_por_usuario)
+
+    def cerrar(self):
+        pass
+
+    # --- Journal ---
+    def _reproducir_journal(self, datos_por_usuario: Dict[int, Dict[str, Any]]):
+        """Aplica en orden los registros de datos.json.journal sobre datos_por_usuario."""
+        self._registros_journal = 0
+        if not os.path.exists(self.archivo_journal):
+            return
+            
+        clases = {"estudiantes": Estudiante, "cursos": Curso, "sesiones": Sesion}
+        fin_valido = 0
+        with open(self.archivo_journal, "rb") as f:
+            for linea in f:
+                if not linea.endswith(b"\n"):
+                    break # Cola incompleta (corte durante la escritura): se descarta más abajo
+                fin_valido += len(linea)
+                try:
+                    registro = json.loads(linea)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                    
+                user_id = registro["u"]
+                tipo = registro["t"]
+                self._registros_journal += 1
+                
+                if tipo == "usuario":
+                    # El usuario y todos sus datos fueron eliminados
+                    datos_por_usuario.pop(user_id, None)
+                    continue
+                    
+                datos = datos_por_usuario.setdefault(user_id, datos_usuario_vacios())
+                if tipo == "siguiente_id_sesion":
+                    datos["siguiente_id_sesion"] = registro["v"]
+                elif registro["v"] is None:
+                    datos[tipo].pop(registro["k"], None)
+                else:
+                    datos[tipo][registro["k"]] = clases[tipo].from_dict(registro["v"])
+                    
+        # Sin esto, el próximo registro quedaría pegado a la línea incompleta y se perdería
+        if fin_valido < os.path.getsize(self.archivo_journal):
+            os.truncate(self.archivo_journal, fin_valido)
+
+    def _preparar_journal(self, datos_por_usuario: Dict[int, Dict[str, Any]], user_id: int, cambios: List[Tuple[str, Any]]) -> Callable[[], None]:
+        """
+        Agrega al journal un registro por entidad modificada. Si la entidad ya no existe
+        en memoria el registro la marca como eliminada (v = null). El usuario completo solo se
+        elimina con el cambio ("usuario", None), nunca porque sus datos no estén en memoria.
+        """
+        datos = datos_por_usuario.get(user_id)
+        lineas = []
+        for tipo, clave in cambios:
+            if tipo == "usuario":
+                registro = {"u": user_id, "t": "usuario", "v": None}
+            elif datos is None:
+                continue # No está en memoria: no hay nada nuevo que registrar
+            elif tipo == "siguiente_id_sesion":
+                registro = {"u": user_id, "t": tipo, "v": datos["siguiente_id_sesion"]}
+            else:
+                entidad = datos[tipo].get(clave)
+                registro = {"u": user_id, "t": tipo, "k": clave, "v": entidad.to_dict() if entidad else None}
+            lineas.append(json.dumps(registro, ensure_ascii=False) + "\n")
+            
+        if self._registros_journal + len(lineas) >= self.limite_journal:
+            # Toca compactar: el snapshot ya incluye estos cambios
+            return self._preparar_snapshot(datos_por_usuario)
+            
+        def escribir():
+            with self._bloqueo_escritura:
+                with open(self.archivo_journal, "a", encoding="utf-8") as f:
+                    f.writelines(lineas)
+                    if self.sincronizar:
+                        f.flush()
+                        os.fsync(f.fileno())
+                self._registros_journal += len(lineas)
+        return escribir
+
+
+class AlmacenamientoShards(AlmacenamientoJSON):
+    """
+    Guarda los datos de cada usuario en su propio archivo (datos/<user_id>.json). Al iniciar
+    solo se leen usuarios.json y un índice global pequeño; cada shard se carga al hacer login
+    y una mutación reescribe únicamente el shard de su usuario.
+    Con sesiones_binarias=True los shards se guardan como datos/<user_id>.asis (sesiones en
+    formato binario, ver MAGIA_BINARIO); un shard en el otro formato se lee y se convierte
+    en su próximo guardado.
+    Junto a cada shard va datos/<user_id>.resumen.json con las claves de RESUMEN_INDICE (los
+    RUT de sus alumnos y los códigos de sus cursos), para validar entre usuarios sin cargar los
+    shards de los demás. Solo se reescribe cuando cambia el resumen de ese usuario; el índice
+    (indice.json) guarda únicamente la lista de usuarios.
+    """
+    carga_perezosa = True
+    # clave en <user_id>.resumen.json -> clave en los datos del usuario
+    RESUMEN_INDICE = {"alumnos": "estudiantes", "cursos": "cursos"}
+
+    def __init__(self, directorio: str = DIRECTORIO_DATOS, archivo_usuarios: str = ARCHIVO_USUARIOS, archivo_datos_legado: str = ARCHIVO_DATOS, rotaciones: int = SNAPSHOTS_ROTADOS, sincronizar: bool = True, compacto: bool = False, sesiones_binarias: bool = False):
+        super().__init__(archivo_datos_legado, archivo_usuarios, rotaciones=rotaciones, sincronizar=sincronizar, compacto=compacto)
+        self.directorio = directorio
+        self.archivo_indice = os.path.join(directorio, "indice.json")
+        self.indice: Dict[str, Any] = {"usuarios": []}
+        self._resumenes: Dict[int, Dict[str, List[str]]] = {} # user_id -> resumen ya leído o escrito
+        self.sesiones_binarias = sesiones_binarias
+
+    def _ruta_shard(self, user_id: int, binario: Optional[bool] = None) -> str:
+        if binario is None:
+            binario = self.sesiones_binarias
+        return os.path.join(self.directorio, f"{user_id}.asis" if binario else f"{user_id}.json")
+
+    def _ruta_resumen(self, user_id: int) -> str:
+        return os.path.join(self.directorio, f"{user_id}.resumen.json")
+
+    def cargar_datos(self, progreso: Optional[Callable[[int, int], None]] = None) -> Dict[int, Dict[str, Any]]:
+        if not os.path.exists(self.archivo_indice):
+            self._migrar_desde_legado(progreso)
+            
+        indice = self._leer(self.archivo_indice)
+        if indice is None:
+            # Índice dañado y sin respaldos: se reconstruye a partir de los shards existentes
+            nombres = [os.path.splitext(n) for n in os.listdir(self.directorio)]
+            indice = {"usuarios": sorted({int(base) for base, ext in nombres if base.isdigit() and ext in (".json", ".asis")})}
+            self.indice = {"usuarios": []}
+            self._actualizar_indice(set(indice["usuarios"]))
+        self.indice = {"usuarios": indice["usuarios"]}
+        if any(clave in indice for clave in self.RESUMEN_INDICE):
+            # Índice de una versión anterior con los resúmenes dentro: se pasan a sus archivos
+            for user_id in indice["usuarios"]:
+                resumen = {clave: indice[clave][str(user_id)] for clave in self.RESUMEN_INDICE if str(user_id) in indice.get(clave, {})}
+                if len(resumen) == len(self.RESUMEN_INDICE):
+                    self._guardar_resumen(user_id, resumen)
+            self._guardar_indice()
+        return {} # Nada se carga hasta que se pide un usuario
+
+    def _migrar_desde_legado(self, progreso: Optional[Callable[[int, int], None]] = None):
+        """Reparte un datos.json (+ journal) existente en un shard por usuario."""
+        os.makedirs(self.directorio, exist_ok=True)
+        datos_por_usuario = super().cargar_datos(progreso)
+        self.indice = {"usuarios": sorted(datos_por_usuario)}
+        for user_id, datos in datos_por_usuario.items():
+            self._preparar_shard(user_id, datos)()
+        self._guardar_indice()
+
+    def ids_usuarios(self) -> List[int]:
+        return list(self.indice["usuarios"])
+
+    def resumen_usuarios(self, clave: str) -> Dict[int, List[str]]:
+        """user_id -> claves guardadas en su resumen (ver RESUMEN_INDICE), de todos los usuarios."""
+        return {user_id: self._resumen(user_id)[clave] for user_id in self.indice["usuarios"]}
+
+    def _resumen(self, user_id: int) -> Dict[str, List[str]]:
+        resumen = self._resumenes.get(user_id)
+        if resumen is None:
+            resumen = self._leer_resumen(user_id)
+            if resumen is None:
+                # Sin resumen (versión anterior o archivo dañado): se rehace desde el shard
+                datos = self.cargar_datos_usuario(user_id)
+                resumen = {clave: [] for clave in self.RESUMEN_INDICE} if datos is None else self._resumir(datos)
+                self._guardar_resumen(user_id, resumen)
+        return resumen
+
+    def _leer_resumen(self, user_id: int) -> Optional[Dict[str, List[str]]]:
+        resumen = leer_json_con_respaldo(self._ruta_resumen(user_id), 0, self.avisos)
+        if resumen is None or any(clave not in resumen for clave in self.RESUMEN_INDICE):
+            return None
+        self._resumenes[user_id] = resumen
+        return resumen
+
+    def _resumir(self, datos: Dict[str, Any]) -> Dict[str, List[str]]:
+        return {clave: sorted(datos[clave_datos]) for clave, clave_datos in self.RESUMEN_INDICE.items()}
+
+    def _guardar_resumen(self, user_id: int, resumen: Dict[str, List[str]]):
+        # Es derivado del shard: sin snapshots rotados, se rehace si se pierde
+        escribir_atomico(self._ruta_resumen(user_id), lambda f: json.dump(resumen, f, ensure_ascii=False), 0, self.sincronizar)
+        self._resumenes[user_id] = resumen
+
+    def cargar_datos_usuario(self, user_id: int, progreso: Optional[Callable[[int, int], None]] = None) -> Optional[Dict[str, Any]]:
+        # Primero el formato configurado; si no existe, el otro (cambio de formato)
+        for binario in (self.sesiones_binarias, not self.sesiones_binarias):
+            ruta = self._ruta_shard(user_id, binario)
+            if os.path.exists(ruta):
+                cargar = cargar_datos_usuario_binario if binario else cargar_datos_usuario_stream
+                return self._leer(ruta, lambda r: cargar(r, progreso))
+        return None
+
+    def guardar_datos(self, datos_por_usuario: Dict[int, Dict[str, Any]]):
+        """Reescribe los shards de los usuarios cargados (los demás no cambiaron)."""
+        with self._bloqueo_escritura:
+            # De a un shard: serializar y confirmar antes de pasar al siguiente
+            for user_id, datos in datos_por_usuario.items():
+                self._preparar_shard(user_id, datos)()
+            self._actualizar_indice(set(self.indice["usuarios"]) | set(datos_por_usuario))
+
+    def preparar_cambios(self, datos_por_usuario: Dict[int, Dict[str, Any]], user_id: int, cambios: List[Tuple[str, Any]]) -> Callable[[], None]:
+        datos = datos_por_usuario.get(user_id)
+        if ("usuario", None) in cambios:
+            # Solo el cambio explícito elimina el shard; que los datos no estén en memoria no basta
+            def eliminar():
+                with self._bloqueo_escritura:
+                    eliminar_con_respaldos(self._ruta_shard(user_id, True), self.rotaciones)
+                    eliminar_con_respaldos(self._ruta_shard(user_id, False), self.rotaciones)
+                    eliminar_con_respaldos(self._ruta_resumen(user_id), 0)
+                    self._resumenes.pop(user_id, None)
+                    self._actualizar_indice(set(self.indice["usuarios"]) - {user_id})
+            return eliminar
+        if datos is None:
+            return lambda: None # No está en memoria: no hay nada nuevo que escribir
+        escribir_shard = self._preparar_shard(user_id, datos)
+        
+        def escribir():
+            with self._bloqueo_escritura:
+                escribir_shard()
+                self._actualizar_indice(set(self.indice["usuarios"]) | {user_id})
+        return escribir
+
+    def _preparar_shard(self, user_id: int, datos: Dict[str, Any]) -> Callable[[], None]:
+        """Serializa el shard en streaming a su temporal; la función retornada lo confirma (y escribe el resumen, si cambió)."""
+        if self.sesiones_binarias:
+            resultado, confirmar = self._preparar_escritura(self._ruta_shard(user_id), lambda f: escribir_datos_usuario_binario(f, datos, self.compacto), binario=True)
+        else:
+            resultado, confirmar = self._preparar_escritura(self._ruta_shard(user_id), lambda f: escribir_datos_usuario_stream(f, datos, self.compacto))
+        # El resumen solo se reescribe si cambiaron los alumnos o cursos del usuario
+        anterior = self._resumenes.get(user_id)
+        cambio_resumen = anterior is None or any(set(anterior[clave]) != datos[clave_datos].keys() for clave, clave_datos in self.RESUMEN_INDICE.items())
+        resumen = self._resumir(datos) if cambio_resumen else None
+        
+        def escribir():
+            confirmar()
+            self._anotar_serializacion(*resultado)
+            # Un shard que quedó en el otro formato ya no está al día
+            otro = self._ruta_shard(user_id, not self.sesiones_binarias)
+            if os.path.exists(otro):
+                eliminar_con_respaldos(otro, self.rotaciones)
+            if resumen is not None and resumen != (self._resumenes.get(user_id) or self._leer_resumen(user_id)):
+                self._guardar_resumen(user_id, resumen)
+        return escribir
+
+    def _actualizar_indice(self, ids_usuarios: Set[int]):
+        # El índice solo se reescribe cuando cambia el conjunto de usuarios
+        if ids_usuarios != set(self.indice["usuarios"]):
+            self.indice["usuarios"] = sorted(ids_usuarios)
+            self._guardar_indice()
+
+    def _guardar_indice(self):
+        self._escribir(self.archivo_indice, lambda f: json.dump(self.indice, f))
+
+
+class SentenciasPendientes:
+    """Anota execute/executemany para ejecutarlos después (ver AlmacenamientoSQLite.preparar_cambios)."""
+    def __init__(self):
+        self.sentencias: List[Tuple[str, str, Any]] = []
+
+    def execute(self, sql: str, parametros: Any = ()):
+        self.sentencias.append(("execute", sql, parametros))
+
+    def executemany(self, sql: str, filas: List[Any]):
+        self.sentencias.append(("executemany", sql, filas))
+
+    def ejecutar(self, conexion: sqlite3.Connection):
+        for metodo, sql, parametros in self.sentencias:
+            getattr(conexion, metodo)(sql, parametros)
+
+
+class AlmacenamientoSQLite:
+    """
+    Guarda usuarios y datos en una base SQLite con tablas normalizadas. Cada mutación
+    reescribe solo las filas de las entidades que tocó, dentro de una transacción.
+    """
+    carga_perezosa = False
+
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS usuarios (
+            rut TEXT PRIMARY KEY,
+            id INTEGER NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            salt TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS datos_usuario (
+            user_id INTEGER PRIMARY KEY,
+            siguiente_id_sesion INTEGER NOT NULL DEFAULT 1
+        );
+        CREATE TABLE IF NOT EXISTS estudiantes (
+            user_id INTEGER NOT NULL,
+            rut TEXT NOT NULL,
+            nombre TEXT NOT NULL,
+            PRIMARY KEY (user_id, rut)
+        );
+        CREATE TABLE IF NOT EXISTS cursos (
+            user_id INTEGER NOT NULL,
+            codigo TEXT NOT NULL,
+            nombre TEXT NOT NULL,
+            horario TEXT,
+            cerrado INTEGER NOT NULL DEFAULT 0,
+            min_asistencia REAL NOT NULL DEFAULT 60.0,
+            PRIMARY KEY (user_id, codigo)
+        );
+        CREATE TABLE IF NOT EXISTS curso_estudiantes (
+            user_id INTEGER NOT NULL,
+            codigo_curso TEXT NOT NULL,
+            rut TEXT NOT NULL,
+            PRIMARY KEY (user_id, codigo_curso, rut)
+        );
+        CREATE TABLE IF NOT EXISTS sesiones (
+            user_id INTEGER NOT NULL,
+            id INTEGER NOT NULL,
+            codigo_curso TEXT NOT NULL,
+            fecha TEXT NOT NULL,
+            PRIMARY KEY (user_id, id)
+        );
+        -- estado: 'P' presente, 'J' inasistencia justificada
+        CREATE TABLE IF NOT EXISTS asistencia (
+            user_id INTEGER NOT NULL,
+            sesion_id INTEGER NOT NULL,
+            rut TEXT NOT NULL,
+            estado TEXT NOT NULL CHECK (estado IN ('P', 'J')),
+            PRIMARY KEY (user_id, sesion_id, rut, estado)
+        );
+        CREATE INDEX IF NOT EXISTS idx_sesiones_curso ON sesiones (user_id, codigo_curso, fecha);
+        CREATE INDEX IF NOT EXISTS idx_sesiones_fecha ON sesiones (fecha);
+        CREATE INDEX IF NOT EXISTS idx_curso_estudiantes_rut ON curso_estudiantes (user_id, rut);
+        CREATE INDEX IF NOT EXISTS idx_asistencia_rut ON asistencia (user_id, rut);
+    """
+
+    def __init__(self, archivo_sqlite: str = ARCHIVO_SQLITE):
+        self.archivo_sqlite = archivo_sqlite
+        # La escritura diferida usa la conexión desde su hilo, sin el bloqueo del sistema: las
+        # transacciones de escritura se serializan con _bloqueo_escritura
+        self.conexion = sqlite3.connect(archivo_sqlite, check_same_thread=False)
+        self._bloqueo_escritura = threading.Lock()
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self.conexion.executescript(self.ESQUEMA)
+        self.avisos: List[str] = []
+
+    def cargar_usuarios(self) -> Dict[str, Dict[str, Any]]:
+        filas = self.conexion.execute("SELECT rut, id, password_hash, salt FROM usuarios")
+        return {rut: {"id": uid, "password_hash": ph, "salt": salt} for rut, uid, ph, salt in filas}
+
+    def cargar_datos(self, progreso: Optional[Callable[[int, int], None]] = None) -> Dict[int, Dict[str, Any]]:
+        db = self.conexion
+        datos_por_usuario = {}
+        for user_id, siguiente in db.execute("SELECT user_id, siguiente_id_sesion FROM datos_usuario"):
+            datos = datos_usuario_vacios()
+            datos["siguiente_id_sesion"] = siguiente
+            datos_por_usuario[user_id] = datos
+            
+        def datos_de(user_id):
+            return datos_por_usuario.setdefault(user_id, datos_usuario_vacios())
+            
+        for user_id, rut, nombre in db.execute("SELECT user_id, rut, nombre FROM estudiantes"):
+            datos_de(user_id)["estudiantes"][rut] = Estudiante(rut, nombre)
+            
+        for user_id, codigo, nombre, horario, cerrado, min_asistencia in db.execute("SELECT user_id, codigo, nombre, horario, cerrado, min_asistencia FROM cursos"):
+            datos_de(user_id)["cursos"][codigo] = Curso(codigo, nombre, horario, None, bool(cerrado), min_asistencia)
+        for user_id, codigo, rut in db.execute("SELECT user_id, codigo_curso, rut FROM curso_estudiantes"):
+            curso = datos_de(user_id)["cursos"].get(codigo)
+            if curso:
+                curso.estudiantes_ruts.add(rut)
+                
+        for user_id, sid, codigo, fecha in db.execute("SELECT user_id, id, codigo_curso, fecha FROM sesiones"):
+            datos_de(user_id)["sesiones"][sid] = Sesion(sid, codigo, datetime.fromisoformat(fecha), [])
+        asistencia: Dict[Tuple[int, int], Tuple[List[str], List[str]]] = {}
+        for user_id, sid, rut, estado in db.execute("SELECT user_id, sesion_id, rut, estado FROM asistencia"):
+            asistencia.setdefault((user_id, sid), ([], []))[0 if estado == "P" else 1].append(rut)
+        for (user_id, sid), (presentes, justificados) in asistencia.items():
+            sess = datos_de(user_id)["sesiones"].get(sid)
+            if sess:
+                sess.ruts_presentes = presentes
+                sess.ruts_justificados = justificados
+                
+        return datos_por_usuario
+
+    def guardar_datos(self, datos_por_usuario: Dict[int, Dict[str, Any]]):
+        """Reescribe todas las tablas de datos (se usa para importar o guardar_todo)."""
+        with self._bloqueo_escritura, self.conexion as db:
+            for tabla in ("datos_usuario", "estudiantes", "cursos", "curso_estudiantes", "sesiones", "asistencia"):
+                db.execute(f"DELETE FROM {tabla}")
+            for user_id, datos in datos_por_usuario.items():
+                self._insertar_usuario(db, user_id, datos)
+                for rut in datos["estudiantes"]:
+                    self._escribir_estudiante(db, user_id, datos, rut)
+                for codigo in datos["cursos"]:
+                    self._escribir_curso(db, user_id, datos, codigo)
+                for sid in datos["sesiones"]:
+                    self._escribir_sesion(db, user_id, datos, sid)
+
+    def guardar_usuarios(self, usuarios: Dict[str, Dict[str, Any]]):
+        with self._bloqueo_escritura, self.conexion as db:
+            db.execute("DELETE FROM usuarios")
+            db.executemany(
+                "INSERT INTO usuarios (rut, id, password_hash, salt) VALUES (?, ?, ?, ?)",
+                [(rut, u["id"], u["password_hash"], u["salt"]) for rut, u in usuarios.items()]
+            )
+
+    def registrar_cambios(self, datos_por_usuario: Dict[int, Dict[str, Any]], user_id: int, cambios: List[Tuple[str, Any]]):
+        self.preparar_cambios(datos_por_usuario, user_id, cambios)()
+
+    def preparar_cambios(self, datos_por_usuario: Dict[int, Dict[str, Any]], user_id: int, cambios: List[Tuple[str, Any]]) -> Callable[[], None]:
+        """Arma las sentencias con los datos actuales; la función retornada las ejecuta en una transacción."""
+        datos = datos_por_usuario.get(user_id)
+        if datos is None and ("usuario", None) not in cambios:
+            return lambda: None # No está en memoria: no hay nada nuevo que escribir (y no se borra nada)
+        db = SentenciasPendientes()
+        if ("usuario", None) in cambios:
+            self._eliminar_usuario(db, user_id)
+        else:
+            self._insertar_usuario(db, user_id, datos)
+            for tipo, clave in cambios:
+                if tipo == "estudiantes":
+                    self._escribir_estudiante(db, user_id, datos, clave)
+                elif tipo == "cursos":
+                    self._escribir_curso(db, user_id, datos, clave)
+                elif tipo == "sesiones":
+                    self._escribir_sesion(db, user_id, datos, clave)
+                elif tipo == "siguiente_id_sesion":
+                    db.execute("UPDATE datos_usuario SET siguiente_id_sesion = ? WHERE user_id = ?", (datos["siguiente_id_sesion"], user_id))
+                    
+        def escribir():
+            with self._bloqueo_escritura, self.conexion as conexion:
+                db.ejecutar(conexion)
+        return escribir
+
+    def cerrar(self):
+        self.conexion.close()
+
+    # --- Escritura por entidad (borra las filas de la entidad y las vuelve a insertar si existe) ---
+    def _insertar_usuario(self, db, user_id: int, datos: Dict[str, Any]):
+        db.execute("INSERT OR IGNORE INTO datos_usuario (user_id, siguiente_id_sesion) VALUES (?, ?)", (user_id, datos["siguiente_id_sesion"]))
+
+    def _eliminar_usuario(self, db, user_id: int):
+        for tabla in ("datos_usuario", "estudiantes", "cursos", "curso_estudiantes", "sesiones", "asistencia"):
+            db.execute(f"DELETE FROM {tabla} WHERE user_id = ?", (user_id,))
+
+    def _escribir_estudiante(self, db, user_id: int, datos: Dict[str, Any], rut: str):
+        db.execute("DELETE FROM estudiantes WHERE user_id = ? AND rut = ?", (user_id, rut))
+        st = datos["estudiantes"].get(rut)
+        if st:
+            db.execute("INSERT INTO estudiantes (user_id, rut, nombre) VALUES (?, ?, ?)", (user_id, st.rut, st.nombre))
+
+    def _escribir_curso(self, db, user_id: int, datos: Dict[str, Any], codigo: str):
+        db.execute("DELETE FROM cursos WHERE user_id = ? AND codigo = ?", (user_id, codigo))
+        db.execute("DELETE FROM curso_estudiantes WHERE user_id = ? AND codigo_curso = ?", (user_id, codigo))
+        co = datos["cursos"].get(codigo)
+        if co:
+            db.execute(
+                "INSERT INTO cursos (user_id, codigo, nombre, horario, cerrado, min_asistencia) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, co.codigo, co.nombre, co.horario, int(co.cerrado), co.min_asistencia)
+            )
+            db.executemany(
+                "INSERT INTO curso_estudiantes (user_id, codigo_curso, rut) VALUES (?, ?, ?)",
+                [(user_id, co.codigo, rut) for rut in co.estudiantes_ruts]
+            )
+
+    def _escribir_sesion(self, db, user_id: int, datos: Dict[str, Any], sesion_id: int):
+        db.execute("DELETE FROM sesiones WHERE user_id = ? AND id = ?", (user_id, sesion_id))
+        db.execute("DELETE FROM asistencia WHERE user_id = ? AND sesion_id = ?", (user_id, sesion_id))
+        sess = datos["sesiones"].get(sesion_id)
+        if sess:
+            db.execute(
+                "INSERT INTO sesiones (user_id, id, codigo_curso, fecha) VALUES (?, ?, ?, ?)",
+                (user_id, sess.id, sess.codigo_curso, sess.fecha.isoformat())
+            )
+            db.executemany(
+                "INSERT INTO asistencia (user_id, sesion_id, rut, estado) VALUES (?, ?, ?, ?)",
+                [(user_id, sess.id, rut, "P") for rut in sess.ruts_presentes] + [(user_id, sess.id, rut, "J") for rut in sess.ruts_justificados]
+            )
+
+
+def importar_json_a_sqlite(archivo_sqlite: str = ARCHIVO_SQLITE, archivo_datos: str = ARCHIVO_DATOS, archivo_usuarios: str = ARCHIVO_USUARIOS):
+    """Importa (una sola vez) datos.json + journal y usuarios.json a una base SQLite."""
+    origen = AlmacenamientoJSON(archivo_datos, archivo_usuarios)
+    destino = AlmacenamientoSQLite(archivo_sqlite)
+    try:
+        destino.guardar_usuarios(origen.cargar_usuarios())
+        destino.guardar_datos(origen.cargar_datos())
+    finally:
+        destino.cerrar()
+
+
+# --- Escritura diferida (write-behind) ---
+class PersistenciaDiferida:
+    """
+    Hilo que guarda en segundo plano. Las mutaciones solo marcan al usuario como sucio
+    (con sus cambios) y el hilo hace un único guardado cuando pasan `espera` segundos sin
+    cambios nuevos, así una ráfaga de clics cuesta una sola escritura.
+    """
+    def __init__(self, sistema: "SistemaAsistencia", espera: float = ESPERA_ESCRITURA):
+        self.sistema = sistema
+        self.espera = espera
+        self._condicion = threading.Condition()
+        self._pendientes: Dict[int, List[Tuple[str, Any]]] = {} # user_id -> cambios acumulados
+        self._ultimo_cambio = 0.0
+        self._escribiendo = False
+        self._en_escritura: Set[int] = set() # Usuarios del lote que se está escribiendo
+        self._detenido = False
+        
+        self._estadisticas = {
+            "mutaciones": 0, # Cambios recibidos
+            "guardados": 0, # Escrituras reales (una por usuario sucio)
+            "mutaciones_agrupadas": 0, # Mutaciones que no necesitaron una escritura propia
+            "latencia_ultima_ms": 0.0,
+            "latencia_max_ms": 0.0,
+            "latencia_total_ms": 0.0,
+            "ultimo_error": None
+        }
+        
+        self._hilo = threading.Thread(target=self._bucle, name="escritura-diferida", daemon=True)
+        self._hilo.start()
+
+    def marcar(self, user_id: int, cambios: List[Tuple[str, Any]]):
+        with self._condicion:
+            self._pendientes.setdefault(user_id, []).extend(cambios)
+            self._ultimo_cambio = time.monotonic()
+            self._estadisticas["mutaciones"] += 1
+            self._condicion.notify_all()
+
+    def tiene_pendientes(self, user_id: int) -> bool:
+        with self._condicion:
+            return user_id in self._pendientes or user_id in self._en_escritura
+
+    def guardar_pendientes(self):
+        """
+        Guarda ya (en el hilo que llama) todo lo pendiente, esperando a una escritura en curso.
+        Si algún guardado falla, sus cambios vuelven a la cola y se lanza el error.
+        """
+        with self._condicion:
+            while self._escribiendo:
+                self._condicion.wait()
+            lote = self._tomar_lote()
+        errores = self._escribir(lote)
+        if errores:
+            raise next(iter(errores.values()))
+
+    def detener(self):
+        """Guarda lo pendiente y termina el hilo (logout de la app, cierre de ventana o salida)."""
+        with self._condicion:
+            self._detenido = True
+            self._condicion.notify_all()
+        self._hilo.join()
+        self.guardar_pendientes()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._condicion:
+            stats = dict(self._estadisticas)
+        stats["espera_s"] = self.espera
+        stats["latencia_promedio_ms"] = stats["latencia_total_ms"] / stats["guardados"] if stats["guardados"] else 0.0
+        return stats
+
+    def _tomar_lote(self) -> Dict[int, List[Tuple[str, Any]]]:
+        # Se llama con la condición tomada
+        lote = self._pendientes
+        self._pendientes = {}
+        self._escribiendo = bool(lote)
+        self._en_escritura = set(lote)
+        return lote
+
+    def _bucle(self):
+        while True:
+            with self._condicion:
+                while not self._pendientes and not self._detenido:
+                    self._condicion.wait()
+                if self._detenido:
+                    return # detener() se encarga de lo pendiente
+                restante = self._ultimo_cambio + self.espera - time.monotonic()
+                if restante > 0 or self._escribiendo:
+                    # Todavía llegan cambios: esperar a que se calme la ráfaga
+                    self._condicion.wait(max(restante, 0.01))
+                    continue
+                lote = self._tomar_lote()
+            self._escribir(lote)
+
+    def _escribir(self, lote: Dict[int, List[Tuple[str, Any]]]) -> Dict[int, Exception]:
+        """Escribe el lote; retorna user_id -> error de los guardados que fallaron (quedan pendientes)."""
+        fallidos = {}
+        errores = {}
+        for user_id, cambios in lote.items():
+            inicio = time.perf_counter()
+            try:
+                # Solo la serialización necesita los datos bloqueados; el disco se escribe sin el bloqueo
+                with self.sistema._bloqueo:
+                    escribir = self.sistema.almacenamiento.preparar_cambios(self.sistema.datos_por_usuario, user_id, list(dict.fromkeys(cambios)))
+                escribir()
+            except Exception as e:
+                # Se reintenta en el próximo ciclo; el error queda en las estadísticas
+                fallidos[user_id] = cambios
+                errores[user_id] = e
+                with self._condicion:
+                    self._estadisticas["ultimo_error"] = str(e)
+                continue
+            latencia = (time.perf_counter() - inicio) * 1000
+            
+            with self._condicion:
+                est = self._estadisticas
+                est["guardados"] += 1
+                est["latencia_ultima_ms"] = latencia
+                est["latencia_max_ms"] = max(est["latencia_max_ms"], latencia)
+                est["latencia_total_ms"] += latencia
+                est["mutaciones_agrupadas"] = est["mutaciones"] - est["guardados"]
+                
+        with self._condicion:
+            for user_id, cambios in fallidos.items():
+                self._pendientes[user_id] = cambios + self._pendientes.get(user_id, [])
+            if fallidos:
+                self._ultimo_cambio = time.monotonic()
+            self._escribiendo = False
+            self._en_escritura = set()
+            self._condicion.notify_all()
+        return errores
+
+
+def con_bloqueo(metodo):
+    """Ejecuta un método del sistema con su bloqueo tomado (la escritura diferida lee desde otro hilo)."""
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        with self._bloqueo:
+            return metodo(self, *args, **kwargs)
+    return envoltura
+
+
+# --- Índices en memoria ---
+# Se construyen desde datos_por_usuario la primera vez que se consultan y los mutadores de
+# SistemaAsistencia los mantienen al día. No se persisten: al liberar un usuario o deshacer
+# una transacción simplemente se descartan y se reconstruyen en la próxima consulta.
+
+def _clave_sesion(sesion: Sesion) -> Tuple[datetime, int]:
+    return sesion.fecha, sesion.id
+
+
+class IndiceSesionesPorCurso:
+    """codigo_curso -> sesiones del curso ordenadas por fecha (y por id si coinciden)."""
+    def __init__(self, sesiones: Iterable[Sesion] = ()):
+        self._por_curso: Dict[str, List[Sesion]] = {}
+        for sesion in sorted(sesiones, key=_clave_sesion):
+            self._por_curso.setdefault(sesion.codigo_curso, []).append(sesion)
+
+    def sesiones(self, codigo_curso: str) -> List[Sesion]:
+        return list(self._por_curso.get(codigo_curso, ()))
+
+    def rango(self, codigo_curso: str, desde: Optional[datetime] = None, hasta: Optional[datetime] = None) -> List[Sesion]:
+        """Sesiones del curso con desde <= fecha <= hasta (None = sin límite), en O(log n + k)."""
+        lista = self._por_curso.get(codigo_curso, [])
+        inicio = 0 if desde is None else bisect.bisect_left(lista, (desde,), key=_clave_sesion)
+        fin = len(lista) if hasta is None else bisect.bisect_right(lista, (hasta, float("inf")), key=_clave_sesion)
+        return lista[inicio:fin]
+
+    def agregar(self, sesion: Sesion):
+        bisect.insort(self._por_curso.setdefault(sesion.codigo_curso, []), sesion, key=_clave_sesion)
+
+    def quitar(self, sesion: Sesion):
+        """Quita la sesión; debe llamarse antes de cambiarle la fecha o el curso."""
+        lista = self._por_curso.get(sesion.codigo_curso, [])
+        i = bisect.bisect_left(lista, _clave_sesion(sesion), key=_clave_sesion)
+        if i < len(lista) and lista[i] is sesion:
+            del lista[i]
+            if not lista:
+                del self._por_curso[sesion.codigo_curso]
+
+    def renombrar_curso(self, codigo_antiguo: str, codigo_nuevo: str):
+        lista = self._por_curso.pop(codigo_antiguo, None)
+        if lista:
+            self._por_curso[codigo_nuevo] = lista
+
+    def eliminar_curso(self, codigo_curso: str):
+        self._por_curso.pop(codigo_curso, None)
+
+
+def normalizar_nombre(nombre: str) -> str:
+    """Forma en que se comparan los nombres repetidos (ignorando espacios y mayúsculas/minúsculas)."""
+    return nombre.lower().strip()
+
+
+def es_seccion(curso: Curso) -> bool:
+    return ' - Sección ' in curso.nombre
+
+
+class IndiceNombres:
+    """Nombre normalizado -> claves (RUT o código) de las entidades con ese nombre."""
+    def __init__(self):
+        self._por_nombre: Dict[str, Set[str]] = {}
+
+    def agregar(self, nombre: str, clave: str):
+        self._por_nombre.setdefault(normalizar_nombre(nombre), set()).add(clave)
+
+    def quitar(self, nombre: str, clave: str):
+        nombre = normalizar_nombre(nombre)
+        claves = self._por_nombre.get(nombre)
+        if claves is not None:
+            claves.discard(clave)
+            if not claves:
+                del self._por_nombre[nombre]
+
+    def claves(self, nombre: str) -> Set[str]:
+        return set(self._por_nombre.get(normalizar_nombre(nombre), ()))
+
+
+class IndiceNombresUsuario:
+    """Nombres normalizados de los alumnos, de los cursos y de los cursos base de las secciones de un usuario."""
+    def __init__(self, datos: Dict[str, Any]):
+        self.estudiantes = IndiceNombres()
+        self.cursos = IndiceNombres()
+        self.bases_seccion = IndiceNombres() # "Cálculo - Sección 2" -> "cálculo"
+        for st in datos["estudiantes"].values():
+            self.estudiantes.agregar(st.nombre, st.rut)
+        for curso in datos["cursos"].values():
+            self.agregar_curso(curso)
+
+    def agregar_curso(self, curso: Curso):
+        self.cursos.agregar(curso.nombre, curso.codigo)
+        if es_seccion(curso):
+            self.bases_seccion.agregar(curso.nombre.split(' - ')[0], curso.codigo)
+
+    def quitar_curso(self, curso: Curso):
+        """Debe llamarse antes de cambiarle el nombre o el código al curso."""
+        self.cursos.quitar(curso.nombre, curso.codigo)
+        if es_seccion(curso):
+            self.bases_seccion.quitar(curso.nombre.split(' - ')[0], curso.codigo)
+
+
+def plegar_texto(texto: str) -> str:
+    """Forma de búsqueda: sin tildes (á -> a, ñ -> n), en minúsculas y con espacios simples."""
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    sin_tildes = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_tildes.lower().split())
+
+
+class IndiceBusqueda:
+    """
+    Búsqueda de alumnos de un usuario por subcadena del nombre (plegado, ver plegar_texto) o
+    por prefijo del RUT. Los nombres se indexan por trigramas: una consulta de 3 o más letras
+    solo revisa a los alumnos que tienen todos sus trigramas. Los RUTs, los nombres completos
+    y cada palabra de los nombres se mantienen en listas ordenadas para buscar prefijos con
+    bisect: con 1 o 2 letras y un límite solo se recorren los rangos que empiezan con la
+    consulta, y la subcadena en medio de una palabra se revisa solo si esos no alcanzan.
+    """
+    def __init__(self, estudiantes: Iterable[Estudiante] = ()):
+        self._nombres: Dict[str, str] = {} # rut -> nombre plegado
+        self._trigramas: Dict[str, Set[str]] = {}
+        self._ruts: List[str] = []
+        self._orden: List[Tuple[str, str]] = [] # (nombre plegado, rut), ordenada
+        self._palabras: List[Tuple[str, str]] = [] # (palabra del nombre plegado, rut), ordenada
+        for st in estudiantes:
+            self.agregar(st)
+
+    @staticmethod
+    def _trigramas_de(texto: str) -> Set[str]:
+        return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+    @staticmethod
+    def _rango_prefijo(lista: List[Any], prefijo: str, tuplas: bool = True) -> Tuple[int, int]:
+        """Posiciones [i, j) de la lista ordenada cuyos elementos (o primer campo) empiezan con prefijo."""
+        fin = prefijo + "\U0010ffff" # Mayor que cualquier texto que empiece con prefijo
+        if tuplas:
+            return bisect.bisect_left(lista, (prefijo,)), bisect.bisect_left(lista, (fin,))
+        return bisect.bisect_left(lista, prefijo), bisect.bisect_left(lista, fin)
+
+    @staticmethod
+    def _quitar_ordenado(lista: List[Any], elemento: Any):
+        i = bisect.bisect_left(lista, elemento)
+        if i < len(lista) and lista[i] == elemento:
+            del lista[i]
+
+    def agregar(self, st: Estudiante):
+        nombre = plegar_texto(st.nombre)
+        self._nombres[st.rut] = nombre
+        for trigrama in self._trigramas_de(nombre):
+            self._trigramas.setdefault(trigrama, set()).add(st.rut)
+        bisect.insort(self._ruts, st.rut)
+        bisect.insort(self._orden, (nombre, st.rut))
+        for palabra in nombre.split():
+            bisect.insort(self._palabras, (palabra, st.rut))
+
+    def quitar(self, st: Estudiante):
+        """Debe llamarse antes de cambiarle el nombre o el RUT al alumno."""
+        nombre = self._nombres.pop(st.rut, None)
+        if nombre is None:
+            return
+        for trigrama in self._trigramas_de(nombre):
+            ruts = self._trigramas[trigrama]
+            ruts.discard(st.rut)
+            if not ruts:
+                del self._trigramas[trigrama]
+        self._quitar_ordenado(self._ruts, st.rut)
+        self._quitar_ordenado(self._orden, (nombre, st.rut))
+        for palabra in nombre.split():
+            self._quitar_ordenado(self._palabras, (palabra, st.rut))
+
+    def _por_trigramas(self, consulta: str) -> Set[str]:
+        # Un nombre que contiene la consulta contiene todos sus trigramas
+        conjuntos = sorted((self._trigramas.get(t, set()) for t in self._trigramas_de(consulta)), key=len)
+        candidatos = conjuntos[0].intersection(*conjuntos[1:])
+        return {rut for rut in candidatos if consulta in self._nombres[rut]}
+
+    def _por_palabra(self, prefijo: str) -> Set[str]:
+        """RUTs con alguna palabra del nombre que empieza con prefijo."""
+        i, j = self._rango_prefijo(self._palabras, prefijo)
+        return {rut for _, rut in self._palabras[i:j]}
+
+    def _cortas(self, consulta: str, faltan: int, excluidos: Set[str]) -> List[str]:
+        """Los `faltan` más relevantes para una consulta de 1 o 2 letras (ver buscar)."""
+        # Primero los nombres que empiezan con la consulta: un rango de _orden, ya ordenado
+        i, j = self._rango_prefijo(self._orden, consulta)
+        encontrados = [rut for _, rut in itertools.islice((e for e in self._orden[i:j] if e[1] not in excluidos), faltan)]
+        if len(encontrados) < faltan:
+            # Luego los que tienen otra palabra que empieza con ella (ya están todos los del grupo anterior)
+            vistos = excluidos.union(encontrados)
+            otros = ((self._nombres[rut], rut) for rut in self._por_palabra(consulta) if rut not in vistos)
+            encontrados.extend(rut for _, rut in heapq.nsmallest(faltan - len(encontrados), otros))
+        if len(encontrados) < faltan:
+            # Y solo si aún faltan, la subcadena en medio de una palabra
+            vistos = excluidos.union(encontrados)
+            for nombre, rut in self._orden:
+                if consulta in nombre and rut not in vistos:
+                    encontrados.append(rut)
+                    if len(encontrados) == faltan:
+                        break
+        return encontrados
+
+    def _por_rut(self, prefijo: str, limite: Optional[int] = None) -> List[str]:
+        i, j = self._rango_prefijo(self._ruts, prefijo, tuplas=False)
+        return self._ruts[i:j if limite is None else min(j, i + limite)]
+
+    def buscar(self, consulta: str, limite: Optional[int] = None) -> List[str]:
+        """
+        RUTs que coinciden, ordenados por relevancia: prefijo de RUT o nombre que empieza con
+        la consulta, luego alguna palabra que empieza con ella, luego subcadena; y por nombre.
+        """
+        plegada = plegar_texto(consulta)
+        if not plegada:
+            return []
+        ruts = self._por_rut(re.sub(r'[^0-9kK]', '', consulta).upper(), limite) if any(c.isdigit() for c in consulta) else []
+        if limite is not None and len(plegada) < 3:
+            return ruts + self._cortas(plegada, limite - len(ruts), set(ruts))
+            
+        if len(plegada) < 3:
+            # Sin límite coincide buena parte de los alumnos: una pasada por los nombres ya ordenados
+            candidatos = self._orden
+        else:
+            candidatos = sorted((self._nombres[rut], rut) for rut in self._por_trigramas(plegada))
+        # Tres grupos por relevancia; dentro de cada uno se conserva el orden por nombre
+        palabra = f" {plegada}"
+        excluidos = set(ruts)
+        grupos: Tuple[List[str], List[str], List[str]] = (ruts, [], [])
+        for nombre, rut in candidatos:
+            if plegada in nombre and rut not in excluidos:
+                grupos[0 if nombre.startswith(plegada) else 1 if palabra in nombre else 2].append(rut)
+        ordenados = list(itertools.chain(*grupos))
+        return ordenados[:limite] if limite is not None else ordenados
+
+
+class IndiceAlumnos:
+    """Índice inverso de un usuario: RUT -> códigos de sus cursos y RUT -> ids de las sesiones donde figura (presente o justificado)."""
+    def __init__(self, datos: Dict[str, Any]):
+        self._cursos: Dict[str, Set[str]] = {}
+        self._sesiones: Dict[str, Set[int]] = {}
+        for curso in datos["cursos"].values():
+            self.agregar_curso(curso)
+        for sesion in datos["sesiones"].values():
+            self.agregar_sesion(sesion)
+
+    @staticmethod
+    def _quitar(indice: Dict[str, Set[Any]], rut: str, clave: Any):
+        claves = indice.get(rut)
+        if claves is not None:
+            claves.discard(clave)
+            if not claves:
+                del indice[rut]
+
+    def cursos_de(self, rut: str) -> Set[str]:
+        return set(self._cursos.get(rut, ()))
+
+    def sesiones_de(self, rut: str) -> Set[int]:
+        return set(self._sesiones.get(rut, ()))
+
+    def agregar_curso(self, curso: Curso):
+        for rut in curso.estudiantes_ruts:
+            self._cursos.setdefault(rut, set()).add(curso.codigo)
+
+    def quitar_curso(self, curso: Curso):
+        """Debe llamarse antes de cambiarle el código o los alumnos al curso."""
+        for rut in curso.estudiantes_ruts:
+            self._quitar(self._cursos, rut, curso.codigo)
+
+    def agregar_sesion(self, sesion: Sesion):
+        for rut in sesion.ruts_presentes | sesion.ruts_justificados:
+            self._sesiones.setdefault(rut, set()).add(sesion.id)
+
+    def quitar_sesion(self, sesion: Sesion):
+        """Debe llamarse antes de cambiarle los presentes o justificados a la sesión."""
+        for rut in sesion.ruts_presentes | sesion.ruts_justificados:
+            self._quitar(self._sesiones, rut, sesion.id)
+
+    def quitar_alumno(self, rut: str):
+        self._cursos.pop(rut, None)
+        self._sesiones.pop(rut, None)
+
+    def renombrar_alumno(self, rut_antiguo: str, rut_nuevo: str):
+        for indice in (self._cursos, self._sesiones):
+            claves = indice.pop(rut_antiguo, None)
+            if claves:
+                indice.setdefault(rut_nuevo, set()).update(claves)
+
+
+def inicio_periodo(fecha: datetime, periodo: str) -> date:
+    """Primer día de la semana (lunes) o del mes que contiene la fecha."""
+    dia = fecha.date()
+    return dia - timedelta(days=dia.weekday()) if periodo == "semana" else dia.replace(day=1)
+
+
+class ContadoresAsistencia:
+    """
+    Conteos de asistencia de un usuario: sesiones realizadas por curso y, por (curso, RUT),
+    sesiones en que el alumno estuvo [presente, justificado, presente o justificado].
+    También, por curso y por semana o mes (PERIODOS_RESUMEN), [sesiones, presentes,
+    justificados, presentes o justificados] sumados sobre las sesiones del periodo.
+    Cada sesión suma o resta su aporte (delta) al agregarse o quitarse. Se recuerda qué
+    sesiones están contadas, así agregar dos veces la misma (ej: un índice que se construyó ya
+    con ella) o quitar una que no está no descuadra los conteos.
+    """
+    def __init__(self, sesiones: Iterable[Sesion] = ()):
+        self._sesiones: Dict[str, int] = {}
+        self._contadas: Dict[str, Set[int]] = {} # codigo -> ids de las sesiones contadas
+        self._por_alumno: Dict[str, Dict[str, List[int]]] = {}
+        self._periodos: Dict[str, Dict[str, Dict[date, List[int]]]] = {} # codigo -> periodo -> inicio -> sumas
+        for sesion in sesiones:
+            self.agregar_sesion(sesion)
+
+    def _aplicar(self, sesion: Sesion, delta: int):
+        codigo = sesion.codigo_curso
+        self._sesiones[codigo] = self._sesiones.get(codigo, 0) + delta
+        if not self._sesiones[codigo]:
+            del self._sesiones[codigo]
+        por_alumno = self._por_alumno.setdefault(codigo, {})
+        presentes, justificados = sesion.ruts_presentes, sesion.ruts_justificados
+        asistentes = presentes | justificados
+        for rut in asistentes:
+            conteo = por_alumno.setdefault(rut, [0, 0, 0])
+            conteo[0] += delta if rut in presentes else 0
+            conteo[1] += delta if rut in justificados else 0
+            conteo[2] += delta
+            if not conteo[2]:
+                del por_alumno[rut]
+        if not por_alumno:
+            del self._por_alumno[codigo]
+
+        por_periodo = self._periodos.setdefault(codigo, {})
+        aporte = (delta, delta * len(presentes), delta * len(justificados), delta * len(asistentes))
+        for periodo in PERIODOS_RESUMEN:
+            sumas_periodo = por_periodo.setdefault(periodo, {})
+            inicio = inicio_periodo(sesion.fecha, periodo)
+            sumas = sumas_periodo.setdefault(inicio, [0, 0, 0, 0])
+            for i, valor in enumerate(aporte):
+                sumas[i] += valor
+            if not sumas[0]:
+                del sumas_periodo[inicio]
+        if not any(por_periodo.values()):
+            del self._periodos[codigo]
+
+    def agregar_sesion(self, sesion: Sesion):
+        contadas = self._contadas.setdefault(sesion.codigo_curso, set())
+        if sesion.id in contadas:
+            return
+        contadas.add(sesion.id)
+        self._aplicar(sesion, 1)
+
+    def quitar_sesion(self, sesion: Sesion):
+        """Debe llamarse antes de cambiarle el curso, la fecha, los presentes o los justificados a la sesión."""
+        contadas = self._contadas.get(sesion.codigo_curso)
+        if not contadas or sesion.id not in contadas:
+            return
+        contadas.discard(sesion.id)
+        if not contadas:
+            del self._contadas[sesion.codigo_curso]
+        self._aplicar(sesion, -1)
+
+    def sesiones(self, codigo_curso: str) -> int:
+        return self._sesiones.get(codigo_curso, 0)
+
+    def conteo(self, codigo_curso: str, rut: str) -> Tuple[int, int, int]:
+        """(presente, justificado, presente o justificado) del alumno en el curso."""
+        return tuple(self._por_alumno.get(codigo_curso, {}).get(rut, (0, 0, 0)))
+
+    def tendencia(self, codigo_curso: str, periodo: str) -> List[Tuple[date, int, int, int, int]]:
+        """(inicio, sesiones, presentes, justificados, presentes o justificados) de cada periodo con sesiones, en orden."""
+        sumas_periodo = self._periodos.get(codigo_curso, {}).get(periodo, {})
+        return [(inicio, *sumas_periodo[inicio]) for inicio in sorted(sumas_periodo)]
+
+    def renombrar_curso(self, codigo_antiguo: str, codigo_nuevo: str):
+        for indice in (self._sesiones, self._contadas, self._por_alumno, self._periodos):
+            if codigo_antiguo in indice:
+                indice[codigo_nuevo] = indice.pop(codigo_antiguo)
+
+    def eliminar_curso(self, codigo_curso: str):
+        self._sesiones.pop(codigo_curso, None)
+        self._contadas.pop(codigo_curso, None)
+        self._por_alumno.pop(codigo_curso, None)
+        self._periodos.pop(codigo_curso, None)
+
+    def diferencias(self, otros: "ContadoresAsistencia") -> List[str]:
+        """Describe en qué difieren estos conteos de otros (vacío si coinciden)."""
+        avisos = []
+        for codigo in sorted(self._sesiones.keys() | otros._sesiones.keys()):
+            if self.sesiones(codigo) != otros.sesiones(codigo):
+                avisos.append(f"Curso {codigo}: {self.sesiones(codigo)} sesiones, se esperaban {otros.sesiones(codigo)}.")
+        for codigo in sorted(self._por_alumno.keys() | otros._por_alumno.keys()):
+            ruts = self._por_alumno.get(codigo, {}).keys() | otros._por_alumno.get(codigo, {}).keys()
+            for rut in sorted(ruts):
+                if self.conteo(codigo, rut) != otros.conteo(codigo, rut):
+                    avisos.append(f"Curso {codigo}, RUT {rut}: conteo {self.conteo(codigo, rut)}, se esperaba {otros.conteo(codigo, rut)}.")
+        for codigo in sorted(self._periodos.keys() | otros._periodos.keys()):
+            for periodo in PERIODOS_RESUMEN:
+                if self.tendencia(codigo, periodo) != otros.tendencia(codigo, periodo):
+                    avisos.append(f"Curso {codigo}: resumen por {periodo} {self.tendencia(codigo, periodo)}, se esperaba {otros.tendencia(codigo, periodo)}.")
+        return avisos
+
+
+class RegistroRuts:
+    """
+    Índice global RUT -> roles: usuario que inicia sesión (su user_id) y/o alumno de qué
+    user_ids. A diferencia de los índices por usuario, abarca a todos los usuarios aunque sus
+    datos no estén cargados (con shards se arma desde los resúmenes datos/<user_id>.resumen.json).
+    """
+    def __init__(self):
+        self._usuarios: Dict[str, int] = {}
+        self._alumno_de: Dict[str, Set[int]] = {}
+        self._alumnos_por_usuario: Dict[int, Set[str]] = {}
+
+    def agregar_usuario(self, rut: str, user_id: int):
+        self._usuarios[rut] = user_id
+
+    def quitar_usuario(self, rut: str):
+        self._usuarios.pop(rut, None)
+
+    def agregar_alumno(self, rut: str, user_id: int):
+        self._alumno_de.setdefault(rut, set()).add(user_id)
+        self._alumnos_por_usuario.setdefault(user_id, set()).add(rut)
+
+    def quitar_alumno(self, rut: str, user_id: int):
+        usuarios = self._alumno_de.get(rut)
+        if usuarios is not None:
+            usuarios.discard(user_id)
+            if not usuarios:
+                del self._alumno_de[rut]
+        self._alumnos_por_usuario.get(user_id, set()).discard(rut)
+
+    def definir_alumnos(self, user_id: int, ruts: Iterable[str]):
+        """Reemplaza todos los alumnos registrados de un usuario (carga, rollback o eliminación)."""
+        for rut in list(self._alumnos_por_usuario.pop(user_id, ())):
+            self.quitar_alumno(rut, user_id)
+        for rut in ruts:
+            self.agregar_alumno(rut, user_id)
+
+    def es_usuario(self, rut: str) -> bool:
+        return rut in self._usuarios
+
+    def es_alumno(self, rut: str) -> bool:
+        return rut in self._alumno_de
+
+    def roles(self, rut: str) -> Dict[str, Any]:
+        return {"usuario": self._usuarios.get(rut), "alumno_de": set(self._alumno_de.get(rut, ()))}
+
+
+def base_de_codigo(codigo: str) -> str:
+    """Código del curso base de una sección ("MAT-2" -> "MAT"); un curso sin secciones es su propia base."""
+    return codigo.split('-')[0]
+
+
+class IndiceCodigosBase:
+    """
+    Índice global código base -> {user_id: códigos de sus secciones}. Igual que RegistroRuts,
+    abarca a todos los usuarios aunque sus datos no estén cargados.
+    """
+    def __init__(self):
+        self._por_base: Dict[str, Dict[int, Set[str]]] = {}
+        self._por_usuario: Dict[int, Set[str]] = {}
+
+    def agregar(self, codigo: str, user_id: int):
+        self._por_base.setdefault(base_de_codigo(codigo), {}).setdefault(user_id, set()).add(codigo)
+        self._por_usuario.setdefault(user_id, set()).add(codigo)
+
+    def quitar(self, codigo: str, user_id: int):
+        base = base_de_codigo(codigo)
+        usuarios = self._por_base.get(base, {})
+        codigos = usuarios.get(user_id)
+        if codigos is not None:
+            codigos.discard(codigo)
+            if not codigos:
+                del usuarios[user_id]
+                if not usuarios:
+                    del self._por_base[base]
+        self._por_usuario.get(user_id, set()).discard(codigo)
+
+    def definir_cursos(self, user_id: int, codigos: Iterable[str]):
+        """Reemplaza todos los cursos registrados de un usuario (carga, rollback o eliminación)."""
+        for codigo in list(self._por_usuario.pop(user_id, ())):
+            self.quitar(codigo, user_id)
+        for codigo in codigos:
+            self.agregar(codigo, user_id)
+
+    def usuarios(self, base: str) -> Set[int]:
+        """user_ids que tienen algún curso con este código base."""
+        return set(self._por_base.get(base, ()))
+
+    def secciones(self, base: str, user_id: int) -> Set[str]:
+        """Códigos de los cursos del usuario con este código base."""
+        return set(self._por_base.get(base, {}).get(user_id, ()))
+
+
+class GrupoSecciones:
+    """
+    Secciones de un usuario que comparten código base ("MAT-1", "MAT-2" -> "MAT") y la unión
+    de sus alumnos, RUT -> códigos de las secciones donde está inscrito (normalmente uno solo).
+    """
+    def __init__(self, base: str):
+        self.base = base
+        self.secciones: Dict[str, Curso] = {}
+        self._secciones_de: Dict[str, Set[str]] = {}
+
+    @property
+    def ruts(self) -> Set[str]:
+        """Todos los alumnos inscritos en alguna sección del grupo."""
+        return set(self._secciones_de)
+
+    def codigos(self) -> List[str]:
+        return sorted(self.secciones)
+
+    def agregar_alumno(self, codigo: str, rut: str):
+        self._secciones_de.setdefault(rut, set()).add(codigo)
+
+    def quitar_alumno(self, codigo: str, rut: str):
+        codigos = self._secciones_de.get(rut)
+        if codigos is not None:
+            codigos.discard(codigo)
+            if not codigos:
+                del self._secciones_de[rut]
+
+    def otra_seccion(self, rut: str, codigo: Optional[str] = None) -> Optional[str]:
+        """Una sección del grupo distinta de codigo donde ya está el alumno, o None (en O(1))."""
+        for otra in self._secciones_de.get(rut, ()):
+            if otra != codigo:
+                return otra
+        return None
+
+    def agregar_curso(self, curso: Curso):
+        self.secciones[curso.codigo] = curso
+        for rut in curso.estudiantes_ruts:
+            self.agregar_alumno(curso.codigo, rut)
+
+    def quitar_curso(self, curso: Curso):
+        """Debe llamarse antes de cambiarle el código o los alumnos al curso."""
+        self.secciones.pop(curso.codigo, None)
+        for rut in curso.estudiantes_ruts:
+            self.quitar_alumno(curso.codigo, rut)
+
+
+class IndiceGrupos:
+    """GrupoSecciones de un usuario por código base (un curso sin secciones forma un grupo de uno)."""
+    def __init__(self, cursos: Iterable[Curso]):
+        self._grupos: Dict[str, GrupoSecciones] = {}
+        for curso in cursos:
+            self.agregar_curso(curso)
+
+    def grupo(self, codigo: str) -> Optional[GrupoSecciones]:
+        """Grupo de un curso o sección, por su código o por el código base."""
+        return self._grupos.get(base_de_codigo(codigo))
+
+    def agregar_curso(self, curso: Curso):
+        base = base_de_codigo(curso.codigo)
+        grupo = self._grupos.get(base)
+        if grupo is None:
+            grupo = self._grupos[base] = GrupoSecciones(base)
+        grupo.agregar_curso(curso)
+
+    def quitar_curso(self, curso: Curso):
+        """Debe llamarse antes de cambiarle el código o los alumnos al curso."""
+        grupo = self.grupo(curso.codigo)
+        if grupo is not None:
+            grupo.quitar_curso(curso)
+            if not grupo.secciones:
+                del self._grupos[grupo.base]
+
+
+# --- Análisis vectorizado (requiere NumPy, opcional) ---
+# Cada curso se representa como una matriz alumnos x sesiones de int8 con el estado de cada
+# alumno en cada sesión. Las columnas ocupan espacios en cualquier orden (al quitar una sesión
+# la última pasa a su lugar); el orden por fecha se calcula solo cuando se necesita.
+
+AUSENTE, PRESENTE, JUSTIFICADO = 0, 1, 2
+
+
+class MatrizAsistencia:
+    """Estados de asistencia de los alumnos inscritos en un curso, una columna por sesión."""
+    def __init__(self, estudiantes_ruts: Iterable[str], sesiones: Iterable[Sesion] = ()):
+        if np is None:
+            raise RuntimeError("El análisis vectorizado requiere NumPy (pip install numpy).")
+        self.ruts: List[str] = sorted(estudiantes_ruts)
+        self._fila: Dict[str, int] = {rut: i for i, rut in enumerate(self.ruts)}
+        self._ids: List[int] = [] # id de la sesión de cada columna
+        self._columna: Dict[int, int] = {}
+        self._estados = np.zeros((len(self.ruts), 8), dtype=np.int8)
+        self._fechas = np.zeros(8, dtype=np.float64) # timestamp de cada columna (para ordenar)
+        for sesion in sesiones:
+            self.agregar_sesion(sesion)
+
+    @property
+    def n_sesiones(self) -> int:
+        return len(self._ids)
+
+    def _escribir_columna(self, j: int, sesion: Sesion):
+        columna = np.zeros(len(self.ruts), dtype=np.int8)
+        columna[[self._fila[r] for r in sesion.ruts_justificados if r in self._fila]] = JUSTIFICADO
+        columna[[self._fila[r] for r in sesion.ruts_presentes if r in self._fila]] = PRESENTE
+        self._estados[:, j] = columna
+        self._fechas[j] = sesion.fecha.timestamp()
+
+    def agregar_sesion(self, sesion: Sesion):
+        j = len(self._ids)
+        if j == self._estados.shape[1]:
+            # Capacidad duplicada: agregar sesiones cuesta O(alumnos) amortizado
+            self._estados = np.concatenate([self._estados, np.zeros_like(self._estados)], axis=1)
+            self._fechas = np.concatenate([self._fechas, np.zeros_like(self._fechas)])
+        self._ids.append(sesion.id)
+        self._columna[sesion.id] = j
+        self._escribir_columna(j, sesion)
+
+    def actualizar_sesion(self, sesion: Sesion):
+        """Reescribe la columna de la sesión con sus presentes, justificados y fecha actuales."""
+        self._escribir_columna(self._columna[sesion.id], sesion)
+
+    def quitar_sesion(self, sesion_id: int):
+        j = self._columna.pop(sesion_id)
+        ultima = len(self._ids) - 1
+        if j != ultima:
+            self._estados[:, j] = self._estados[:, ultima]
+            self._fechas[j] = self._fechas[ultima]
+            self._ids[j] = self._ids[ultima]
+            self._columna[self._ids[j]] = j
+        self._ids.pop()
+
+    def renombrar_alumno(self, rut_antiguo: str, rut_nuevo: str):
+        i = self._fila.pop(rut_antiguo)
+        self.ruts[i] = rut_nuevo
+        self._fila[rut_nuevo] = i
+
+    def estados(self, por_fecha: bool = False):
+        """Matriz alumnos x sesiones (vista de las columnas usadas, o copia ordenada por fecha)."""
+        estados = self._estados[:, :self.n_sesiones]
+        if por_fecha:
+            orden = np.lexsort((np.array(self._ids), self._fechas[:self.n_sesiones]))
+            estados = estados[:, orden]
+        return estados
+
+    def ids_sesiones(self, por_fecha: bool = False) -> List[int]:
+        if not por_fecha:
+            return list(self._ids)
+        orden = np.lexsort((np.array(self._ids), self._fechas[:self.n_sesiones]))
+        return [self._ids[j] for j in orden]
+
+    def porcentajes(self) -> Dict[str, float]:
+        """Porcentaje de asistencia (presente o justificado) de cada alumno; 100% si no hay sesiones."""
+        if not self.n_sesiones:
+            return {rut: 100.0 for rut in self.ruts}
+        asistidas = np.count_nonzero(self.estados(), axis=1)
+        return dict(zip(self.ruts, (asistidas / self.n_sesiones * 100.0).tolist()))
+
+    def aprobados(self, min_asistencia: float) -> Dict[str, bool]:
+        return {rut: pct >= min_asistencia for rut, pct in self.porcentajes().items()}
+
+    def asistencia_por_sesion(self) -> Dict[int, Tuple[int, int]]:
+        """sesion_id -> (presentes, justificados) entre los alumnos inscritos."""
+        estados = self.estados()
+        presentes = np.count_nonzero(estados == PRESENTE, axis=0).tolist()
+        justificados = np.count_nonzero(estados == JUSTIFICADO, axis=0).tolist()
+        return {sid: (p, j) for sid, p, j in zip(self._ids, presentes, justificados)}
+
+    def rachas_ausencia(self) -> Dict[str, int]:
+        """Mayor número de sesiones consecutivas (por fecha) sin asistir de cada alumno."""
+        ausente = (self.estados(por_fecha=True) == AUSENTE).astype(np.int8)
+        # Los bordes de cada racha quedan en +1 (inicio) y -1 (fin) de la diferencia
+        bordes = np.diff(np.pad(ausente, ((0, 0), (1, 1))), axis=1)
+        filas, inicios = np.nonzero(bordes == 1)
+        _, fines = np.nonzero(bordes == -1)
+        rachas = np.zeros(len(self.ruts), dtype=np.int64)
+        np.maximum.at(rachas, filas, fines - inicios)
+        return dict(zip(self.ruts, rachas.tolist()))
+
+
+# --- Reporte institucional de alumnos en riesgo ---
+# Recorre a todos los profesores (sin GUI, ver --reporte-riesgo) y lista a los alumnos bajo el
+# mínimo de asistencia de sus cursos abiertos. Cada usuario se calcula en un proceso aparte; con
+# shards, el proceso lee el shard él mismo, así el proceso principal solo escribe el CSV.
+
+COLUMNAS_REPORTE_RIESGO = ["profesor", "codigo_curso", "curso", "rut", "alumno", "sesiones", "asistidas", "porcentaje", "minimo", "faltas_disponibles", "sesiones_para_recuperar"]
+
+
+def faltas_disponibles(asistidas: int, sesiones: int, minimo: float) -> int:
+    """Cuántas inasistencias más admite el alumno sin quedar bajo el mínimo (0 si ya está bajo)."""
+    faltas = max(int(asistidas * 100.0 / minimo) - sesiones, 0)
+    # La estimación se corrige con el mismo cálculo de porcentaje que usa el sistema
+    while faltas > 0 and asistidas / (sesiones + faltas) * 100.0 < minimo:
+        faltas -= 1
+    while asistidas / (sesiones + faltas + 1) * 100.0 >= minimo:
+        faltas += 1
+    return faltas
+
+
+def sesiones_para_recuperar(asistidas: int, sesiones: int, minimo: float) -> Optional[int]:
+    """Sesiones seguidas que el alumno debe asistir para volver al mínimo (None si no es posible: mínimo de 100%)."""
+    if not sesiones or asistidas / sesiones * 100.0 >= minimo:
+        return 0
+    if minimo >= 100.0:
+        return None
+    m = minimo / 100.0
+    n = max(int((m * sesiones - asistidas) / (1 - m)), 1)
+    while (asistidas + n) / (sesiones + n) * 100.0 < minimo:
+        n += 1
+    while n > 1 and (asistidas + n - 1) / (sesiones + n - 1) * 100.0 >= minimo:
+        n -= 1
+    return n
+
+
+def alumnos_en_riesgo(datos: Dict[str, Any], margen: int = 0) -> List[List[Any]]:
+    """
+    Filas del reporte (sin la columna profesor) de los alumnos de los cursos abiertos que están
+    bajo el mínimo o a margen inasistencias o menos de quedar bajo él, ordenadas por curso y nombre.
+    Las sesiones se recorren una sola vez (ver ContadoresAsistencia).
+    """
+    contadores = ContadoresAsistencia(datos["sesiones"].values())
+    estudiantes = datos["estudiantes"]
+    filas = []
+    for codigo in sorted(datos["cursos"]):
+        curso = datos["cursos"][codigo]
+        if curso.cerrado:
+            continue # Su resultado ya es definitivo
+        total = contadores.sesiones(codigo)
+        en_riesgo = []
+        for rut in curso.estudiantes_ruts:
+            asistidas = contadores.conteo(codigo, rut)[2]
+            porcentaje = (asistidas / total) * 100.0 if total else 100.0
+            faltas = faltas_disponibles(asistidas, total, curso.min_asistencia) if porcentaje >= curso.min_asistencia else 0
+            if porcentaje < curso.min_asistencia or faltas < margen:
+                st = estudiantes.get(rut)
+                en_riesgo.append([codigo, curso.nombre, rut, st.nombre if st else "", total, asistidas, round(porcentaje, 1), curso.min_asistencia,
+                                  faltas, sesiones_para_recuperar(asistidas, total, curso.min_asistencia)])
+        en_riesgo.sort(key=itemgetter(3, 2))
+        filas.extend(en_riesgo)
+    return filas
+
+
+def _riesgo_de_usuario(tarea: Tuple[int, Optional[Dict[str, Any]], Optional[Tuple[str, bool]], int]) -> Tuple[int, List[List[Any]]]:
+    """Trabajo de un proceso del reporte: (user_id, datos_usuario_a_dict(datos) o None, (directorio, binarias) del shard, margen)."""
+    user_id, datos, shard, margen = tarea
+    if datos is None:
+        directorio, binarias = shard
+        datos = AlmacenamientoShards(directorio, sincronizar=False, sesiones_binarias=binarias).cargar_datos_usuario(user_id)
+        if datos is None:
+            return user_id, []
+    else:
+        # Las sesiones se reconstruyen en este proceso: sus RUTs van como texto, no como
+        # ordinales de la TABLA_RUTS del proceso principal (vacía con spawn/forkserver)
+        datos = datos_usuario_desde_dict(datos)
+    return user_id, alumnos_en_riesgo(datos, margen)
+
+
+# --- Exportación del historial de asistencia ---
+# Columnas de cada fila de SistemaAsistencia.iterar_asistencia (una por sesión y alumno), en el
+# CSV y como claves del JSON Lines de exportar_asistencia (ver --exportar-asistencia).
+COLUMNAS_EXPORTACION = ["profesor", "codigo_curso", "sesion", "fecha", "rut", "alumno", "estado"]
+
+
 # --- Sistema de Asistencia (Lógica Central) ---
 class SistemaAsistencia:
-    def __init__(self, archivo_datos: str = ARCHIVO_DATOS, archivo_usuarios: str = ARCHIVO_USUARIOS):
+    def __init__(self, archivo_datos: str = ARCHIVO_DATOS, archivo_usuarios: str = ARCHIVO_USUARIOS, usar_journal: bool = False, limite_journal: int = LIMITE_JOURNAL, almacenamiento: Optional[Any] = None, escritura_diferida: Optional[float] = None, progreso_carga: Optional[Callable[[int, int], None]] = None):
         super().__init__()
-        self.archivo_datos = archivo_datos
-        self.archivo_usuarios = archivo_usuarios
+        self._bloqueo = threading.RLock()
+        # progreso_carga(bytes_leidos, bytes_totales): se llama mientras se leen los datos del disco
+        self.progreso_carga = progreso_carga
+        # Por defecto se usan los archivos JSON; se puede pasar un AlmacenamientoSQLite
+        if almacenamiento is None:
+            almacenamiento = AlmacenamientoJSON(archivo_datos, archivo_usuarios, usar_journal, limite_journal)
+        self.almacenamiento = almacenamiento
 
         # usuarios: rut_usuario -> {id, password_hash, salt}
         self.usuarios: Dict[str, Dict[str, Any]] = {} 
         # datos_por_usuario: user_id (int) -> {estudiantes: Dict, cursos: Dict, sesiones: Dict, siguiente_id_sesion: int}
         self.datos_por_usuario: Dict[int, Dict[str, Any]] = {} 
         self.siguiente_id_global = 1 # Para asignar IDs a nuevos usuarios
+        # Transacciones abiertas: user_id -> cambios acumulados hasta el commit
+        self._transacciones: Dict[int, List[Tuple[str, Any]]] = {}
+        self._hilo_transacciones: Optional[int] = None # Hilo que las tiene abiertas (tiene el bloqueo)
+        # Índices en memoria por usuario (ver "Índices en memoria")
+        self._sesiones_por_curso: Dict[int, IndiceSesionesPorCurso] = {}
+        self._nombres: Dict[int, IndiceNombresUsuario] = {}
+        self._alumnos: Dict[int, IndiceAlumnos] = {}
+        self._contadores: Dict[int, ContadoresAsistencia] = {}
+        self._busqueda: Dict[int, IndiceBusqueda] = {}
+        self._grupos: Dict[int, IndiceGrupos] = {}
+        self._matrices: Dict[int, Dict[str, MatrizAsistencia]] = {} # Solo las de cursos ya analizados
+        # Índices globales (abarcan a todos los usuarios): RUTs y códigos base de cursos
+        self._registro_ruts = RegistroRuts()
+        self._codigos_base = IndiceCodigosBase()
 
         self.cargar_todo()
 
+        # **NUEVA FUNCIONALIDAD** - Escritura diferida: escritura_diferida = segundos de espera
+        self.persistencia_diferida: Optional[PersistenciaDiferida] = None
+        if escritura_diferida is not None:
+            self.persistencia_diferida = PersistenciaDiferida(self, escritura_diferida)
+            atexit.register(self.cerrar) # Nada pendiente se pierde al salir del proceso
+
     
     def cargar_todo(self):
         """
         Carga datos de usuarios y datos específicos (cursos/alumnos/sesiones).
         """
         # 1. Carga de usuarios
-        if not os.path.exists(self.archivo_usuarios):
-            self._guardar_usuarios()
-            
-        with open(self.archivo_usuarios, "r", encoding="utf-8") as f:
-            try:
-                self.usuarios = json.load(f)
-                # Calcular el siguiente ID global
-                self.siguiente_id_global = max([u["id"] for u in self.usuarios.values()], default=0) + 1
-            except json.JSONDecodeError:
-                self.usuarios = {}
-                self.siguiente_id_global = 1
+        self.usuarios = self.almacenamiento.cargar_usuarios()
+        # Calcular el siguiente ID global
+        self.siguiente_id_global = max([u["id"] for u in self.usuarios.values()], default=0) + 1
         
         # 2. Carga de datos por usuario (estudiantes, cursos, sesiones)
-        if not os.path.exists(self.archivo_datos):
-            self.datos_por_usuario = {}
+        self.datos_por_usuario = self.almacenamiento.cargar_datos(self.progreso_carga)
+        
+        # 3. Índices globales: con carga perezosa salen del resumen del almacenamiento
+        self._registro_ruts = RegistroRuts()
+        self._codigos_base = IndiceCodigosBase()
+        for rut, u in self.usuarios.items():
+            self._registro_ruts.agregar_usuario(rut, u["id"])
+        if self.almacenamiento.carga_perezosa:
+            for user_id, ruts in self.almacenamiento.resumen_usuarios("alumnos").items():
+                self._registro_ruts.definir_alumnos(user_id, ruts)
+            for user_id, codigos in self.almacenamiento.resumen_usuarios("cursos").items():
+                self._codigos_base.definir_cursos(user_id, codigos)
+        for user_id, datos in self.datos_por_usuario.items():
+            self._indexar_globalmente(user_id, datos)
+
+    @con_bloqueo
+    def cargar_usuario(self, user_id: int) -> Dict[str, Any]:
+        """Carga en memoria los datos de un usuario (se llama al iniciar sesión)."""
+        return self._obtener_datos_usuario(user_id)
+
+    def liberar_usuario(self, user_id: int):
+        """
+        Descarga de memoria los datos de un usuario ya persistidos (se llama al cerrar sesión).
+        Si el guardado falla se lanza el error y los datos se quedan en memoria, igual que si
+        aún tiene cambios por guardar (la memoria es la única copia de esos cambios).
+        """
+        self._exigir_fuera_de_transaccion("liberar_usuario")
+        self.guardar_pendientes()
+        if self.almacenamiento.carga_perezosa:
+            with self._bloqueo:
+                if self.persistencia_diferida and self.persistencia_diferida.tiene_pendientes(user_id):
+                    return # Llegó un cambio mientras se guardaba: se conserva hasta el próximo guardado
+                self.datos_por_usuario.pop(user_id, None)
+                self._invalidar_indices(user_id)
+
+    def guardar_pendientes(self):
+        """Escribe ya todo lo que la escritura diferida tenga pendiente (lanza el error si un guardado falla)."""
+        self._exigir_fuera_de_transaccion("guardar_pendientes")
+        if self.persistencia_diferida:
+            self.persistencia_diferida.guardar_pendientes()
+
+    def estadisticas_guardado(self) -> Dict[str, Any]:
+        """
+        Latencia de guardado y mutaciones agrupadas de la escritura diferida (para ajustar la espera)
+        y entidades recodificadas por guardado (almacenamientos JSON).
+        """
+        estadisticas = self.persistencia_diferida.estadisticas() if self.persistencia_diferida else {}
+        estadisticas.update(getattr(self.almacenamiento, "estadisticas_serializacion", {}))
+        return estadisticas
+
+    def cerrar(self):
+        """Guarda lo pendiente y libera el almacenamiento. Se puede llamar más de una vez."""
+        self._exigir_fuera_de_transaccion("cerrar")
+        if self.persistencia_diferida:
+            self.persistencia_diferida.detener()
+            self.persistencia_diferida = None
+            atexit.unregister(self.cerrar)
+        self.almacenamiento.cerrar()
+
+    def _iterar_datos_todos_usuarios(self):
+        """
+        Recorre (user_id, datos) de todos los usuarios. Con carga perezosa, los usuarios no
+        cargados se leen del disco sin dejarlos en memoria.
+        """
+        yield from list(self.datos_por_usuario.items())
+        if self.almacenamiento.carga_perezosa:
+            for user_id in self.almacenamiento.ids_usuarios():
+                if user_id not in self.datos_por_usuario:
+                    datos = self.almacenamiento.cargar_datos_usuario(user_id)
+                    if datos is not None:
+                        yield user_id, datos
+
+    def _persistir(self, user_id: int, cambios: List[Tuple[str, Any]]):
+        """Persiste lo modificado por un mutador (ver cambios en Almacenamiento)."""
+        # Las entidades modificadas invalidan su JSON cacheado (las eliminadas ya no están)
+        datos = self.datos_por_usuario.get(user_id)
+        if datos is not None:
+            for tipo, clave in dict.fromkeys(cambios):
+                entidad = datos[tipo].get(clave) if tipo in ("estudiantes", "cursos", "sesiones") else None
+                if entidad is not None:
+                    entidad.marcar_modificado()
+        if user_id in self._transacciones:
+            # Dentro de una transacción solo se acumula; se guarda una vez al final
+            self._transacciones[user_id].extend(cambios)
+            return
+        if self.persistencia_diferida:
+            self.persistencia_diferida.marcar(user_id, cambios)
         else:
-            with open(self.archivo_datos, "r", encoding="utf-8") as f:
-                try:
-                    raw_datos = json.load(f)
-                    self.datos_por_usuario = {}
-                    
-                    if isinstance(raw_datos, dict):
-                        for user_id_str, user_data in raw_datos.items():
-                            try:
-                                user_id = int(user_id_str)
-                            except ValueError:
-                                continue 
-                            
-                            # Reconstruir objetos de Estudiante, Curso y Sesion
-                            estudiantes = {st["rut"]: Estudiante.from_dict(st) for st in user_data.get("estudiantes", [])}
-                            cursos = {co["codigo"]: Curso.from_dict(co) for co in user_data.get("cursos", [])}
-                            sesiones = {sess["id"]: Sesion.from_dict(sess) for sess in user_data.get("sesiones", [])}
-                            
-                            self.datos_por_usuario[user_id] = {
-                                "estudiantes": estudiantes,
-                                "cursos": cursos,
-                                "sesiones": sesiones,
-                                "siguiente_id_sesion": user_data.get("siguiente_id_sesion", 1)
-                            }
-                    
-                except json.JSONDecodeError:
-                    self.datos_por_usuario = {}
+            self.almacenamiento.registrar_cambios(self.datos_por_usuario, user_id, list(dict.fromkeys(cambios)))
+
+    @contextlib.contextmanager
+    def transaccion(self, user_id: int):
+        """
+        Agrupa varias mutaciones de un usuario en un solo guardado:
+
+            with sistema.transaccion(user_id):
+                for sesion_id in sesiones:
+                    sistema.editar_sesion(user_id, sesion_id, ...)
+
+        Dentro del bloque los mutadores no persisten; al salir sin errores se guarda una vez
+        con todos los cambios. Si el bloque lanza una excepción, los datos del usuario vuelven
+        al estado del inicio y no se guarda nada. Una transacción anidada se suma a la exterior.
+        Los cambios de login (usuarios.json) no forman parte de la transacción.
+        """
+        with self._bloqueo: # La escritura diferida no puede guardar un estado a medias
+            if user_id in self._transacciones:
+                yield
+                return
+            respaldo = copy.deepcopy(self._obtener_datos_usuario(user_id))
+            cambios = self._transacciones[user_id] = []
+            self._hilo_transacciones = threading.get_ident()
+            try:
+                yield
+            except BaseException:
+                self._restaurar_datos_usuario(user_id, respaldo)
+                raise
+            finally:
+                del self._transacciones[user_id]
+                if not self._transacciones:
+                    self._hilo_transacciones = None
+            if cambios:
+                self._persistir(user_id, cambios)
+
+    def _exigir_fuera_de_transaccion(self, operacion: str):
+        """
+        guardar_pendientes, liberar_usuario, cerrar y reporte_alumnos_en_riesgo esperan a la
+        escritura diferida, que necesita el bloqueo que una transacción abierta en este hilo
+        retiene: llamarlos dentro de transaccion() la dejaría esperando para siempre.
+        """
+        if self._transacciones and self._hilo_transacciones == threading.get_ident():
+            raise RuntimeError(f"{operacion} no se puede llamar dentro de una transacción abierta.")
+
+    def _restaurar_datos_usuario(self, user_id: int, datos: Dict[str, Any]):
+        """Reemplaza los datos en memoria de un usuario (rollback de una transacción)."""
+        actuales = self.datos_por_usuario.get(user_id)
+        if actuales is None:
+            self.datos_por_usuario[user_id] = datos
+        else:
+            # Se conserva el mismo dict para quien ya tenga una referencia a él
+            actuales.clear()
+            actuales.update(datos)
+        self._invalidar_indices(user_id)
+        self._indexar_globalmente(user_id, datos)
+
+    def _indexar_globalmente(self, user_id: int, datos: Dict[str, Any]):
+        """Reemplaza lo que los índices globales saben de un usuario por el contenido de datos."""
+        self._registro_ruts.definir_alumnos(user_id, datos["estudiantes"])
+        self._codigos_base.definir_cursos(user_id, datos["cursos"])
+
+    # --- Índices en memoria ---
+    def _invalidar_indices(self, user_id: int):
+        """Descarta los índices de un usuario; se reconstruyen en la próxima consulta."""
+        self._sesiones_por_curso.pop(user_id, None)
+        self._nombres.pop(user_id, None)
+        self._alumnos.pop(user_id, None)
+        self._contadores.pop(user_id, None)
+        self._busqueda.pop(user_id, None)
+        self._grupos.pop(user_id, None)
+        self._matrices.pop(user_id, None)
+
+    def _indice_sesiones(self, user_id: int) -> IndiceSesionesPorCurso:
+        indice = self._sesiones_por_curso.get(user_id)
+        if indice is None:
+            datos = self._obtener_datos_usuario(user_id)
+            indice = self._sesiones_por_curso[user_id] = IndiceSesionesPorCurso(datos["sesiones"].values())
+        return indice
+
+    def _indice_nombres(self, user_id: int) -> IndiceNombresUsuario:
+        indice = self._nombres.get(user_id)
+        if indice is None:
+            indice = self._nombres[user_id] = IndiceNombresUsuario(self._obtener_datos_usuario(user_id))
+        return indice
+
+    def _indice_alumnos(self, user_id: int) -> IndiceAlumnos:
+        indice = self._alumnos.get(user_id)
+        if indice is None:
+            indice = self._alumnos[user_id] = IndiceAlumnos(self._obtener_datos_usuario(user_id))
+        return indice
+
+    def _indice_grupos(self, user_id: int) -> IndiceGrupos:
+        indice = self._grupos.get(user_id)
+        if indice is None:
+            indice = self._grupos[user_id] = IndiceGrupos(self._obtener_datos_usuario(user_id)["cursos"].values())
+        return indice
+
+    def _indice_busqueda(self, user_id: int) -> IndiceBusqueda:
+        indice = self._busqueda.get(user_id)
+        if indice is None:
+            indice = self._busqueda[user_id] = IndiceBusqueda(self._obtener_datos_usuario(user_id)["estudiantes"].values())
+        return indice
+
+    def _contadores_asistencia(self, user_id: int) -> ContadoresAsistencia:
+        contadores = self._contadores.get(user_id)
+        if contadores is None:
+            datos = self._obtener_datos_usuario(user_id)
+            contadores = self._contadores[user_id] = ContadoresAsistencia(datos["sesiones"].values())
+        return contadores
+
+    def _matriz_existente(self, user_id: int, codigo_curso: str) -> Optional[MatrizAsistencia]:
+        """La matriz del curso si ya se construyó; los mutadores solo mantienen esas."""
+        return self._matrices.get(user_id, {}).get(codigo_curso)
+
+    def _descartar_matriz(self, user_id: int, codigo_curso: str):
+        """Cambió la lista de alumnos del curso: la matriz se reconstruye en la próxima consulta."""
+        self._matrices.get(user_id, {}).pop(codigo_curso, None)
+
+    def verificar_contadores(self, user_id: int) -> List[str]:
+        """
+        Recalcula desde cero los conteos de asistencia del usuario y los compara con los que se
+        mantienen por delta. Retorna las diferencias encontradas (lista vacía si están al día).
+        """
+        with self._bloqueo:
+            datos = self._obtener_datos_usuario(user_id)
+            return self._contadores_asistencia(user_id).diferencias(ContadoresAsistencia(datos["sesiones"].values()))
+
+    def compactar_journal(self):
+        """Vuelca el estado actual al snapshot completo (y vacía el journal, si hay)."""
+        self._guardar_datos()
     
     # --- Métodos de Guardado ---
+    @con_bloqueo
     def _guardar_datos(self):
-        datos_serializables = {}
-        for user_id, data in self.datos_por_usuario.items():
-            datos_serializables[str(user_id)] = { 
-                "estudiantes": [s.to_dict() for s in data["estudiantes"].values()],
-                "cursos": [c.to_dict() for c in data["cursos"].values()],
-                "sesiones": [s.to_dict() for s in data["sesiones"].values()],
-                "siguiente_id_sesion": data["siguiente_id_sesion"]
-            }
-        
-        with open(self.archivo_datos, "w", encoding="utf-8") as f:
-            json.dump(datos_serializables, f, ensure_ascii=False, indent=2)
+        self.almacenamiento.guardar_datos(self.datos_por_usuario)
 
     def _guardar_usuarios(self):
-        with open(self.archivo_usuarios, "w", encoding="utf-8") as f:
-            json.dump(self.usuarios, f, ensure_ascii=False, indent=2)
+        self.almacenamiento.guardar_usuarios(self.usuarios)
     
     def guardar_todo(self):
         self._guardar_datos()
         self._guardar_usuarios()
+
+    @con_bloqueo
+    def exportar_json(self, ruta: str):
+        """Exporta los datos de todos los usuarios en el formato datos.json (sirve con cualquier almacenamiento)."""
+        # Un usuario a la vez: con carga perezosa cada shard se lee, se escribe y se suelta
+        escribir_atomico(ruta, lambda f: escribir_datos_stream(f, _UsuariosEnStream(self._iterar_datos_todos_usuarios())), rotaciones=0)
+    
+    # --- Exportación del historial de asistencia (ver COLUMNAS_EXPORTACION) ---
+    def iterar_asistencia(self, user_id: Optional[int] = None, codigo_curso: Optional[str] = None, desde: Optional[datetime] = None, hasta: Optional[datetime] = None) -> Iterator[Tuple[Any, ...]]:
+        """
+        Genera una fila por (sesión, alumno) con su estado ("presente", "justificado" o "ausente"),
+        ver COLUMNAS_EXPORTACION: de todos los usuarios, de uno (user_id) o de un curso suyo
+        (codigo_curso), opcionalmente solo con desde <= fecha <= hasta. Las filas salen por
+        profesor, curso y fecha y se arman a medida que se piden: con carga perezosa se lee un
+        usuario no cargado a la vez y nunca se arma el resultado completo en memoria.
+        """
+        if codigo_curso is not None and user_id is None:
+            raise ValueError("Para exportar un curso se debe indicar el usuario.")
+        with self._bloqueo:
+            ruts_profesores = {u["id"]: rut for rut, u in self.usuarios.items()}
+            if user_id is not None:
+                datos = self._obtener_datos_usuario(user_id)
+                if codigo_curso is not None and codigo_curso not in datos["cursos"]:
+                    raise ValueError("Curso no encontrado.")
+        usuarios = [(user_id, datos)] if user_id is not None else self._iterar_datos_todos_usuarios()
+        return self._generar_filas_asistencia(usuarios, ruts_profesores, codigo_curso, desde, hasta)
+
+    def _generar_filas_asistencia(self, usuarios: Iterable[Tuple[int, Dict[str, Any]]], ruts_profesores: Dict[int, str], codigo_curso: Optional[str], desde: Optional[datetime], hasta: Optional[datetime]) -> Iterator[Tuple[Any, ...]]:
+        for user_id, datos in usuarios:
+            profesor = ruts_profesores.get(user_id, user_id)
+            with self._bloqueo:
+                # Solo se copian las listas de sesiones de cada curso (no las filas), así el generador
+                # no ve cambios a medias ni retiene el bloqueo entre filas. El índice de un usuario
+                # cargado se usa si ya existe; si no, se arma uno temporal.
+                indice = self._sesiones_por_curso.get(user_id) if self.datos_por_usuario.get(user_id) is datos else None
+                if indice is None:
+                    indice = IndiceSesionesPorCurso(datos["sesiones"].values())
+                codigos = [codigo_curso] if codigo_curso is not None else sorted(datos["cursos"])
+                por_curso = [(datos["cursos"][codigo], indice.rango(codigo, desde, hasta)) for codigo in codigos if codigo in datos["cursos"]]
+            estudiantes = datos["estudiantes"]
+            for curso, sesiones in por_curso:
+                for sesion in sesiones:
+                    presentes, justificados = sesion.ruts_presentes, sesion.ruts_justificados
+                    fecha = sesion.fecha.isoformat()
+                    # También quienes tienen marcas pero ya no están inscritos
+                    for rut in sorted(curso.estudiantes_ruts | presentes | justificados):
+                        estado = "presente" if rut in presentes else "justificado" if rut in justificados else "ausente"
+                        st = estudiantes.get(rut)
+                        yield (profesor, curso.codigo, sesion.id, fecha, rut, st.nombre if st else "", estado)
+
+    def exportar_asistencia(self, ruta: str, formato: str = "csv", user_id: Optional[int] = None, codigo_curso: Optional[str] = None, desde: Optional[datetime] = None, hasta: Optional[datetime] = None) -> int:
+        """
+        Escribe en ruta las filas de iterar_asistencia como CSV (formato="csv") o JSON Lines
+        (formato="jsonl"), una a la vez, así la memoria no depende del tamaño del historial.
+        Retorna la cantidad de filas escritas.
+        """
+        if formato not in ("csv", "jsonl"):
+            raise ValueError("Formato inválido. Opciones: csv, jsonl.")
+        filas = self.iterar_asistencia(user_id, codigo_curso, desde, hasta)
+
+        def escribir(f) -> int:
+            n = 0
+            if formato == "csv":
+                escritor = csv.writer(f, lineterminator="\n")
+                escritor.writerow(COLUMNAS_EXPORTACION)
+                for fila in filas:
+                    escritor.writerow(fila)
+                    n += 1
+            else:
+                for fila in filas:
+                    f.write(json.dumps(dict(zip(COLUMNAS_EXPORTACION, fila)), ensure_ascii=False) + "\n")
+                    n += 1
+            return n
+
+        return escribir_atomico(ruta, escribir, rotaciones=0)
+
+    def reporte_alumnos_en_riesgo(self, ruta: str, procesos: Optional[int] = None, margen: int = 0) -> int:
+        """
+        Escribe en ruta (CSV, ver COLUMNAS_REPORTE_RIESGO) a los alumnos de todos los profesores
+        que están bajo el mínimo de asistencia (o a margen inasistencias o menos), con cuántas
+        faltas más admiten y cuántas sesiones necesitan para recuperarse. Los usuarios se calculan
+        en procesos paralelos (procesos=1: en este mismo proceso) y las filas se escriben a medida
+        que llegan, así la memoria no crece con la institución. Retorna la cantidad de filas.
+        """
+        self._exigir_fuera_de_transaccion("reporte_alumnos_en_riesgo")
+        self.guardar_pendientes()
+        with self._bloqueo:
+            ruts_profesores = {u["id"]: rut for rut, u in self.usuarios.items()}
+            if self.almacenamiento.carga_perezosa:
+                # Todo está guardado: cada proceso lee su shard (nada pasa por este proceso)
+                shard = (self.almacenamiento.directorio, self.almacenamiento.sesiones_binarias)
+                tareas = [(user_id, None, shard, margen) for user_id in sorted(set(self.almacenamiento.ids_usuarios()))]
+            else:
+                tareas = [(user_id, datos_usuario_a_dict(datos), None, margen) for user_id, datos in sorted(self.datos_por_usuario.items())]
+
+        trabajadores = procesos or os.cpu_count() or 1
+
+        def escribir(f) -> int:
+            escritor = csv.writer(f, lineterminator="\n")
+            escritor.writerow(COLUMNAS_REPORTE_RIESGO)
+            n = 0
+            with contextlib.ExitStack() as pila:
+                if trabajadores == 1 or len(tareas) < 2:
+                    resultados = map(_riesgo_de_usuario, tareas)
+                else:
+                    ejecutor = pila.enter_context(concurrent.futures.ProcessPoolExecutor(max_workers=trabajadores))
+                    # Lotes de varios usuarios por envío: menos idas y vueltas entre procesos
+                    resultados = ejecutor.map(_riesgo_de_usuario, tareas, chunksize=max(1, len(tareas) // (trabajadores * 8)))
+                for user_id, filas in resultados:
+                    profesor = ruts_profesores.get(user_id, user_id)
+                    for fila in filas:
+                        escritor.writerow([profesor] + ["" if valor is None else valor for valor in fila])
+                    n += len(filas)
+            return n
+
+        return escribir_atomico(ruta, escribir, rotaciones=0)
     
     # --- Métodos de acceso a datos por usuario ---
     def _obtener_datos_usuario(self, user_id: int) -> Dict[str, Any]:
         """Obtiene y/o inicializa el diccionario de datos para un user_id específico."""
         if user_id not in self.datos_por_usuario:
-             self.datos_por_usuario[user_id] = {
-                "estudiantes": {},
-                "cursos": {},
-                "sesiones": {},
-                "siguiente_id_sesion": 1
-            }
+            with self._bloqueo:
+                datos = None
+                if self.almacenamiento.carga_perezosa:
+                    datos = self.almacenamiento.cargar_datos_usuario(user_id, self.progreso_carga)
+                    if datos is not None:
+                        # El shard manda si su .resumen.json quedó atrasado (ej: corte de luz)
+                        self._indexar_globalmente(user_id, datos)
+                self.datos_por_usuario[user_id] = datos if datos is not None else datos_usuario_vacios()
         return self.datos_por_usuario[user_id]
         
     def _obtener_rut_por_id(self, user_id: int) -> Optional[str]:
@@ -228,6 +2622,7 @@ class SistemaAsistencia:
         return None
 
     # --- Métodos de Usuario (login/registro/configuración) ---
+    @con_bloqueo
     def registrar_usuario(self, rut: str, password: str) -> int:
         
         # 1. Validar y limpiar RUT
@@ -236,13 +2631,12 @@ class SistemaAsistencia:
             
         rut_limpio = re.sub(r'[^0-9kK]', '', rut).upper()
 
-        if rut_limpio in self.usuarios:
+        if self._registro_ruts.es_usuario(rut_limpio):
             raise ValueError("Este RUT ya está registrado para iniciar sesión.")
 
         # 2. Validación: Verificar que el RUT no esté registrado como alumno en NINGÚN usuario.
-        for data in self.datos_por_usuario.values():
-            if rut_limpio in data["estudiantes"]:
-                 raise ValueError("Este RUT está registrado como alumno y no puede ser usado para iniciar sesión.")
+        if self._registro_ruts.es_alumno(rut_limpio):
+            raise ValueError("Este RUT está registrado como alumno y no puede ser usado para iniciar sesión.")
 
         # 3. Validar contraseña
         if " " in password:
@@ -255,6 +2649,7 @@ class SistemaAsistencia:
         
         uid = self.siguiente_id_global
         self.usuarios[rut_limpio] = {"id": uid, "password_hash": password_hash, "salt": salt} # Clave es el RUT
+        self._registro_ruts.agregar_usuario(rut_limpio, uid)
         self.siguiente_id_global += 1
         
         # Inicializar datos vacíos para el nuevo usuario
@@ -263,6 +2658,7 @@ class SistemaAsistencia:
         self._guardar_usuarios()
         return uid # Retorna el ID del nuevo usuario
         
+    @con_bloqueo
     def actualizar_usuario(self, user_id: int, rut_antiguo: str, nuevo_rut: str, nueva_pass: str):
         # El llamador debe asegurar que rut_antiguo y nueva_pass/nuevo_rut son correctos.
         
@@ -275,13 +2671,12 @@ class SistemaAsistencia:
                 raise ValueError("Nuevo RUT inválido.")
             
             # Validación: Que el nuevo RUT no exista como usuario
-            if rut_limpio_nuevo in self.usuarios:
+            if self._registro_ruts.es_usuario(rut_limpio_nuevo):
                 raise ValueError("El nuevo RUT ya está registrado como usuario.")
 
             # Validación: Que el nuevo RUT no exista como alumno en NINGÚN usuario.
-            for data in self.datos_por_usuario.values():
-                if rut_limpio_nuevo in data["estudiantes"]:
-                    raise ValueError("El nuevo RUT está registrado como alumno.")
+            if self._registro_ruts.es_alumno(rut_limpio_nuevo):
+                raise ValueError("El nuevo RUT está registrado como alumno.")
 
         # Validar si la nueva contraseña es diferente y si es válida
         password_hash_nueva, salt_nuevo = hash_password(nueva_pass)
@@ -315,6 +2710,8 @@ class SistemaAsistencia:
                 "password_hash": password_hash_nueva, 
                 "salt": salt_nuevo
             }
+            self._registro_ruts.quitar_usuario(rut_limpio_antiguo)
+            self._registro_ruts.agregar_usuario(rut_limpio_nuevo, user_id)
         else:
             # Si solo cambia la contraseña
             self.usuarios[rut_limpio_nuevo]["password_hash"] = password_hash_nueva
@@ -323,18 +2720,23 @@ class SistemaAsistencia:
         self._guardar_usuarios()
 
 
+    @con_bloqueo
     def eliminar_usuario_y_datos(self, user_id: int, rut: str):
         rut_limpio = re.sub(r'[^0-9kK]', '', rut).upper()
         
         # Eliminar datos (cursos/alumnos/sesiones)
         if user_id in self.datos_por_usuario:
             del self.datos_por_usuario[user_id]
+        self._invalidar_indices(user_id)
+        self._indexar_globalmente(user_id, datos_usuario_vacios())
         
         # Eliminar usuario (login)
         if rut_limpio in self.usuarios:
             del self.usuarios[rut_limpio]
+            self._registro_ruts.quitar_usuario(rut_limpio)
         
-        self.guardar_todo()
+        self._persistir(user_id, [("usuario", None)])
+        self._guardar_usuarios()
 
     def verificar_usuario(self, rut: str, password: str) -> Optional[int]:
         rut_limpio = re.sub(r'[^0-9kK]', '', rut).upper() # Limpia el RUT de entrada
@@ -356,6 +2758,7 @@ class SistemaAsistencia:
             return None 
 
     # --- Métodos de Estudiante (necesitan user_id) ---
+    @con_bloqueo
     def agregar_estudiante(self, user_id: int, nombre: str, rut: str) -> Estudiante:
         datos = self._obtener_datos_usuario(user_id)
         estudiantes = datos["estudiantes"]
@@ -373,18 +2776,24 @@ class SistemaAsistencia:
             raise ValueError("RUT ya existe para este usuario.")
             
         # Validación: Verificar que el RUT no esté registrado como usuario (login)
-        if rut_limpio in self.usuarios:
+        if self._registro_ruts.es_usuario(rut_limpio):
             raise ValueError("Este RUT ya está registrado para iniciar sesión y no puede ser usado como alumno.")
             
         # Validar nombre/apellido único (simplificado: ignorando espacios/mayúsculas/minúsculas)
-        if nombre.lower().strip() in [st.nombre.lower().strip() for st in estudiantes.values()]:
+        nombres = self._indice_nombres(user_id).estudiantes
+        if nombres.claves(nombre):
             raise ValueError("Ya existe un estudiante con este nombre y apellido.")
             
+        busqueda = self._indice_busqueda(user_id) # Se construye antes de agregar al alumno
         st = Estudiante(rut_limpio, nombre) 
         estudiantes[st.rut] = st
-        self._guardar_datos()
+        nombres.agregar(st.nombre, st.rut)
+        busqueda.agregar(st)
+        self._registro_ruts.agregar_alumno(st.rut, user_id)
+        self._persistir(user_id, [("estudiantes", st.rut)])
         return st
         
+    @con_bloqueo
     def actualizar_estudiante(self, user_id: int, rut_antiguo: str, nuevo_nombre: str, nuevo_rut: str) -> Estudiante:
         datos = self._obtener_datos_usuario(user_id)
         estudiantes = datos["estudiantes"]
@@ -408,35 +2817,59 @@ class SistemaAsistencia:
             raise ValueError("Nuevo RUT ya existe para este usuario.")
             
         # Validación: Verificar que el nuevo RUT no esté registrado como usuario (login)
-        if nuevo_rut_limpio != rut_antiguo and nuevo_rut_limpio in self.usuarios:
+        if nuevo_rut_limpio != rut_antiguo and self._registro_ruts.es_usuario(nuevo_rut_limpio):
             raise ValueError("Nuevo RUT ya está registrado para iniciar sesión y no puede ser usado como alumno.")
         
-        if nuevo_nombre.lower().strip() != st.nombre.lower().strip() and nuevo_nombre.lower().strip() in [s.nombre.lower().strip() for s in estudiantes.values() if s.rut != rut_antiguo]:
+        nombres = self._indice_nombres(user_id).estudiantes
+        if normalizar_nombre(nuevo_nombre) != normalizar_nombre(st.nombre) and nombres.claves(nuevo_nombre) - {rut_antiguo}:
             raise ValueError("Ya existe otro estudiante con ese nombre y apellido.")
 
+        busqueda = self._indice_busqueda(user_id)
+        cambios = [("estudiantes", nuevo_rut_limpio)]
+        
         # Si el RUT cambia, se elimina la entrada antigua y se crea la nueva
         if nuevo_rut_limpio != rut_antiguo:
             del estudiantes[rut_antiguo]
-            # Actualiza sesiones
-            for sess in sesiones.values():
-                if rut_antiguo in sess.ruts_presentes:
-                    sess.ruts_presentes.remove(rut_antiguo)
-                    sess.ruts_presentes.add(nuevo_rut_limpio)
-                if rut_antiguo in sess.ruts_justificados:
-                    sess.ruts_justificados.remove(rut_antiguo)
-                    sess.ruts_justificados.add(nuevo_rut_limpio)
-            # Actualiza cursos (lista de estudiantes)
-            for curso in cursos.values():
-                if rut_antiguo in curso.estudiantes_ruts:
-                    curso.estudiantes_ruts.remove(rut_antiguo)
-                    curso.estudiantes_ruts.add(nuevo_rut_limpio)
-        
+            cambios.append(("estudiantes", rut_antiguo))
+            self._registro_ruts.quitar_alumno(rut_antiguo, user_id)
+            self._registro_ruts.agregar_alumno(nuevo_rut_limpio, user_id)
+            # Actualiza solo las sesiones y cursos donde figura el alumno
+            alumnos = self._indice_alumnos(user_id)
+            contadores = self._contadores_asistencia(user_id)
+            grupos = self._indice_grupos(user_id)
+            for sesion_id in alumnos.sesiones_de(rut_antiguo):
+                sess = sesiones[sesion_id]
+                contadores.quitar_sesion(sess)
+                if sess.esta_presente(rut_antiguo):
+                    sess.ruts_presentes = (sess.ruts_presentes - {rut_antiguo}) | {nuevo_rut_limpio}
+                if sess.esta_justificado(rut_antiguo):
+                    sess.ruts_justificados = (sess.ruts_justificados - {rut_antiguo}) | {nuevo_rut_limpio}
+                contadores.agregar_sesion(sess)
+                cambios.append(("sesiones", sess.id))
+            for codigo in alumnos.cursos_de(rut_antiguo):
+                curso = cursos[codigo]
+                curso.estudiantes_ruts.remove(rut_antiguo)
+                curso.estudiantes_ruts.add(nuevo_rut_limpio)
+                grupo = grupos.grupo(codigo)
+                grupo.quitar_alumno(codigo, rut_antiguo)
+                grupo.agregar_alumno(codigo, nuevo_rut_limpio)
+                matriz = self._matriz_existente(user_id, codigo)
+                if matriz:
+                    matriz.renombrar_alumno(rut_antiguo, nuevo_rut_limpio)
+                cambios.append(("cursos", curso.codigo))
+            alumnos.renombrar_alumno(rut_antiguo, nuevo_rut_limpio)
+        
+        nombres.quitar(st.nombre, rut_antiguo)
+        busqueda.quitar(st)
         st.nombre = nuevo_nombre
-        st.rut = nuevo_rut_limpio
+        st.rut = TABLA_RUTS.internar(nuevo_rut_limpio)
         estudiantes[nuevo_rut_limpio] = st
-        self._guardar_datos()
+        nombres.agregar(st.nombre, st.rut)
+        busqueda.agregar(st)
+        self._persistir(user_id, cambios)
         return st
 
+    @con_bloqueo
     def eliminar_estudiante(self, user_id: int, rut: str):
         datos = self._obtener_datos_usuario(user_id)
         estudiantes = datos["estudiantes"]
@@ -446,25 +2879,37 @@ class SistemaAsistencia:
         if rut not in estudiantes:
             raise ValueError("Alumno no encontrado.")
 
+        self._indice_nombres(user_id).estudiantes.quitar(estudiantes[rut].nombre, rut)
+        self._indice_busqueda(user_id).quitar(estudiantes[rut])
         del estudiantes[rut]
-        
-        # Eliminar de sesiones
-        for sess in sesiones.values():
-            if rut in sess.ruts_presentes:
-                sess.ruts_presentes.remove(rut)
-            if rut in sess.ruts_justificados:
-                sess.ruts_justificados.remove(rut)
+        self._registro_ruts.quitar_alumno(rut, user_id)
+        cambios = [("estudiantes", rut)]
+        
+        # Eliminar de las sesiones y cursos donde figura (según el índice inverso)
+        alumnos = self._indice_alumnos(user_id)
+        contadores = self._contadores_asistencia(user_id)
+        for sesion_id in alumnos.sesiones_de(rut):
+            sess = sesiones[sesion_id]
+            contadores.quitar_sesion(sess)
+            sess.ruts_presentes = sess.ruts_presentes - {rut}
+            sess.ruts_justificados = sess.ruts_justificados - {rut}
+            contadores.agregar_sesion(sess)
+            cambios.append(("sesiones", sess.id))
                 
-        # Eliminar de cursos
-        for curso in cursos.values():
-            if rut in curso.estudiantes_ruts:
-                curso.estudiantes_ruts.remove(rut)
+        grupos = self._indice_grupos(user_id)
+        for codigo in alumnos.cursos_de(rut):
+            cursos[codigo].estudiantes_ruts.discard(rut)
+            grupos.grupo(codigo).quitar_alumno(codigo, rut)
+            self._descartar_matriz(user_id, codigo)
+            cambios.append(("cursos", codigo))
+        alumnos.quitar_alumno(rut)
                 
-        self._guardar_datos()
+        self._persistir(user_id, cambios)
     
     # --- Métodos de Curso (necesitan user_id) ---
     
     # **MODIFICADO** para manejar secciones y estudiantes iniciales
+    @con_bloqueo
     def crear_curso(self, user_id: int, codigo_base: str, nombre_base: str, horario: str = "", num_secciones: int = 1, estudiantes_por_seccion: Optional[Dict[str, Set[str]]] = None) -> List[Curso]:
         datos = self._obtener_datos_usuario(user_id)
         cursos = datos["cursos"]
@@ -473,11 +2918,8 @@ class SistemaAsistencia:
              raise ValueError("Código y nombre son obligatorios.")
 
         # Validación: Códigos de curso no repetidos entre usuarios (parte del requerimiento)
-        for other_user_id, other_data in self.datos_por_usuario.items():
-            if other_user_id != user_id:
-                for codigo_existente in other_data["cursos"].keys():
-                    if codigo_base == codigo_existente or codigo_base.split('-')[0] == codigo_existente.split('-')[0]:
-                        raise ValueError("Existe un curso con este código base en otro usuario.")
+        if self._codigos_base.usuarios(base_de_codigo(codigo_base)) - {user_id}:
+            raise ValueError("Existe un curso con este código base en otro usuario.")
 
 
         nuevos_cursos = []
@@ -488,9 +2930,26 @@ class SistemaAsistencia:
             for ruts in estudiantes_por_seccion.values():
                 ruts_totales.update(ruts)
                 
-        if len(ruts_totales) != sum(len(r) for r in estudiantes_por_seccion.values()):
-            # Esto comprueba si hay un RUT en más de una de las listas de secciones
-            raise ValueError("Un estudiante no puede estar asignado a dos secciones del mismo curso base.")
+            if len(ruts_totales) != sum(len(r) for r in estudiantes_por_seccion.values()):
+                # Esto comprueba si hay un RUT en más de una de las listas de secciones
+                raise ValueError("Un estudiante no puede estar asignado a dos secciones del mismo curso base.")
+            
+        # Validación de nombre (solo se comprueba el nombre base para evitar repeticiones de nombres de curso base).
+        # Se hace una vez antes de crear las secciones, para que la sección 2 no choque con la 1 recién creada.
+        nombres = self._indice_nombres(user_id)
+        alumnos = self._indice_alumnos(user_id)
+        grupos = self._indice_grupos(user_id)
+        grupo = grupos.grupo(codigo_base)
+        if grupo is not None:
+            # Tampoco en una sección que el usuario ya tenga con este código base
+            for rut in ruts_totales:
+                otra = grupo.otra_seccion(rut)
+                if otra:
+                    raise ValueError(f"El estudiante con RUT {rut} ya está en la sección {otra}.")
+        if num_secciones == 1 and nombres.cursos.claves(nombre_base):
+            raise ValueError("Ya existe un curso con este nombre.")
+        elif num_secciones > 1 and nombres.bases_seccion.claves(nombre_base):
+            raise ValueError("Ya existe un curso base con este nombre.")
             
         for i in range(1, num_secciones + 1):
             codigo = f"{codigo_base}-{i}" if num_secciones > 1 else codigo_base
@@ -498,27 +2957,23 @@ class SistemaAsistencia:
             
             if codigo in cursos:
                 raise ValueError(f"Código de curso '{codigo}' ya existe.")
-                
-            # Validación de nombre (solo se comprueba el nombre base para evitar repeticiones de nombres de curso base)
-            nombre_check = nombre_base.lower().strip()
-            if num_secciones == 1 and nombre_check in [c.nombre.lower().strip() for c in cursos.values()]:
-                 raise ValueError("Ya existe un curso con este nombre.")
-            elif num_secciones > 1 and nombre_check in [c.nombre.split(' - ')[0].lower().strip() for c in cursos.values() if ' - Sección ' in c.nombre]:
-                raise ValueError("Ya existe un curso base con este nombre.")
-            
 
             ruts_seccion = estudiantes_por_seccion.get(str(i), set()) if estudiantes_por_seccion else set()
             co = Curso(codigo, nombre, horario, list(ruts_seccion))
             cursos[codigo] = co
+            self._codigos_base.agregar(codigo, user_id)
+            nombres.agregar_curso(co)
+            alumnos.agregar_curso(co)
+            grupos.agregar_curso(co)
             nuevos_cursos.append(co)
             
-        self._guardar_datos()
+        self._persistir(user_id, [("cursos", co.codigo) for co in nuevos_cursos])
         return nuevos_cursos
 
+    @con_bloqueo
     def actualizar_curso(self, user_id: int, codigo_antiguo: str, codigo_nuevo: str, nombre: str, horario: str) -> Curso:
         datos = self._obtener_datos_usuario(user_id)
         cursos = datos["cursos"]
-        sesiones = datos["sesiones"]
         
         if not codigo_nuevo or not nombre:
              raise ValueError("Código y nombre son obligatorios.")
@@ -533,33 +2988,62 @@ class SistemaAsistencia:
         if codigo_nuevo != codigo_antiguo and codigo_nuevo in cursos:
             raise ValueError("Nuevo código ya existe.")
             
+        # Validación: el nuevo código base no puede ser de otro usuario (igual que al crear)
+        if self._codigos_base.usuarios(base_de_codigo(codigo_nuevo)) - {user_id}:
+            raise ValueError("Existe un curso con este código base en otro usuario.")
+            
         # Validación de nombre (ignorar si el nombre no cambia o es una sección)
-        is_section = ' - Sección ' in curso_actual.nombre
-        nombre_comparacion = nombre.lower().strip()
+        nombres = self._indice_nombres(user_id)
+        nombre_comparacion = normalizar_nombre(nombre)
         
-        if is_section:
+        if es_seccion(curso_actual):
             # Si es una sección, solo se actualiza la parte de la sección
-            if nombre_comparacion != curso_actual.nombre.lower().strip():
+            if nombre_comparacion != normalizar_nombre(curso_actual.nombre):
                 raise ValueError("No se permite cambiar el nombre del curso base de una sección directamente.")
         else:
             # Si no es sección, validar que no se repita con otros cursos no-sección
-            if nombre_comparacion != curso_actual.nombre.lower().strip() and nombre_comparacion in [c.nombre.lower().strip() for c in cursos.values() if c.codigo != codigo_antiguo and ' - Sección ' not in c.nombre]:
+            if nombre_comparacion != normalizar_nombre(curso_actual.nombre) and any(not es_seccion(cursos[c]) for c in nombres.cursos.claves(nombre) - {codigo_antiguo}):
                 raise ValueError("Ya existe un curso con este nombre.")
 
+        # Si cambia el código base, los alumnos no pueden estar ya en una sección del otro grupo
+        grupos = self._indice_grupos(user_id)
+        grupo_nuevo = grupos.grupo(codigo_nuevo)
+        if grupo_nuevo is not None and grupo_nuevo is not grupos.grupo(codigo_antiguo):
+            for rut in curso_actual.estudiantes_ruts:
+                otra = grupo_nuevo.otra_seccion(rut)
+                if otra:
+                    raise ValueError(f"El estudiante con RUT {rut} ya está en la sección {otra}.")
+
+        alumnos = self._indice_alumnos(user_id)
         co = cursos.pop(codigo_antiguo)
+        nombres.quitar_curso(co)
+        alumnos.quitar_curso(co)
+        grupos.quitar_curso(co)
         co.codigo = codigo_nuevo
         co.nombre = nombre
         co.horario = horario
         cursos[codigo_nuevo] = co
-        
-        # Actualizar código en las sesiones
-        for s in sesiones.values():
-            if s.codigo_curso == codigo_antiguo:
-                s.codigo_curso = codigo_nuevo
+        nombres.agregar_curso(co)
+        alumnos.agregar_curso(co)
+        grupos.agregar_curso(co)
+        self._codigos_base.quitar(codigo_antiguo, user_id)
+        self._codigos_base.agregar(codigo_nuevo, user_id)
+        cambios = [("cursos", codigo_antiguo), ("cursos", codigo_nuevo)]
+        
+        # Actualizar código en las sesiones del curso (sin recorrer las de otros cursos)
+        for s in self._indice_sesiones(user_id).sesiones(codigo_antiguo):
+            s.codigo_curso = codigo_nuevo
+            cambios.append(("sesiones", s.id))
+        self._indice_sesiones(user_id).renombrar_curso(codigo_antiguo, codigo_nuevo)
+        self._contadores_asistencia(user_id).renombrar_curso(codigo_antiguo, codigo_nuevo)
+        matriz = self._matrices.get(user_id, {}).pop(codigo_antiguo, None)
+        if matriz:
+            self._matrices[user_id][codigo_nuevo] = matriz
                 
-        self._guardar_datos()
+        self._persistir(user_id, cambios)
         return co
         
+    @con_bloqueo
     def asignar_estudiantes_a_curso(self, user_id: int, codigo_curso: str, ruts_a_asignar: Set[str]):
         datos = self._obtener_datos_usuario(user_id)
         cursos = datos["cursos"]
@@ -572,19 +3056,56 @@ class SistemaAsistencia:
             raise ValueError("Este curso ya fue cerrado y no se puede editar a los estudiantes.")
         
         # Validar si algún RUT a asignar está en otra sección del mismo curso base
-        curso_base_codigo = codigo_curso.split('-')[0]
-        curso_actual_seccion = codigo_curso.split('-')[1] if len(codigo_curso.split('-')) > 1 else None
-
-        for codigo, curso in cursos.items():
-            if curso.codigo != codigo_curso and curso.codigo.split('-')[0] == curso_base_codigo:
-                # Es otra sección del mismo curso base
-                ruts_en_otra_seccion = curso.estudiantes_ruts.intersection(ruts_a_asignar)
-                if ruts_en_otra_seccion:
-                    raise ValueError(f"El estudiante con RUT {list(ruts_en_otra_seccion)[0]} ya está en la sección {codigo}.")
-        
-        curso_actual.estudiantes_ruts = ruts_a_asignar
-        self._guardar_datos()
-        
+        grupos = self._indice_grupos(user_id)
+        grupo = grupos.grupo(codigo_curso)
+        for rut in ruts_a_asignar:
+            otra = grupo.otra_seccion(rut, codigo_curso)
+            if otra:
+                raise ValueError(f"El estudiante con RUT {rut} ya está en la sección {otra}.")
+        
+        alumnos = self._indice_alumnos(user_id)
+        alumnos.quitar_curso(curso_actual)
+        grupos.quitar_curso(curso_actual)
+        curso_actual.estudiantes_ruts = set(map(TABLA_RUTS.internar, ruts_a_asignar))
+        alumnos.agregar_curso(curso_actual)
+        grupos.agregar_curso(curso_actual)
+        self._descartar_matriz(user_id, codigo_curso)
+        self._persistir(user_id, [("cursos", codigo_curso)])
+        
+    def obtener_otras_secciones(self, user_id: int, codigo_curso: str) -> List[Curso]:
+        """Los demás cursos del usuario con el mismo código base (las otras secciones)."""
+        with self._bloqueo:
+            grupo = self._indice_grupos(user_id).grupo(codigo_curso)
+            if grupo is None:
+                return []
+            return [grupo.secciones[codigo] for codigo in grupo.codigos() if codigo != codigo_curso]
+
+    def comparar_secciones(self, user_id: int, codigo_curso: str) -> List[Dict[str, Any]]:
+        """
+        Estadísticas lado a lado de las secciones del grupo del curso (incluido él mismo), una fila
+        por sección ordenadas por código: alumnos, sesiones, asistencia promedio y alumnos bajo
+        el mínimo. Se calcula con los contadores de asistencia, sin recorrer las sesiones.
+        """
+        with self._bloqueo:
+            grupo = self._indice_grupos(user_id).grupo(codigo_curso)
+            if grupo is None:
+                raise ValueError("Curso no encontrado.")
+            contadores = self._contadores_asistencia(user_id)
+            filas = []
+            for codigo in grupo.codigos():
+                curso = grupo.secciones[codigo]
+                alumnos = [self._fila_asistencia(contadores, curso, rut) for rut in curso.estudiantes_ruts]
+                filas.append({
+                    "codigo": codigo,
+                    "nombre": curso.nombre,
+                    "alumnos": len(alumnos),
+                    "sesiones": contadores.sesiones(codigo),
+                    "promedio": sum(a["porcentaje"] for a in alumnos) / len(alumnos) if alumnos else 0.0,
+                    "bajo_minimo": sum(1 for a in alumnos if not a["aprobado"]),
+                })
+            return filas
+
+    @con_bloqueo
     def cerrar_curso(self, user_id: int, codigo_curso: str):
         datos = self._obtener_datos_usuario(user_id)
         cursos = datos["cursos"]
@@ -596,10 +3117,14 @@ class SistemaAsistencia:
         if curso.cerrado:
             raise ValueError("Este curso ya fue cerrado.")
             
+        nombres = self._indice_nombres(user_id)
+        nombres.quitar_curso(curso)
         curso.cerrado = True
         curso.nombre += " (CERRADO)"
-        self._guardar_datos()
+        nombres.agregar_curso(curso)
+        self._persistir(user_id, [("cursos", codigo_curso)])
         
+    @con_bloqueo
     def definir_min_asistencia(self, user_id: int, codigo_curso: str, min_asistencia: float):
         datos = self._obtener_datos_usuario(user_id)
         cursos = datos["cursos"]
@@ -610,8 +3135,9 @@ class SistemaAsistencia:
             raise ValueError("El mínimo de asistencia debe estar entre 60% y 100%.")
             
         cursos[codigo_curso].min_asistencia = min_asistencia
-        self._guardar_datos()
+        self._persistir(user_id, [("cursos", codigo_curso)])
 
+    @con_bloqueo
     def eliminar_curso(self, user_id: int, codigo: str):
         datos = self._obtener_datos_usuario(user_id)
         cursos = datos["cursos"]
@@ -619,13 +3145,26 @@ class SistemaAsistencia:
         
         if codigo not in cursos:
             raise ValueError("Curso no encontrado.")
+        alumnos = self._indice_alumnos(user_id)
+        self._indice_nombres(user_id).quitar_curso(cursos[codigo])
+        alumnos.quitar_curso(cursos[codigo])
+        self._indice_grupos(user_id).quitar_curso(cursos[codigo])
         del cursos[codigo]
-        datos["sesiones"] = {sid: s for sid, s in sesiones.items() if s.codigo_curso != codigo}
-        self.datos_por_usuario[user_id]["sesiones"] = datos["sesiones"]
-        self._guardar_datos()
+        self._codigos_base.quitar(codigo, user_id)
+        cambios = [("cursos", codigo)]
+        indice = self._indice_sesiones(user_id)
+        for s in indice.sesiones(codigo):
+            alumnos.quitar_sesion(s)
+            del sesiones[s.id]
+            cambios.append(("sesiones", s.id))
+        indice.eliminar_curso(codigo)
+        self._contadores_asistencia(user_id).eliminar_curso(codigo)
+        self._descartar_matriz(user_id, codigo)
+        self._persistir(user_id, cambios)
 
     # --- Métodos de Sesión (necesitan user_id) ---
     
+    @con_bloqueo
     def iniciar_sesion(self, user_id: int, codigo_curso: str) -> Sesion:
         datos = self._obtener_datos_usuario(user_id)
         cursos = datos["cursos"]
@@ -638,13 +3177,22 @@ class SistemaAsistencia:
         if cursos[codigo_curso].cerrado: # **NUEVA FUNCIONALIDAD**
             raise ValueError("Este curso ya fue cerrado y no se pueden crear sesiones.")
             
+        # Los índices se obtienen (o construyen) antes de agregar la sesión, para no contarla dos veces
+        indice = self._indice_sesiones(user_id)
+        contadores = self._contadores_asistencia(user_id)
         sess = Sesion(siguiente_id_sesion, codigo_curso, datetime.now(), []) 
         sesiones[sess.id] = sess
+        indice.agregar(sess)
+        contadores.agregar_sesion(sess)
+        matriz = self._matriz_existente(user_id, codigo_curso)
+        if matriz:
+            matriz.agregar_sesion(sess)
         datos["siguiente_id_sesion"] += 1
-        self._guardar_datos()
+        self._persistir(user_id, [("sesiones", sess.id), ("siguiente_id_sesion", None)])
         return sess
 
     # **MODIFICADO** para incluir justificados
+    @con_bloqueo
     def editar_sesion(self, user_id: int, sesion_id: int, nueva_fecha: Optional[datetime] = None, nuevos_ruts_presentes: Optional[Set[str]] = None, nuevos_ruts_justificados: Optional[Set[str]] = None):
         datos = self._obtener_datos_usuario(user_id)
         estudiantes = datos["estudiantes"]
@@ -661,8 +3209,17 @@ class SistemaAsistencia:
         ruts_validos_globales = set(estudiantes.keys())
         ruts_curso = cursos[sess.codigo_curso].estudiantes_ruts # Solo Ruts asignados al curso
             
+        # Los conteos se restan antes de cambiar la fecha (el resumen por semana/mes depende de ella)
+        alumnos = self._indice_alumnos(user_id)
+        contadores = self._contadores_asistencia(user_id)
+        alumnos.quitar_sesion(sess)
+        contadores.quitar_sesion(sess)
         if nueva_fecha:
+            # La sesión cambia de posición en el orden por fecha de su curso
+            indice = self._indice_sesiones(user_id)
+            indice.quitar(sess)
             sess.fecha = nueva_fecha
+            indice.agregar(sess)
             
         if nuevos_ruts_presentes is not None:
             # Solo permitir presentes si son estudiantes válidos Y están asignados al curso
@@ -671,9 +3228,15 @@ class SistemaAsistencia:
         if nuevos_ruts_justificados is not None:
             # Solo permitir justificados si son estudiantes válidos Y están asignados al curso
             sess.ruts_justificados = ruts_curso.intersection(ruts_validos_globales).intersection(nuevos_ruts_justificados)
+        alumnos.agregar_sesion(sess)
+        contadores.agregar_sesion(sess)
+        matriz = self._matriz_existente(user_id, sess.codigo_curso)
+        if matriz:
+            matriz.actualizar_sesion(sess)
             
-        self._guardar_datos()
+        self._persistir(user_id, [("sesiones", sesion_id)])
 
+    @con_bloqueo
     def eliminar_sesion(self, user_id: int, sesion_id: int):
         datos = self._obtener_datos_usuario(user_id)
         sesiones = datos["sesiones"]
@@ -686,14 +3249,59 @@ class SistemaAsistencia:
         if cursos[sess.codigo_curso].cerrado: # **NUEVA FUNCIONALIDAD**
             raise ValueError("Este curso ya fue cerrado y no se pueden eliminar sesiones.")
             
+        self._indice_sesiones(user_id).quitar(sess)
+        self._indice_alumnos(user_id).quitar_sesion(sess)
+        self._contadores_asistencia(user_id).quitar_sesion(sess)
+        matriz = self._matriz_existente(user_id, sess.codigo_curso)
+        if matriz:
+            matriz.quitar_sesion(sesion_id)
         del sesiones[sesion_id]
-        self._guardar_datos()
+        self._persistir(user_id, [("sesiones", sesion_id)])
+
+    def buscar_alumnos(self, user_id: int, consulta: str, limite: Optional[int] = None) -> List[Estudiante]:
+        """Alumnos cuyo nombre contiene la consulta (sin importar tildes ni mayúsculas) o cuyo RUT empieza con ella, los más relevantes primero."""
+        with self._bloqueo:
+            estudiantes = self._obtener_datos_usuario(user_id)["estudiantes"]
+            return [estudiantes[rut] for rut in self._indice_busqueda(user_id).buscar(consulta, limite)]
+
+    def obtener_cursos_de_alumno(self, user_id: int, rut: str) -> List[Curso]:
+        """Cursos en que está inscrito el alumno, ordenados por código (consulta directa al índice inverso)."""
+        with self._bloqueo:
+            cursos = self._obtener_datos_usuario(user_id)["cursos"]
+            return [cursos[codigo] for codigo in sorted(self._indice_alumnos(user_id).cursos_de(rut))]
 
     def obtener_sesiones_por_curso(self, user_id: int, codigo_curso: str) -> List[Sesion]:
-        datos = self._obtener_datos_usuario(user_id)
-        return [s for s in datos["sesiones"].values() if s.codigo_curso == codigo_curso]
+        """Sesiones del curso ordenadas por fecha, en O(sesiones del curso)."""
+        with self._bloqueo:
+            return self._indice_sesiones(user_id).sesiones(codigo_curso)
+
+    def sesiones_en_rango(self, user_id: int, codigo_curso: str, desde: Optional[datetime] = None, hasta: Optional[datetime] = None, reverso: bool = False) -> Iterator[Sesion]:
+        """
+        Genera las sesiones del curso con desde <= fecha <= hasta (ambos opcionales), ordenadas
+        por fecha (o de la más reciente a la más antigua con reverso=True), en O(log n + k).
+        """
+        with self._bloqueo:
+            # Se copian solo las k sesiones del rango, así el generador no ve cambios posteriores
+            sesiones = self._indice_sesiones(user_id).rango(codigo_curso, desde, hasta)
+        return reversed(sesiones) if reverso else iter(sesiones)
 
 
+    def matriz_asistencia(self, user_id: int, codigo_curso: str) -> MatrizAsistencia:
+        """
+        Matriz alumnos x sesiones del curso para análisis vectorizado (porcentajes, aprobados,
+        asistencia por sesión, rachas de ausencias). Requiere NumPy; se construye la primera vez
+        y luego los mutadores la mantienen al día.
+        """
+        with self._bloqueo:
+            matriz = self._matriz_existente(user_id, codigo_curso)
+            if matriz is None:
+                curso = self._obtener_datos_usuario(user_id)["cursos"].get(codigo_curso)
+                if not curso:
+                    raise ValueError("Curso no encontrado.")
+                matriz = MatrizAsistencia(curso.estudiantes_ruts, self._indice_sesiones(user_id).sesiones(codigo_curso))
+                self._matrices.setdefault(user_id, {})[codigo_curso] = matriz
+            return matriz
+
     def porcentaje_asistencia_por_estudiante(self, user_id: int, codigo_curso: str, rut_estudiante: str) -> float:
         datos = self._obtener_datos_usuario(user_id)
         curso = datos["cursos"].get(codigo_curso)
@@ -702,25 +3310,146 @@ class SistemaAsistencia:
              # Si el curso no existe o el estudiante no está en el curso, el cálculo es 0.0
             return 0.0
 
-        sesiones_usuario = self.obtener_sesiones_por_curso(user_id, codigo_curso)
-        
-        # Filtrar sesiones solo donde el estudiante está asignado.
-        sesiones_relevantes = [s for s in sesiones_usuario if rut_estudiante in curso.estudiantes_ruts]
-        
-        if not sesiones_relevantes:
-            return 100.0 if rut_estudiante in curso.estudiantes_ruts else 0.0
-            
-        # Un estudiante asiste si está en ruts_presentes O si está en ruts_justificados (requerimiento 6)
-        asistido = sum(1 for s in sesiones_relevantes if rut_estudiante in s.ruts_presentes or rut_estudiante in s.ruts_justificados)
-        
-        return (asistido / len(sesiones_relevantes)) * 100.0
+        with self._bloqueo:
+            contadores = self._contadores_asistencia(user_id)
+            total = contadores.sesiones(codigo_curso)
+            if not total:
+                return 100.0
+                
+            # Un estudiante asiste si está en ruts_presentes O si está en ruts_justificados (requerimiento 6)
+            _, _, asistido = contadores.conteo(codigo_curso, rut_estudiante)
+            return (asistido / total) * 100.0
+
+    def tendencia_asistencia(self, user_id: int, codigo_curso: str, periodo: str = "semana") -> List[Dict[str, Any]]:
+        """
+        Asistencia del curso por semana o por mes (ver PERIODOS_RESUMEN), en orden: inicio del
+        periodo, sesiones, presentes, justificados, asistentes promedio por sesión y porcentaje
+        sobre los alumnos inscritos hoy. Sale de los resúmenes que mantienen los contadores, sin
+        recorrer las sesiones.
+        """
+        if periodo not in PERIODOS_RESUMEN:
+            raise ValueError(f"Periodo inválido. Opciones: {', '.join(PERIODOS_RESUMEN)}.")
+        with self._bloqueo:
+            curso = self._obtener_datos_usuario(user_id)["cursos"].get(codigo_curso)
+            if not curso:
+                raise ValueError("Curso no encontrado.")
+            inscritos = len(curso.estudiantes_ruts)
+            filas = []
+            for inicio, sesiones, presentes, justificados, asistentes in self._contadores_asistencia(user_id).tendencia(codigo_curso, periodo):
+                promedio = asistentes / sesiones
+                filas.append({
+                    "inicio": inicio,
+                    "sesiones": sesiones,
+                    "presentes": presentes,
+                    "justificados": justificados,
+                    "promedio_asistentes": promedio,
+                    "porcentaje": promedio / inscritos * 100.0 if inscritos else 0.0,
+                })
+            return filas
+
+    @staticmethod
+    def _fila_asistencia(contadores: ContadoresAsistencia, curso: Curso, rut: str) -> Dict[str, Any]:
+        """Asistencia de un alumno en un curso según los contadores (mismo porcentaje que porcentaje_asistencia_por_estudiante)."""
+        total = contadores.sesiones(curso.codigo)
+        presente, justificado, asistido = contadores.conteo(curso.codigo, rut)
+        porcentaje = (asistido / total) * 100.0 if total else 100.0
+        return {
+            "rut": rut,
+            "presente": presente,
+            "justificado": justificado,
+            "ausente": total - asistido,
+            "sesiones": total,
+            "porcentaje": porcentaje,
+            "aprobado": porcentaje >= curso.min_asistencia,
+        }
+
+    def resumen_asistencia_curso(self, user_id: int, codigo_curso: str) -> List[Dict[str, Any]]:
+        """
+        Asistencia de todos los alumnos inscritos en el curso en una sola llamada, ordenados por
+        nombre: rut, nombre, sesiones presente/justificado/ausente, porcentaje y si aprueba según
+        el mínimo del curso.
+        """
+        with self._bloqueo:
+            datos = self._obtener_datos_usuario(user_id)
+            curso = datos["cursos"].get(codigo_curso)
+            if not curso:
+                raise ValueError("Curso no encontrado.")
+            estudiantes = datos["estudiantes"]
+            contadores = self._contadores_asistencia(user_id)
+            filas = []
+            for rut in curso.estudiantes_ruts:
+                fila = self._fila_asistencia(contadores, curso, rut)
+                st = estudiantes.get(rut)
+                fila["nombre"] = st.nombre if st else ""
+                filas.append(fila)
+        filas.sort(key=itemgetter("nombre", "rut"))
+        return filas
+
+    def resumen_asistencia_alumno(self, user_id: int, rut: str) -> List[Dict[str, Any]]:
+        """
+        Asistencia del alumno en cada curso donde está inscrito, ordenados por código: las mismas
+        cifras que resumen_asistencia_curso más el código, el nombre y si el curso está cerrado.
+        """
+        with self._bloqueo:
+            cursos = self._obtener_datos_usuario(user_id)["cursos"]
+            contadores = self._contadores_asistencia(user_id)
+            filas = []
+            for codigo in sorted(self._indice_alumnos(user_id).cursos_de(rut)):
+                curso = cursos[codigo]
+                fila = self._fila_asistencia(contadores, curso, rut)
+                fila.update(codigo=codigo, nombre=curso.nombre, cerrado=curso.cerrado)
+                filas.append(fila)
+            return filas
 
 
 # --- GUI (Interfaz del customtkinter) ---
+# **NUEVA FUNCIONALIDAD** - Pantalla de carga
+class PantallaCarga:
+    """
+    Callback de progreso para SistemaAsistencia(progreso_carga=...). La ventana solo se crea
+    si el archivo a cargar supera UMBRAL_PANTALLA_CARGA y se cierra sola al terminar.
+    Sin maestro es una ventana propia (antes de crear la app); con maestro, un Toplevel.
+    """
+    def __init__(self, maestro: Optional[Any] = None, umbral: int = UMBRAL_PANTALLA_CARGA):
+        self.maestro = maestro
+        self.umbral = umbral
+        self.ventana = None
+        self.barra = None
+        self.etiqueta = None
+
+    def __call__(self, bytes_leidos: int, bytes_totales: int):
+        if bytes_totales < self.umbral:
+            return
+        if self.ventana is None:
+            self._crear_ventana()
+        self.barra.set(min(bytes_leidos / bytes_totales, 1.0))
+        self.etiqueta.configure(text=f"Cargando datos... {bytes_leidos / 1048576:.1f} de {bytes_totales / 1048576:.1f} MB")
+        self.ventana.update()
+        if bytes_leidos >= bytes_totales:
+            self.cerrar()
+
+    def _crear_ventana(self):
+        self.ventana = ctk.CTk() if self.maestro is None else ctk.CTkToplevel(self.maestro)
+        self.ventana.title("Sistema de Asistencia para Profesores")
+        self.ventana.geometry("480x140")
+        self.etiqueta = ctk.CTkLabel(self.ventana, text="Cargando datos...", font=("Arial", 18))
+        self.etiqueta.pack(padx=20, pady=(25, 10))
+        self.barra = ctk.CTkProgressBar(self.ventana, width=420)
+        self.barra.set(0)
+        self.barra.pack(padx=20, pady=10)
+
+    def cerrar(self):
+        if self.ventana is not None:
+            self.ventana.destroy()
+            self.ventana = None
+
+
 class AppGUI(ctk.CTk):
     def __init__(self, sistema: SistemaAsistencia):
         super().__init__()
         self.sistema = sistema
+        # Los datos que se carguen al iniciar sesión muestran su progreso sobre esta ventana
+        self.sistema.progreso_carga = PantallaCarga(self)
         ctk.set_appearance_mode("White")
         ctk.set_default_color_theme("blue")
         self.title("Sistema de Asistencia para Profesores")
@@ -733,6 +3462,7 @@ class AppGUI(ctk.CTk):
         # Variables de estado para edición
         self.rut_seleccionado_actual: Optional[str] = None
         self.codigo_seleccionado_actual: Optional[str] = None
+        self.ultima_busqueda_alumno = "" # Texto de la última búsqueda de alumnos
         self.curso_base_secciones: Optional[str] = None # Para la creación de cursos con secciones
 
         header = ctk.CTkFrame(self)
@@ -761,6 +3491,9 @@ class AppGUI(ctk.CTk):
         self.contenido = ctk.CTkFrame(self)
         self.contenido.pack(side="top", fill="both", expand=True, padx=10, pady=8)
 
+        # **NUEVA FUNCIONALIDAD** - Guardar lo pendiente antes de cerrar la ventana
+        self.protocol("WM_DELETE_WINDOW", self.al_cerrar_ventana)
+
         self.frame_login = self.construir_frame_login()
         self.frame_cursos = None
         self.frame_alumnos = None
@@ -768,6 +3501,18 @@ class AppGUI(ctk.CTk):
         self.frame_porcentajes = None
 
         self.mostrar_login_frame() 
+        
+        # **NUEVA FUNCIONALIDAD** - Avisar si algún archivo se recuperó desde un snapshot
+        if self.sistema.almacenamiento.avisos:
+            self.after(200, lambda: messagebox.showwarning("Datos recuperados", "\n".join(self.sistema.almacenamiento.avisos)))
+
+    def al_cerrar_ventana(self):
+        try:
+            self.sistema.cerrar()
+        except Exception as e:
+            if not messagebox.askyesno("Error al guardar", f"No se pudieron guardar los últimos cambios ({e}). ¿Cerrar de todas formas y perderlos?"):
+                return
+        self.destroy()
 
     def actualizar_botones_nav(self, estado: str):
         """Actualiza el estado de los botones de navegación (normal o disabled)."""
@@ -889,9 +3634,11 @@ class AppGUI(ctk.CTk):
         # **NUEVA FUNCIONALIDAD** - Búsqueda de alumnos y cursos
         busqueda_frame = ctk.CTkFrame(campos)
         busqueda_frame.pack(pady=10, fill="x")
-        ctk.CTkLabel(busqueda_frame, text="Buscar por Nombre:", font=("Arial", 20)).pack(side="left", padx=10)
+        ctk.CTkLabel(busqueda_frame, text="Buscar por Nombre o RUT:", font=("Arial", 20)).pack(side="left", padx=10)
         self.entrada_busqueda_alumno = ctk.CTkEntry(busqueda_frame, width=250)
         self.entrada_busqueda_alumno.pack(side="left", padx=10)
+        # Búsqueda mientras se escribe (sin el aviso de "no se encontraron")
+        self.entrada_busqueda_alumno.bind("<KeyRelease>", self.al_escribir_busqueda_alumno)
         ctk.CTkButton(busqueda_frame, text="Buscar", command=self.ui_buscar_alumnos, font=("Arial", 22)).pack(side="left", padx=10)
 
 
@@ -974,6 +3721,24 @@ class AppGUI(ctk.CTk):
         self.entrada_min_asistencia = ctk.CTkEntry(mid, width=70, font=("Arial", 22))
         self.entrada_min_asistencia.pack(side="left", padx=10)
         ctk.CTkButton(mid, text="Definir Mínimo", command=self.ui_definir_minimo_asistencia, font=("Arial", 22)).pack(side="left", padx=10)
+        ctk.CTkButton(mid, text="Exportar", command=self.ui_exportar_asistencia, font=("Arial", 22)).pack(side="left", padx=10)
+
+        # Comparación con las demás secciones del mismo curso base (vacía si no tiene secciones)
+        self.etiqueta_secciones = ctk.CTkLabel(frm, text="", font=("Arial", 20), justify="left")
+        self.etiqueta_secciones.pack(anchor="w", padx=20)
+
+        # **NUEVA FUNCIONALIDAD** - Tendencia de asistencia del curso por semana o por mes
+        tendf = ctk.CTkFrame(frm)
+        tendf.pack(side="bottom", fill="x", padx=10, pady=10)
+        cabecera = ctk.CTkFrame(tendf)
+        cabecera.pack(fill="x")
+        ctk.CTkLabel(cabecera, text="Tendencia de Asistencia:", font=("Arial", 25, "bold")).pack(side="left", padx=10)
+        self.combo_periodo_tendencia = ctk.CTkComboBox(cabecera, values=["Semanal", "Mensual"], font=("Arial", 22), command=lambda v: self.dibujar_tendencia())
+        self.combo_periodo_tendencia.set("Semanal")
+        self.combo_periodo_tendencia.pack(side="left", padx=10)
+        self.canvas_tendencia = tk.Canvas(tendf, height=180, bg="white", highlightthickness=0)
+        self.canvas_tendencia.pack(fill="x", padx=10, pady=5)
+        self.canvas_tendencia.bind("<Configure>", lambda e: self.dibujar_tendencia())
 
         listf = ctk.CTkFrame(frm)
         listf.pack(fill="both", expand=True, padx=10, pady=10)
@@ -1121,6 +3886,7 @@ class AppGUI(ctk.CTk):
             rut_limpio_input = re.sub(r'[^0-9kK]', '', rut).upper()
             self.usuario_logueado = rut_limpio_input
             self.user_id = user_id
+            self.sistema.cargar_usuario(user_id) # Carga el shard del usuario (si aplica)
             self.etiqueta_usuario.configure(text=f"RUT: {self.usuario_logueado}") 
             self.actualizar_botones_nav("normal") 
             self.mensaje_login.configure(text="Inicio correcto", text_color="green")
@@ -1132,6 +3898,12 @@ class AppGUI(ctk.CTk):
             self.mensaje_login.configure(text="")
 
     def logout(self):
+        if self.user_id is not None:
+            try:
+                self.sistema.liberar_usuario(self.user_id) # Guarda lo pendiente antes de liberar
+            except Exception as e:
+                messagebox.showerror("Error al guardar", f"No se pudieron guardar los cambios ({e}). La sesión sigue abierta; inténtalo de nuevo.")
+                return
         self.usuario_logueado = None
         self.user_id = None
         messagebox.showinfo("Logout", "Sesión cerrada.")
@@ -1267,8 +4039,8 @@ class AppGUI(ctk.CTk):
         self.codigo_seleccionado_actual = c.codigo
         
         # Limpiar/insertar en los campos (cuidado con secciones para el código/nombre)
-        codigo_mostrar = c.codigo.split('-')[0] if ' - Sección ' in c.nombre else c.codigo
-        nombre_mostrar = c.nombre.split(' - Sección ')[0] if ' - Sección ' in c.nombre else c.nombre
+        codigo_mostrar = base_de_codigo(c.codigo) if es_seccion(c) else c.codigo
+        nombre_mostrar = c.nombre.split(' - Sección ')[0] if es_seccion(c) else c.nombre
         
         self.entrada_codigo_curso.delete(0, "end")
         self.entrada_nombre_curso.delete(0, "end")
@@ -1415,12 +4187,10 @@ class AppGUI(ctk.CTk):
         alumnos_disponibles = sorted([st for st in datos_usuario.get("estudiantes", {}).values()], key=lambda s: s.nombre)
         
         ruts_en_otras_secciones = set()
-        curso_base_codigo = curso.codigo.split('-')[0]
         
         # Encontrar alumnos en otras secciones del mismo curso base
-        for codigo, c in datos_usuario["cursos"].items():
-            if c.codigo != curso.codigo and c.codigo.split('-')[0] == curso_base_codigo:
-                ruts_en_otras_secciones.update(c.estudiantes_ruts)
+        for c in self.sistema.obtener_otras_secciones(self.user_id, curso.codigo):
+            ruts_en_otras_secciones.update(c.estudiantes_ruts)
                 
         var_map = {}
         checkbox_frame = ctk.CTkFrame(top)
@@ -1587,50 +4357,43 @@ class AppGUI(ctk.CTk):
         if not self.verificar_logueo(): return
         self.listbox_cursos_alumno.delete(0, "end")
         
-        datos_usuario = self.sistema._obtener_datos_usuario(self.user_id)
-        cursos = datos_usuario.get("cursos", {})
-        
-        for codigo, curso in sorted(cursos.items()):
-            if rut_estudiante in curso.estudiantes_ruts:
+        for fila in self.sistema.resumen_asistencia_alumno(self.user_id, rut_estudiante):
+            codigo, pct = fila["codigo"], fila["porcentaje"]
+            if fila["cerrado"]:
+                # Determinar Aprobado/Reprobado
+                estado = "APROBADO" if fila["aprobado"] else "REPROBADO"
                 
-                if curso.cerrado:
-                    # Determinar Aprobado/Reprobado
-                    pct = self.sistema.porcentaje_asistencia_por_estudiante(self.user_id, codigo, rut_estudiante)
-                    estado = "APROBADO" if pct >= curso.min_asistencia else "REPROBADO"
-                    color = "green" if estado == "APROBADO" else "red"
-                    
-                    self.listbox_cursos_alumno.insert("end", f"{codigo} - {curso.nombre} | {estado} ({pct:.1f}%)")
-                    # Intento de cambiar color (no es trivial en tk.Listbox, se usará el texto en mayúsculas)
-                else:
-                    # Mostrar porcentaje actual
-                    pct = self.sistema.porcentaje_asistencia_por_estudiante(self.user_id, codigo, rut_estudiante)
-                    self.listbox_cursos_alumno.insert("end", f"{codigo} - {curso.nombre} | Asistencia: {pct:.1f}%")
-                    
-    def ui_buscar_alumnos(self):
+                self.listbox_cursos_alumno.insert("end", f"{codigo} - {fila['nombre']} | {estado} ({pct:.1f}%)")
+                # Intento de cambiar color (no es trivial en tk.Listbox, se usará el texto en mayúsculas)
+            else:
+                # Mostrar porcentaje actual
+                self.listbox_cursos_alumno.insert("end", f"{codigo} - {fila['nombre']} | Asistencia: {pct:.1f}%")
+                
+    def al_escribir_busqueda_alumno(self, evento=None):
+        # Flechas, Shift, Ctrl, etc. también disparan <KeyRelease>: solo se busca si cambió el texto
+        if self.entrada_busqueda_alumno.get().strip() != self.ultima_busqueda_alumno:
+            self.ui_buscar_alumnos(avisar=False, limite=LIMITE_BUSQUEDA)
+
+    def ui_buscar_alumnos(self, avisar: bool = True, limite: Optional[int] = None):
         if not self.verificar_logueo(): return
-        nombre_busqueda = self.entrada_busqueda_alumno.get().strip().lower()
+        busqueda = self.entrada_busqueda_alumno.get().strip()
+        self.ultima_busqueda_alumno = busqueda
         
         self.listbox_alumnos.delete(0, "end")
         self.listbox_cursos_alumno.delete(0, "end")
         self.rut_seleccionado_actual = None
-        
-        datos_usuario = self.sistema._obtener_datos_usuario(self.user_id)
-        alumnos = datos_usuario.get("estudiantes", {})
 
-        if not nombre_busqueda:
+        if not busqueda:
             self.refrescar_lista_alumnos()
             return
         
-        resultados = []
-        for rut, st in alumnos.items():
-            if nombre_busqueda in st.nombre.lower():
-                resultados.append(st)
-                
-        for st in sorted(resultados, key=lambda s: s.nombre):
+        # Ya vienen ordenados por relevancia (ver IndiceBusqueda.buscar)
+        resultados = self.sistema.buscar_alumnos(self.user_id, busqueda, limite)
+        for st in resultados:
              self.listbox_alumnos.insert("end", f"RUT: {st.rut} - {st.nombre}")
              
-        if not resultados:
-            messagebox.showinfo("Búsqueda", "No se encontraron alumnos con ese nombre.")
+        if not resultados and avisar:
+            messagebox.showinfo("Búsqueda", "No se encontraron alumnos con ese nombre o RUT.")
 
     def ui_agregar_alumno(self):
         if not self.verificar_logueo(): return
@@ -1710,11 +4473,11 @@ class AppGUI(ctk.CTk):
             
         # sesiones:
         try:
-            sesiones = self.sistema.obtener_sesiones_por_curso(self.user_id, codigo_curso)
-            for s in sorted(sesiones, key=lambda x: x.fecha, reverse=True):
+            for s in self.sistema.sesiones_en_rango(self.user_id, codigo_curso, reverso=True): # Ya vienen ordenadas
                 # Calcular total de asistentes + justificados (como si fueran 'presentes efectivos')
-                presentes_efectivos = len(s.ruts_presentes.union(s.ruts_justificados))
-                self.listbox_sesiones.insert("end", f"{s.id} - {s.fecha.strftime('%Y-%m-%d %H:%M')} | Presentes Efectivos: {presentes_efectivos} (Justif.: {len(s.ruts_justificados)})") 
+                justificados = s.ruts_justificados # Cada lectura decodifica la sesión: una sola vez por fila
+                presentes_efectivos = len(s.ruts_presentes.union(justificados))
+                self.listbox_sesiones.insert("end", f"{s.id} - {s.fecha.strftime('%Y-%m-%d %H:%M')} | Presentes Efectivos: {presentes_efectivos} (Justif.: {len(justificados)})") 
         except ValueError as e:
             messagebox.showerror("Error", str(e))
 
@@ -1792,8 +4555,8 @@ class AppGUI(ctk.CTk):
         
         for st in alumnos_sesion: 
             # Inicializar con el estado actual
-            esta_presente = 1 if st.rut in sess.ruts_presentes else 0
-            esta_justificado = 1 if st.rut in sess.ruts_justificados else 0
+            esta_presente = 1 if sess.esta_presente(st.rut) else 0
+            esta_justificado = 1 if sess.esta_justificado(st.rut) else 0
             
             var_p = tk.IntVar(value=esta_presente)
             var_j = tk.IntVar(value=esta_justificado)
@@ -1861,6 +4624,8 @@ class AppGUI(ctk.CTk):
         if not self.verificar_logueo(): return
         self.listbox_porcentajes.delete(0, "end")
         self.listbox_historial.delete(0, "end") # Limpiar historial
+        self.etiqueta_secciones.configure(text="")
+        self.dibujar_tendencia()
         
         codigo_curso = self.combo_curso_porcentajes.get()
         if not codigo_curso:
@@ -1875,23 +4640,84 @@ class AppGUI(ctk.CTk):
         self.entrada_min_asistencia.delete(0, "end")
         self.entrada_min_asistencia.insert(0, str(curso.min_asistencia))
         
-        min_asistencia = curso.min_asistencia
-        ruts_curso = curso.estudiantes_ruts
+        secciones = self.sistema.comparar_secciones(self.user_id, codigo_curso)
+        if len(secciones) > 1:
+            self.etiqueta_secciones.configure(text="Secciones: " + "   |   ".join(
+                f"{'▶ ' if s['codigo'] == codigo_curso else ''}{s['codigo']}: {s['promedio']:.1f}% ({s['alumnos']} alumnos, {s['bajo_minimo']} bajo el mínimo)" for s in secciones))
         
-        for rut, st in sorted(datos_usuario.get("estudiantes", {}).items(), key=lambda x: x[1].nombre): 
-            if rut in ruts_curso: # Solo alumnos de este curso
-                pct = self.sistema.porcentaje_asistencia_por_estudiante(self.user_id, codigo_curso, rut) 
-                tag = f"RUT: {rut} - {st.nombre} — {pct:.1f}%"
-                
-                self.listbox_porcentajes.insert("end", tag)
-                
-                # **NUEVA FUNCIONALIDAD** - Marcar en rojo si está por debajo del mínimo
-                if pct < min_asistencia:
-                    # Intento de color en rojo (Listbox de tk tiene tags para esto, pero CTk no las expone fácilmente, así que usamos un color de fondo para el item de tk.Listbox)
-                    idx = self.listbox_porcentajes.size() - 1
-                    self.listbox_porcentajes.itemconfig(idx, {'bg': 'red', 'fg': 'white'})
+        # Solo alumnos de este curso, ya ordenados por nombre y con sus conteos (una sola llamada)
+        for fila in self.sistema.resumen_asistencia_curso(self.user_id, codigo_curso):
+            tag = f"RUT: {fila['rut']} - {fila['nombre']} — {fila['porcentaje']:.1f}% (P {fila['presente']} · J {fila['justificado']} · A {fila['ausente']})"
+            
+            self.listbox_porcentajes.insert("end", tag)
+            
+            # **NUEVA FUNCIONALIDAD** - Marcar en rojo si está por debajo del mínimo
+            if not fila["aprobado"]:
+                # Intento de color en rojo (Listbox de tk tiene tags para esto, pero CTk no las expone fácilmente, así que usamos un color de fondo para el item de tk.Listbox)
+                idx = self.listbox_porcentajes.size() - 1
+                self.listbox_porcentajes.itemconfig(idx, {'bg': 'red', 'fg': 'white'})
 
 
+    def dibujar_tendencia(self):
+        """Gráfico de línea del % de asistencia del curso por semana o mes, con el mínimo del curso en rojo."""
+        lienzo = self.canvas_tendencia
+        lienzo.delete("all")
+        codigo_curso = self.combo_curso_porcentajes.get()
+        if self.user_id is None or not codigo_curso:
+            return
+        periodo = "mes" if self.combo_periodo_tendencia.get() == "Mensual" else "semana"
+        curso = self.sistema._obtener_datos_usuario(self.user_id).get("cursos", {}).get(codigo_curso)
+        if not curso:
+            return
+        filas = self.sistema.tendencia_asistencia(self.user_id, codigo_curso, periodo)
+        
+        ancho, alto = lienzo.winfo_width(), lienzo.winfo_height()
+        izquierda, derecha, arriba, abajo = 60, 20, 15, 25
+        if not filas:
+            lienzo.create_text(ancho / 2, alto / 2, text="Sin sesiones registradas", font=("Arial", 16))
+            return
+        
+        def x(i: int) -> float:
+            fraccion = i / (len(filas) - 1) if len(filas) > 1 else 0.5
+            return izquierda + fraccion * (ancho - izquierda - derecha)
+        
+        def y(pct: float) -> float:
+            return arriba + (100.0 - min(pct, 100.0)) / 100.0 * (alto - arriba - abajo)
+        
+        for pct in (0, 50, 100):
+            lienzo.create_line(izquierda, y(pct), ancho - derecha, y(pct), fill="#dddddd")
+            lienzo.create_text(izquierda - 5, y(pct), text=f"{pct}%", anchor="e", font=("Arial", 12))
+        lienzo.create_line(izquierda, y(curso.min_asistencia), ancho - derecha, y(curso.min_asistencia), fill="red", dash=(4, 2))
+        
+        puntos = [(x(i), y(fila["porcentaje"])) for i, fila in enumerate(filas)]
+        if len(puntos) > 1:
+            lienzo.create_line(*[c for punto in puntos for c in punto], fill="blue", width=2)
+        for px, py in puntos:
+            lienzo.create_oval(px - 3, py - 3, px + 3, py + 3, fill="blue", outline="")
+        # Inicio del primer y del último periodo
+        lienzo.create_text(x(0), alto - 5, text=filas[0]["inicio"].strftime("%d/%m/%Y"), anchor="sw", font=("Arial", 12))
+        if len(filas) > 1:
+            lienzo.create_text(x(len(filas) - 1), alto - 5, text=filas[-1]["inicio"].strftime("%d/%m/%Y"), anchor="se", font=("Arial", 12))
+
+    def ui_exportar_asistencia(self):
+        """Exporta el historial de asistencia del curso seleccionado (o de todos los cursos del usuario) a CSV o JSON Lines."""
+        if not self.verificar_logueo(): return
+        codigo_curso = self.combo_curso_porcentajes.get() or None
+        ruta = filedialog.asksaveasfilename(
+            title="Exportar asistencia",
+            initialfile=f"asistencia_{codigo_curso or 'todos'}.csv",
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl")],
+        )
+        if not ruta:
+            return
+        formato = "jsonl" if ruta.lower().endswith(".jsonl") else "csv"
+        try:
+            filas = self.sistema.exportar_asistencia(ruta, formato, user_id=self.user_id, codigo_curso=codigo_curso)
+            messagebox.showinfo("Éxito", f"{filas} registros de asistencia exportados en {os.path.basename(ruta)}.")
+        except (ValueError, OSError) as e:
+            messagebox.showerror("Error", str(e))
+
     def ui_definir_minimo_asistencia(self):
         if not self.verificar_logueo(): return
         codigo_curso = self.combo_curso_porcentajes.get()
@@ -1925,19 +4751,18 @@ class AppGUI(ctk.CTk):
         
         if not codigo_curso: return
         
-        sesiones = self.sistema.obtener_sesiones_por_curso(self.user_id, codigo_curso)
         datos_usuario = self.sistema._obtener_datos_usuario(self.user_id)
         curso = datos_usuario.get("cursos", {}).get(codigo_curso)
         
         if rut_estudiante not in curso.estudiantes_ruts: return # No mostrar historial si no pertenece al curso
 
-        for s in sorted(sesiones, key=lambda x: x.fecha):
+        for s in self.sistema.sesiones_en_rango(self.user_id, codigo_curso): # Ya vienen ordenadas por fecha
             estado = "NO APLICA"
             tag = {}
-            if rut_estudiante in s.ruts_presentes:
+            if s.esta_presente(rut_estudiante):
                 estado = "PRESENTE"
                 tag = {'bg': 'green', 'fg': 'white'}
-            elif rut_estudiante in s.ruts_justificados:
+            elif s.esta_justificado(rut_estudiante):
                 estado = "JUSTIFICADA"
                 tag = {'bg': 'blue', 'fg': 'white'}
             else:
@@ -1975,17 +4800,17 @@ class AppGUI(ctk.CTk):
         datos_usuario = self.sistema._obtener_datos_usuario(self.user_id)
         sess = datos_usuario["sesiones"].get(sess_id)
         
-        if rut_estudiante in sess.ruts_presentes:
+        if sess.esta_presente(rut_estudiante):
             messagebox.showwarning("Ya Presente", "El alumno ya está marcado como presente. No se puede justificar.")
             return
             
-        if rut_estudiante in sess.ruts_justificados:
+        if sess.esta_justificado(rut_estudiante):
             messagebox.showwarning("Ya Justificado", "El alumno ya está justificado en esta sesión.")
             return
         
         # Actualizar la sesión: quitar de presentes (si estuviera) y añadir a justificados
-        nuevos_ruts_presentes = sess.ruts_presentes.copy()
-        nuevos_ruts_justificados = sess.ruts_justificados.copy()
+        nuevos_ruts_presentes = sess.ruts_presentes # Ya son sets nuevos: no hace falta copiarlos
+        nuevos_ruts_justificados = sess.ruts_justificados
         
         if rut_estudiante in nuevos_ruts_presentes:
             nuevos_ruts_presentes.remove(rut_estudiante)
@@ -2009,12 +4834,12 @@ class AppGUI(ctk.CTk):
         datos_usuario = self.sistema._obtener_datos_usuario(self.user_id)
         sess = datos_usuario["sesiones"].get(sess_id)
         
-        if rut_estudiante not in sess.ruts_justificados:
+        if not sess.esta_justificado(rut_estudiante):
             messagebox.showwarning("No Justificado", "El alumno no tiene una inasistencia justificada en esta sesión.")
             return
 
         # Quitar de justificados (y no agregar a presentes para que quede como inasistente 'duro')
-        nuevos_ruts_justificados = sess.ruts_justificados.copy()
+        nuevos_ruts_justificados = sess.ruts_justificados # Set nuevo (ver Sesion)
         nuevos_ruts_justificados.remove(rut_estudiante)
         
         try:
@@ -2027,7 +4852,63 @@ class AppGUI(ctk.CTk):
 
 
 def main():
-    sistema = SistemaAsistencia()
+    parser = argparse.ArgumentParser(description="Sistema de Asistencia para Profesores")
+    parser.add_argument("--sqlite", metavar="ARCHIVO", help="Usar una base SQLite en vez de los archivos JSON")
+    parser.add_argument("--monolitico", action="store_true", help="Usar un solo datos.json (con journal) en vez de un archivo por usuario")
+    parser.add_argument("--importar-sqlite", metavar="ARCHIVO", help="Importar datos.json/usuarios.json a una base SQLite y salir")
+    parser.add_argument("--sesiones-binarias", action="store_true", help="Guardar las sesiones de cada shard en formato binario compacto")
+    parser.add_argument("--exportar-json", metavar="ARCHIVO", help="Exportar todos los datos en formato datos.json y salir")
+    parser.add_argument("--reporte-riesgo", metavar="ARCHIVO", help="Escribir en un CSV los alumnos bajo el mínimo de asistencia de todos los profesores y salir (sin GUI)")
+    parser.add_argument("--margen", type=int, default=0, help="Con --reporte-riesgo, incluir también a quienes les quedan menos de N faltas disponibles")
+    parser.add_argument("--procesos", type=int, default=None, help="Con --reporte-riesgo, procesos en paralelo (por defecto uno por CPU)")
+    parser.add_argument("--exportar-asistencia", metavar="ARCHIVO", help="Exportar el historial de asistencia de todos los profesores (CSV, o JSON Lines si termina en .jsonl) y salir")
+    parser.add_argument("--desde", type=date.fromisoformat, help="Con --exportar-asistencia, primera fecha (AAAA-MM-DD)")
+    parser.add_argument("--hasta", type=date.fromisoformat, help="Con --exportar-asistencia, última fecha (AAAA-MM-DD, inclusive)")
+    args = parser.parse_args()
+    
+    if args.importar_sqlite:
+        importar_json_a_sqlite(args.importar_sqlite)
+        print(f"Datos importados en {args.importar_sqlite}")
+        return
+        
+    if args.reporte_riesgo or args.exportar_asistencia:
+        # Sin ventanas ni escritura diferida: el reporte y la exportación solo leen
+        if args.sqlite:
+            almacenamiento = AlmacenamientoSQLite(args.sqlite)
+        elif args.monolitico:
+            almacenamiento = AlmacenamientoJSON(usar_journal=True)
+        else:
+            almacenamiento = AlmacenamientoShards(sesiones_binarias=args.sesiones_binarias)
+        sistema = SistemaAsistencia(almacenamiento=almacenamiento)
+        if args.reporte_riesgo:
+            filas = sistema.reporte_alumnos_en_riesgo(args.reporte_riesgo, procesos=args.procesos, margen=args.margen)
+            print(f"{filas} alumnos en riesgo exportados en {args.reporte_riesgo}")
+        if args.exportar_asistencia:
+            desde = datetime.combine(args.desde, datetime.min.time()) if args.desde else None
+            hasta = datetime.combine(args.hasta, datetime.max.time()) if args.hasta else None
+            formato = "jsonl" if args.exportar_asistencia.lower().endswith(".jsonl") else "csv"
+            filas = sistema.exportar_asistencia(args.exportar_asistencia, formato, desde=desde, hasta=hasta)
+            print(f"{filas} registros de asistencia exportados en {args.exportar_asistencia}")
+        sistema.cerrar()
+        return
+        
+    # Los clics de la GUI no esperan al disco: se guarda en segundo plano
+    pantalla_carga = PantallaCarga()
+    if args.sqlite:
+        sistema = SistemaAsistencia(almacenamiento=AlmacenamientoSQLite(args.sqlite), escritura_diferida=ESPERA_ESCRITURA)
+    elif args.monolitico:
+        sistema = SistemaAsistencia(usar_journal=True, escritura_diferida=ESPERA_ESCRITURA, progreso_carga=pantalla_carga)
+    else:
+        # Por defecto un archivo por usuario; un datos.json existente se migra la primera vez
+        almacenamiento = AlmacenamientoShards(sesiones_binarias=args.sesiones_binarias)
+        sistema = SistemaAsistencia(almacenamiento=almacenamiento, escritura_diferida=ESPERA_ESCRITURA, progreso_carga=pantalla_carga)
+    pantalla_carga.cerrar()
+    
+    if args.exportar_json:
+        sistema.exportar_json(args.exportar_json)
+        sistema.cerrar()
+        print(f"Datos exportados en {args.exportar_json}")
+        return
     app = AppGUI(sistema)
     app.mainloop()
 
@@ -0,0 +1,882 @@
+"""
+Benchmarks de rendimiento del Sistema de Asistencia (Prototipo V1.5).
+
+Uso:
+    python benchmark_asistencia.py              # corre todos los benchmarks
+    python benchmark_asistencia.py journal      # corre solo los indicados
+
+Cada benchmark genera datos sintéticos en una carpeta temporal, así que nunca toca
+los datos.json / usuarios.json reales.
+"""
+import importlib.util
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+RUTA_PROTOTIPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Prototipo V1.5.py")
+
+
+def cargar_prototipo():
+    # El nombre del archivo tiene espacios, así que no se puede usar un import normal
+    spec = importlib.util.spec_from_file_location("prototipo", RUTA_PROTOTIPO)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules["prototipo"] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def rut_sintetico(n: int) -> str:
+    # 8 dígitos (nunca todos iguales) + verificador; válido según validar_rut
+    return f"{10_000_000 + n}{'0123456789K'[n % 11]}"
+
+
+def poblar(proto, sistema, n_usuarios: int, alumnos: int, cursos: int, sesiones_por_curso: int, semilla: int = 1):
+    """
+    Llena el sistema directamente (sin pasar por los validadores, que son cuadráticos)
+    y guarda un snapshot. Retorna la lista de user_id creados.
+    """
+    rnd = random.Random(semilla)
+    password_hash, salt = proto.hash_password("benchmark")
+    contador_rut = 0
+    uids = []
+    inicio = datetime(2025, 3, 3, 8, 30)
+    
+    for _ in range(n_usuarios):
+        uid = sistema.siguiente_id_global
+        sistema.siguiente_id_global += 1
+        sistema.usuarios[rut_sintetico(50_000_000 + uid)] = {"id": uid, "password_hash": password_hash, "salt": salt}
+        datos = sistema._obtener_datos_usuario(uid)
+        
+        ruts = []
+        for i in range(alumnos):
+            rut = rut_sintetico(contador_rut)
+            contador_rut += 1
+            datos["estudiantes"][rut] = proto.Estudiante(rut, f"Alumno {uid}-{i}")
+            ruts.append(rut)
+            
+        for c in range(cursos):
+            codigo = f"U{uid}C{c}"
+            datos["cursos"][codigo] = proto.Curso(codigo, f"Curso {uid}-{c}", "L 10:00", ruts)
+            for k in range(sesiones_por_curso):
+                sid = datos["siguiente_id_sesion"]
+                datos["siguiente_id_sesion"] += 1
+                presentes = {r for r in ruts if rnd.random() < 0.8}
+                justificados = [r for r in ruts if r not in presentes and rnd.random() < 0.5]
+                datos["sesiones"][sid] = proto.Sesion(sid, codigo, inicio + timedelta(days=7 * k), presentes, justificados)
+        uids.append(uid)
+        
+    sistema.guardar_todo()
+    return uids
+
+
+def carpeta_temporal() -> str:
+    carpeta = tempfile.mkdtemp(prefix="bench_asistencia_")
+    os.chdir(carpeta)
+    return carpeta
+
+
+def tamano_mb(ruta: str) -> float:
+    return os.path.getsize(ruta) / (1024 * 1024) if os.path.exists(ruta) else 0.0
+
+
+# --- Benchmarks ---
+
+def bench_journal(proto):
+    """Costo de guardar una mutación (editar_sesion) con snapshot completo vs journal."""
+    print("== Journal: costo de guardado por mutación ==")
+    print(f"{'sesiones':>10} {'datos.json':>11} {'snapshot ms/op':>15} {'journal ms/op':>14}")
+    mutaciones = 50
+    for n_usuarios in (5, 50, 200):
+        resultados = {}
+        for usar_journal in (False, True):
+            carpeta_temporal()
+            sistema = proto.SistemaAsistencia(usar_journal=usar_journal, limite_journal=10 * mutaciones)
+            uids = poblar(proto, sistema, n_usuarios, alumnos=30, cursos=4, sesiones_por_curso=25)
+            sesion_ids = list(sistema.datos_por_usuario[uids[0]]["sesiones"].keys())
+            ruts = list(sistema.datos_por_usuario[uids[0]]["estudiantes"].keys())
+            
+            t0 = time.perf_counter()
+            for i in range(mutaciones):
+                sistema.editar_sesion(uids[0], sesion_ids[i % len(sesion_ids)], nuevos_ruts_presentes=set(ruts[: i % len(ruts)]))
+            resultados[usar_journal] = (time.perf_counter() - t0) / mutaciones * 1000
+            
+        total_sesiones = n_usuarios * 4 * 25
+        print(f"{total_sesiones:>10} {tamano_mb(proto.ARCHIVO_DATOS):>9.1f}MB {resultados[False]:>15.2f} {resultados[True]:>14.3f}")
+
+
+def bench_shards(proto):
+    """Tiempo de arranque + login: un datos.json para todos vs un shard por usuario."""
+    print("== Shards: arranque y login de un profesor ==")
+    print(f"{'usuarios':>9} {'monolítico ms':>14} {'shards ms':>10} {'objetos cargados (mono/shards)':>32}")
+    for n_usuarios in (10, 100, 300):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia()
+        uids = poblar(proto, sistema, n_usuarios, alumnos=30, cursos=4, sesiones_por_curso=25)
+        
+        t0 = time.perf_counter()
+        mono = proto.SistemaAsistencia()
+        mono.cargar_usuario(uids[0])
+        t_mono = (time.perf_counter() - t0) * 1000
+        
+        proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoShards()) # Migración (no se mide)
+        t0 = time.perf_counter()
+        shards = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoShards())
+        shards.cargar_usuario(uids[0])
+        t_shards = (time.perf_counter() - t0) * 1000
+        
+        def contar(s):
+            return sum(len(d["estudiantes"]) + len(d["cursos"]) + len(d["sesiones"]) for d in s.datos_por_usuario.values())
+        print(f"{n_usuarios:>9} {t_mono:>14.1f} {t_shards:>10.1f} {contar(mono):>20}/{contar(shards)}")
+
+
+def bench_atomico(proto):
+    """Guardados repetidos: escritura directa original vs atómica (temporal + fsync + rename + rotación)."""
+    print("== Guardado atómico bajo carga de escritura ==")
+    import json
+    
+    def guardar_original(datos_por_usuario, ruta):
+        # Copia del _guardar_datos original: abre el archivo vivo en modo "w"
+        datos_serializables = {str(uid): proto.datos_usuario_a_dict(d) for uid, d in datos_por_usuario.items()}
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(datos_serializables, f, ensure_ascii=False, indent=2)
+    
+    guardados = 40
+    print(f"{'sesiones':>10} {'original ms':>12} {'atómico ms':>11} {'atómico sin fsync ms':>21}")
+    for n_usuarios in (5, 50):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia()
+        poblar(proto, sistema, n_usuarios, alumnos=30, cursos=4, sesiones_por_curso=25)
+        
+        t0 = time.perf_counter()
+        for _ in range(guardados):
+            guardar_original(sistema.datos_por_usuario, "original.json")
+        t_original = (time.perf_counter() - t0) / guardados * 1000
+        
+        tiempos = []
+        for sincronizar in (True, False):
+            almacenamiento = proto.AlmacenamientoJSON("atomico.json", proto.ARCHIVO_USUARIOS, sincronizar=sincronizar)
+            t0 = time.perf_counter()
+            for _ in range(guardados):
+                almacenamiento.guardar_datos(sistema.datos_por_usuario)
+            tiempos.append((time.perf_counter() - t0) / guardados * 1000)
+            
+        print(f"{n_usuarios * 100:>10} {t_original:>12.2f} {tiempos[0]:>11.2f} {tiempos[1]:>21.2f}")
+
+
+def bench_stream(proto):
+    """Memoria pico durante un guardado: dict completo + json.dump vs escritura en streaming."""
+    print("== Serializador en streaming: memoria pico del guardado ==")
+    import json
+    import tracemalloc
+    
+    def guardar_original(datos_por_usuario, ruta):
+        datos_serializables = {str(uid): proto.datos_usuario_a_dict(d) for uid, d in datos_por_usuario.items()}
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(datos_serializables, f, ensure_ascii=False, indent=2)
+    
+    def medir(fn):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        fn()
+        duracion = (time.perf_counter() - t0) * 1000
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return pico / (1024 * 1024), duracion
+    
+    print(f"{'sesiones':>10} {'original MB / ms':>18} {'stream MB / ms':>16} {'compacto MB / ms':>18}")
+    for n_usuarios in (5, 50, 200):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia()
+        poblar(proto, sistema, n_usuarios, alumnos=30, cursos=4, sesiones_por_curso=25)
+        normal = proto.AlmacenamientoJSON("stream.json", proto.ARCHIVO_USUARIOS, sincronizar=False)
+        compacto = proto.AlmacenamientoJSON("compacto.json", proto.ARCHIVO_USUARIOS, sincronizar=False, compacto=True)
+        
+        resultados = [
+            medir(lambda: guardar_original(sistema.datos_por_usuario, "original.json")),
+            medir(lambda: normal.guardar_datos(sistema.datos_por_usuario)),
+            medir(lambda: compacto.guardar_datos(sistema.datos_por_usuario)),
+        ]
+        celdas = " ".join(f"{f'{mb:.2f} / {ms:.0f}':>17}" for mb, ms in resultados)
+        print(f"{n_usuarios * 100:>10} {celdas}")
+
+
+def bench_fragmentos(proto):
+    """Guardado completo tras editar una sesión: todo recodificado vs fragmentos JSON cacheados."""
+    print("== Fragmentos cacheados: guardado completo tras una mutación ==")
+    print(f"{'sesiones':>10} {'sin cache ms/op':>16} {'con cache ms/op':>16} {'recodificadas/op':>17}")
+    mutaciones = 20
+    for n_usuarios in (5, 50, 200):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia()
+        uids = poblar(proto, sistema, n_usuarios, alumnos=30, cursos=4, sesiones_por_curso=25)
+        sesion_ids = list(sistema.datos_por_usuario[uids[0]]["sesiones"].keys())
+        ruts = list(sistema.datos_por_usuario[uids[0]]["estudiantes"].keys())
+        
+        def invalidar_todo():
+            # Simula el guardado original, que llamaba to_dict() en todas las entidades
+            for datos in sistema.datos_por_usuario.values():
+                for clave in ("estudiantes", "cursos", "sesiones"):
+                    for entidad in datos[clave].values():
+                        entidad.marcar_modificado()
+        
+        tiempos = []
+        for con_cache in (False, True):
+            t0 = time.perf_counter()
+            for i in range(mutaciones):
+                if not con_cache:
+                    invalidar_todo()
+                sistema.editar_sesion(uids[0], sesion_ids[i % len(sesion_ids)], nuevos_ruts_presentes=set(ruts[: i % len(ruts)]))
+            tiempos.append((time.perf_counter() - t0) / mutaciones * 1000)
+        recodificadas = sistema.estadisticas_guardado()["recodificadas_ultimo"]
+        print(f"{n_usuarios * 100:>10} {tiempos[0]:>16.2f} {tiempos[1]:>16.2f} {recodificadas:>17}")
+
+
+def bench_binario(proto):
+    """Shard de un profesor: JSON vs sesiones en formato binario (tamaño, guardado y carga)."""
+    print("== Formato binario de sesiones: shard de un profesor ==")
+    print(f"{'sesiones':>9} {'formato':>8} {'tamaño KB':>10} {'guardar ms':>11} {'cargar ms':>10}")
+    repeticiones = 5
+    for alumnos, cursos, sesiones_por_curso in ((30, 4, 25), (30, 4, 250), (200, 10, 500)):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia()
+        uid = poblar(proto, sistema, 1, alumnos=alumnos, cursos=cursos, sesiones_por_curso=sesiones_por_curso)[0]
+        datos = sistema.datos_por_usuario[uid]
+        for binario in (False, True):
+            almacenamiento = proto.AlmacenamientoShards(sincronizar=False, sesiones_binarias=binario)
+            almacenamiento.cargar_datos()
+            t_guardar = t_cargar = 0.0
+            for _ in range(repeticiones):
+                # Guardado en frío: sin fragmentos JSON cacheados
+                for clave in ("estudiantes", "cursos", "sesiones"):
+                    for entidad in datos[clave].values():
+                        entidad.marcar_modificado()
+                t0 = time.perf_counter()
+                almacenamiento.guardar_datos({uid: datos})
+                t_guardar += time.perf_counter() - t0
+                t0 = time.perf_counter()
+                almacenamiento.cargar_datos_usuario(uid)
+                t_cargar += time.perf_counter() - t0
+            kb = os.path.getsize(almacenamiento._ruta_shard(uid)) / 1024
+            nombre = "binario" if binario else "json"
+            print(f"{cursos * sesiones_por_curso:>9} {nombre:>8} {kb:>10.1f} {t_guardar / repeticiones * 1000:>11.1f} {t_cargar / repeticiones * 1000:>10.1f}")
+
+
+def bench_transaccion(proto):
+    """Justificar muchas inasistencias: un guardado por mutación vs una transacción."""
+    print("== Transacciones: justificar todas las inasistencias de un alumno ==")
+    print(f"{'sesiones':>9} {'sin transacción ms':>19} {'escrituras':>11} {'transacción ms':>15} {'escrituras':>11}")
+    for sesiones_por_curso in (25, 100, 250):
+        resultados = []
+        for con_transaccion in (False, True):
+            carpeta_temporal()
+            almacenamiento = proto.AlmacenamientoJSON(sincronizar=False)
+            sistema = proto.SistemaAsistencia(almacenamiento=almacenamiento)
+            uid = poblar(proto, sistema, 5, alumnos=30, cursos=4, sesiones_por_curso=sesiones_por_curso)[0]
+            datos = sistema.datos_por_usuario[uid]
+            rut = next(iter(datos["estudiantes"]))
+            escrituras = almacenamiento.estadisticas_serializacion["escrituras"]
+
+            def justificar_todo():
+                for sess in list(datos["sesiones"].values()):
+                    if rut not in sess.ruts_presentes and rut not in sess.ruts_justificados:
+                        sistema.editar_sesion(uid, sess.id, nuevos_ruts_justificados=sess.ruts_justificados | {rut})
+
+            t0 = time.perf_counter()
+            if con_transaccion:
+                with sistema.transaccion(uid):
+                    justificar_todo()
+            else:
+                justificar_todo()
+            resultados.append(((time.perf_counter() - t0) * 1000, almacenamiento.estadisticas_serializacion["escrituras"] - escrituras))
+        (t_sin, e_sin), (t_con, e_con) = resultados
+        print(f"{4 * sesiones_por_curso:>9} {t_sin:>19.1f} {e_sin:>11} {t_con:>15.1f} {e_con:>11}")
+
+
+def bench_sesiones_curso(proto):
+    """Sesiones de un curso: recorrer todas las sesiones del usuario vs índice por curso."""
+    print("== Índice de sesiones por curso: obtener_sesiones_por_curso ==")
+    print(f"{'cursos':>7} {'sesiones':>9} {'recorrido µs/op':>16} {'índice µs/op':>13}")
+    consultas = 200
+    for cursos in (4, 40, 400):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoJSON(sincronizar=False))
+        uid = poblar(proto, sistema, 1, alumnos=30, cursos=cursos, sesiones_por_curso=25)[0]
+        datos = sistema.datos_por_usuario[uid]
+        codigos = list(datos["cursos"])
+
+        t0 = time.perf_counter()
+        for i in range(consultas):
+            # Copia de la versión original de obtener_sesiones_por_curso (+ el orden por fecha de la GUI)
+            codigo = codigos[i % len(codigos)]
+            sorted([s for s in datos["sesiones"].values() if s.codigo_curso == codigo], key=lambda s: s.fecha)
+        t_recorrido = (time.perf_counter() - t0) / consultas * 1e6
+
+        sistema.obtener_sesiones_por_curso(uid, codigos[0]) # Construye el índice (no se mide)
+        t0 = time.perf_counter()
+        for i in range(consultas):
+            sistema.obtener_sesiones_por_curso(uid, codigos[i % len(codigos)])
+        t_indice = (time.perf_counter() - t0) / consultas * 1e6
+        print(f"{cursos:>7} {len(datos['sesiones']):>9} {t_recorrido:>16.1f} {t_indice:>13.1f}")
+
+
+def bench_rango(proto):
+    """Sesiones de un curso en un rango de fechas (un mes): filtrar y ordenar vs búsqueda binaria."""
+    print("== Sesiones por rango de fechas: sesiones_en_rango ==")
+    print(f"{'sesiones':>9} {'filtrar+ordenar µs/op':>22} {'rango µs/op':>12}")
+    consultas = 200
+    for sesiones_por_curso in (50, 500, 5000):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoJSON(sincronizar=False))
+        uid = poblar(proto, sistema, 1, alumnos=10, cursos=1, sesiones_por_curso=sesiones_por_curso)[0]
+        datos = sistema.datos_por_usuario[uid]
+        codigo = next(iter(datos["cursos"]))
+        desde = datetime(2025, 4, 1)
+        hasta = datetime(2025, 4, 30, 23, 59)
+
+        t0 = time.perf_counter()
+        for _ in range(consultas):
+            sorted([s for s in datos["sesiones"].values() if s.codigo_curso == codigo and desde <= s.fecha <= hasta], key=lambda s: s.fecha)
+        t_filtro = (time.perf_counter() - t0) / consultas * 1e6
+
+        sistema.obtener_sesiones_por_curso(uid, codigo) # Construye el índice (no se mide)
+        t0 = time.perf_counter()
+        for _ in range(consultas):
+            list(sistema.sesiones_en_rango(uid, codigo, desde, hasta))
+        t_rango = (time.perf_counter() - t0) / consultas * 1e6
+        print(f"{len(datos['sesiones']):>9} {t_filtro:>22.1f} {t_rango:>12.1f}")
+
+
+def bench_registro_ruts(proto):
+    """¿El RUT es alumno de algún usuario? Recorrer todos los usuarios vs índice global de RUTs."""
+    print("== Índice global de RUTs: validación de registrar_usuario (shards sin cargar) ==")
+    print(f"{'usuarios':>9} {'alumnos':>8} {'recorrido ms':>13} {'índice µs':>10}")
+    for n_usuarios in (10, 100, 300):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia()
+        poblar(proto, sistema, n_usuarios, alumnos=500, cursos=1, sesiones_por_curso=1)
+        proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoShards(sincronizar=False)) # Migración (no se mide)
+        shards = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoShards(sincronizar=False))
+        rut = rut_sintetico(10 ** 7) # No es alumno de nadie: el peor caso del recorrido
+
+        # Copia de la validación original de registrar_usuario
+        t0 = time.perf_counter()
+        any(rut in datos["estudiantes"] for _, datos in shards._iterar_datos_todos_usuarios())
+        t_recorrido = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        shards._registro_ruts.es_alumno(rut)
+        t_indice = (time.perf_counter() - t0) * 1e6
+        print(f"{n_usuarios:>9} {n_usuarios * 500:>8} {t_recorrido:>13.1f} {t_indice:>10.1f}")
+
+
+def bench_codigos_base(proto):
+    """Validación de crear_curso: recorrer los cursos de todos los usuarios vs índice de códigos base."""
+    print("== Índice de códigos base: validación de crear_curso (shards sin cargar) ==")
+    print(f"{'usuarios':>9} {'cursos':>7} {'recorrido ms':>13} {'índice µs':>10}")
+    for n_usuarios in (10, 100, 300):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia()
+        poblar(proto, sistema, n_usuarios, alumnos=5, cursos=20, sesiones_por_curso=1)
+        proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoShards(sincronizar=False)) # Migración (no se mide)
+        shards = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoShards(sincronizar=False))
+        codigo_base = "NUEVO" # No existe: el peor caso del recorrido
+
+        # Copia de la validación original de crear_curso
+        t0 = time.perf_counter()
+        for _, datos in shards._iterar_datos_todos_usuarios():
+            for codigo_existente in datos["cursos"].keys():
+                if codigo_base == codigo_existente or codigo_base.split('-')[0] == codigo_existente.split('-')[0]:
+                    break
+        t_recorrido = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        shards._codigos_base.usuarios(proto.base_de_codigo(codigo_base))
+        t_indice = (time.perf_counter() - t0) * 1e6
+        print(f"{n_usuarios:>9} {n_usuarios * 20:>7} {t_recorrido:>13.1f} {t_indice:>10.1f}")
+
+
+def bench_nombres(proto):
+    """Importar N alumnos: lista de nombres normalizados por llamada vs índice de nombres."""
+    print("== Índice de nombres: importar alumnos con agregar_estudiante ==")
+    print(f"{'alumnos':>8} {'lista ms':>10} {'índice ms':>10}")
+    for n in (1000, 3000, 10000):
+        nombres = [f"Alumno Importado {i}" for i in range(n)]
+
+        # Copia de la validación original: una lista nueva de nombres normalizados por alumno
+        estudiantes = {}
+        t0 = time.perf_counter()
+        for i, nombre in enumerate(nombres):
+            if nombre.lower().strip() in [st.nombre.lower().strip() for st in estudiantes.values()]:
+                raise ValueError(nombre)
+            estudiantes[rut_sintetico(i)] = proto.Estudiante(rut_sintetico(i), nombre)
+        t_lista = (time.perf_counter() - t0) * 1000
+
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoJSON(sincronizar=False))
+        uid = sistema.registrar_usuario(rut_sintetico(50_000_000), "benchmark")
+        t0 = time.perf_counter()
+        with sistema.transaccion(uid): # Un solo guardado: se mide la validación, no el disco
+            for i, nombre in enumerate(nombres):
+                sistema.agregar_estudiante(uid, nombre, rut_sintetico(i))
+        t_indice = (time.perf_counter() - t0) * 1000
+        print(f"{n:>8} {t_lista:>10.0f} {t_indice:>10.0f}")
+
+
+def bench_alumnos(proto):
+    """Registros de un alumno (renombrar/eliminar): recorrer sesiones y cursos vs índice inverso."""
+    print("== Índice inverso alumno -> cursos/sesiones ==")
+    print(f"{'sesiones':>9} {'recorrido ms':>13} {'índice ms':>10}")
+    for sesiones_por_curso in (10, 100, 500):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoJSON(sincronizar=False))
+        uid = poblar(proto, sistema, 1, alumnos=30, cursos=20, sesiones_por_curso=sesiones_por_curso)[0]
+        datos = sistema.datos_por_usuario[uid]
+        rut = next(iter(datos["estudiantes"]))
+
+        # Las sesiones originales guardaban sets de RUTs: se arman antes de medir
+        asistencia = [(s.id, s.ruts_presentes, s.ruts_justificados) for s in datos["sesiones"].values()]
+
+        # Copia del recorrido original de actualizar_estudiante / eliminar_estudiante
+        t0 = time.perf_counter()
+        sesiones = [sid for sid, presentes, justificados in asistencia if rut in presentes or rut in justificados]
+        cursos = [c.codigo for c in datos["cursos"].values() if rut in c.estudiantes_ruts]
+        t_recorrido = (time.perf_counter() - t0) * 1000
+
+        indice = sistema._indice_alumnos(uid) # Se construye una vez al primer uso (no se mide)
+        t0 = time.perf_counter()
+        sesiones_indice, cursos_indice = indice.sesiones_de(rut), indice.cursos_de(rut)
+        t_indice = (time.perf_counter() - t0) * 1000
+        assert set(sesiones) == sesiones_indice and set(cursos) == cursos_indice
+        print(f"{len(datos['sesiones']):>9} {t_recorrido:>13.2f} {t_indice:>10.3f}")
+
+
+def bench_contadores(proto):
+    """Porcentajes de todo un curso (refrescar_lista_porcentajes): recorrer sesiones por alumno vs contadores."""
+    print("== Contadores de asistencia: porcentajes de un curso completo ==")
+    print(f"{'alumnos':>8} {'sesiones':>9} {'recorrido ms':>13} {'contadores ms':>14}")
+    for alumnos, sesiones_por_curso in ((30, 40), (100, 100), (300, 200)):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoJSON(sincronizar=False))
+        uid = poblar(proto, sistema, 1, alumnos=alumnos, cursos=1, sesiones_por_curso=sesiones_por_curso)[0]
+        datos = sistema.datos_por_usuario[uid]
+        codigo, curso = next(iter(datos["cursos"].items()))
+
+        # Las sesiones originales guardaban sets de RUTs: se arman antes de medir
+        sesiones = [(s.ruts_presentes, s.ruts_justificados) for s in sistema.obtener_sesiones_por_curso(uid, codigo)]
+
+        # Copia del cálculo original: recorre las sesiones del curso una vez por alumno
+        t0 = time.perf_counter()
+        originales = {}
+        for rut in curso.estudiantes_ruts:
+            asistido = sum(1 for presentes, justificados in sesiones if rut in presentes or rut in justificados)
+            originales[rut] = asistido / len(sesiones) * 100.0
+        t_recorrido = (time.perf_counter() - t0) * 1000
+
+        sistema._contadores_asistencia(uid) # Se construyen una vez al primer uso (no se mide)
+        t0 = time.perf_counter()
+        nuevos = {rut: sistema.porcentaje_asistencia_por_estudiante(uid, codigo, rut) for rut in curso.estudiantes_ruts}
+        t_contadores = (time.perf_counter() - t0) * 1000
+        assert nuevos == originales
+        print(f"{alumnos:>8} {sesiones_por_curso:>9} {t_recorrido:>13.2f} {t_contadores:>14.2f}")
+
+
+def bench_matriz(proto):
+    """Estadísticas de un curso: bucles por alumno sobre las sesiones vs matriz NumPy."""
+    print("== Matriz de asistencia (NumPy): porcentajes, aprobados, asistencia por sesión y rachas ==")
+    if proto.np is None:
+        print("NumPy no está instalado; se omite.")
+        return
+    print(f"{'alumnos':>8} {'sesiones':>9} {'bucle ms':>9} {'construir ms':>13} {'matriz ms':>10}")
+    for alumnos in (50, 500, 5000):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoJSON(sincronizar=False))
+        uid = poblar(proto, sistema, 1, alumnos=alumnos, cursos=1, sesiones_por_curso=60)[0]
+        codigo, curso = next(iter(sistema.datos_por_usuario[uid]["cursos"].items()))
+        sesiones = sistema.obtener_sesiones_por_curso(uid, codigo)
+        # Las sesiones originales guardaban sets de RUTs: se arman antes de medir
+        asistencia = [(s.id, s.ruts_presentes, s.ruts_justificados) for s in sesiones]
+
+        # Bucles en Python: un recorrido de las sesiones por alumno (como porcentaje_asistencia_por_estudiante original)
+        t0 = time.perf_counter()
+        porcentajes, rachas = {}, {}
+        for rut in curso.estudiantes_ruts:
+            asistidas = racha = maxima = 0
+            for _, presentes, justificados in asistencia:
+                if rut in presentes or rut in justificados:
+                    asistidas += 1
+                    racha = 0
+                else:
+                    racha += 1
+                    maxima = max(maxima, racha)
+            porcentajes[rut] = asistidas / len(sesiones) * 100.0
+            rachas[rut] = maxima
+        aprobados = {rut: pct >= curso.min_asistencia for rut, pct in porcentajes.items()}
+        por_sesion = {sid: (len(presentes & curso.estudiantes_ruts), len(justificados & curso.estudiantes_ruts)) for sid, presentes, justificados in asistencia}
+        t_bucle = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        matriz = sistema.matriz_asistencia(uid, codigo)
+        t_construir = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        resultado = (matriz.porcentajes(), matriz.aprobados(curso.min_asistencia), matriz.asistencia_por_sesion(), matriz.rachas_ausencia())
+        t_matriz = (time.perf_counter() - t0) * 1000
+        assert resultado == (porcentajes, aprobados, por_sesion, rachas)
+        print(f"{alumnos:>8} {len(sesiones):>9} {t_bucle:>9.1f} {t_construir:>13.1f} {t_matriz:>10.2f}")
+
+
+def bench_memoria(proto):
+    """Memoria de un semestre cargado: clases originales (__dict__ + sets de str) vs entidades compactas."""
+    print("== Entidades compactas: memoria de un semestre sintético (32 sesiones por curso) ==")
+    import tracemalloc
+
+    # Copias de las clases originales: atributos en __dict__ y asistencia como sets de str
+    class EstudianteOriginal:
+        def __init__(self, d):
+            self.version, self._fragmento = 0, None
+            self.rut, self.nombre = d["rut"], d["nombre"]
+
+    class CursoOriginal:
+        def __init__(self, d):
+            self.version, self._fragmento = 0, None
+            self.codigo, self.nombre, self.horario = d["codigo"], d["nombre"], d.get("horario", "")
+            self.estudiantes_ruts = set(d.get("estudiantes_ruts") or ())
+            self.cerrado, self.min_asistencia = d.get("cerrado", False), d.get("min_asistencia", 60.0)
+
+    class SesionOriginal:
+        def __init__(self, d):
+            self.version, self._fragmento = 0, None
+            self.id, self.codigo_curso, self.fecha = d["id"], d["codigo_curso"], datetime.fromisoformat(d["fecha"])
+            self.ruts_presentes = set(d.get("ruts_presentes", []))
+            self.ruts_justificados = set(d.get("ruts_justificados", []))
+
+    def cargar_original(texto):
+        return {uid: {
+            "estudiantes": {e["rut"]: EstudianteOriginal(e) for e in d["estudiantes"]},
+            "cursos": {c["codigo"]: CursoOriginal(c) for c in d["cursos"]},
+            "sesiones": {x["id"]: SesionOriginal(x) for x in d["sesiones"]},
+        } for uid, d in json.loads(texto).items()}
+
+    def cargar_compacto(texto):
+        return {uid: proto.datos_usuario_desde_dict(d) for uid, d in json.loads(texto).items()}
+
+    def medir(cargar, texto) -> float:
+        tracemalloc.start()
+        datos = cargar(texto)
+        actual, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del datos
+        return actual / (1024 * 1024)
+
+    print(f"{'sesiones':>9} {'original MB':>12} {'compacto MB':>12} {'ahorro':>7}")
+    for n_usuarios in (20, 100):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoJSON(sincronizar=False))
+        poblar(proto, sistema, n_usuarios, alumnos=40, cursos=6, sesiones_por_curso=32)
+        texto = json.dumps({str(uid): proto.datos_usuario_a_dict(d) for uid, d in sistema.datos_por_usuario.items()})
+        del sistema
+
+        # Tabla de RUTs nueva, para que los RUTs internados cuenten en la medición
+        tabla = proto.TABLA_RUTS
+        proto.TABLA_RUTS = proto.TablaRuts()
+        try:
+            mb_compacto = medir(cargar_compacto, texto)
+        finally:
+            proto.TABLA_RUTS = tabla
+        mb_original = medir(cargar_original, texto)
+        print(f"{n_usuarios * 6 * 32:>9} {mb_original:>12.1f} {mb_compacto:>12.1f} {1 - mb_compacto / mb_original:>7.0%}")
+
+
+def bench_busqueda(proto):
+    """Búsqueda mientras se escribe: recorrer y ordenar todos los nombres vs índice de trigramas."""
+    print("== Índice de búsqueda de alumnos: una consulta por tecla ==")
+    print(f"{'alumnos':>8} {'recorrido ms/tecla':>19} {'índice ms (1-2 letras)':>23} {'índice ms (3+)':>15} {'1-2 letras sin límite':>22}")
+    nombres = ["María", "José", "Ignacio", "Sofía", "Matías", "Valentina", "Benjamín", "Martina", "Tomás", "Agustina",
+               "Vicente", "Florencia", "Joaquín", "Catalina", "Cristóbal", "Antonia", "Diego", "Isidora", "Lucas", "Emilia"]
+    apellidos = ["González", "Muñoz", "Rojas", "Díaz", "Pérez", "Soto", "Contreras", "Silva", "Martínez", "Sepúlveda",
+                 "Morales", "Rodríguez", "López", "Fuentes", "Hernández", "Torres", "Araya", "Flores", "Espinoza", "Valenzuela",
+                 "Castillo", "Tapia", "Reyes", "Gutiérrez", "Castro", "Pizarro", "Álvarez", "Vásquez", "Sánchez", "Fernández"]
+    # Se escribe "sepulveda ca" tecla por tecla (sin tildes) y luego un RUT
+    teclas = ["sepulveda ca"[:i] for i in range(1, 13)] + ["1000042"[:i] for i in range(1, 8)]
+    rnd = random.Random(1)
+    for n in (1000, 10000, 50000):
+        estudiantes = {}
+        for i in range(n):
+            rut = rut_sintetico(i)
+            estudiantes[rut] = proto.Estudiante(rut, f"{rnd.choice(nombres)} {rnd.choice(apellidos)} {rnd.choice(apellidos)} {i}")
+
+        t0 = time.perf_counter()
+        for consulta in teclas:
+            # Copia de la búsqueda original de ui_buscar_alumnos
+            sorted([st for st in estudiantes.values() if consulta in st.nombre.lower()], key=lambda s: s.nombre)
+        t_recorrido = (time.perf_counter() - t0) / len(teclas) * 1000
+
+        indice = proto.IndiceBusqueda(estudiantes.values()) # Se construye una vez al primer uso (no se mide)
+        tiempos = {True: [], False: []} # ¿consulta corta?
+        for consulta in teclas:
+            # Como en la interfaz: mientras se escribe se muestran los LIMITE_BUSQUEDA más relevantes
+            t0 = time.perf_counter()
+            indice.buscar(consulta, proto.LIMITE_BUSQUEDA)
+            tiempos[len(consulta) < 3].append((time.perf_counter() - t0) * 1000)
+        cortas, largas = (sum(t) / len(t) for t in (tiempos[True], tiempos[False]))
+        # Botón "Buscar": todos los resultados
+        t0 = time.perf_counter()
+        cortas_todas = [indice.buscar(consulta) for consulta in teclas if len(consulta) < 3]
+        sin_limite = (time.perf_counter() - t0) / len(cortas_todas) * 1000
+        print(f"{n:>8} {t_recorrido:>19.2f} {cortas:>23.2f} {largas:>15.2f} {sin_limite:>22.2f}")
+
+
+def bench_secciones(proto):
+    """Guardar los alumnos de cada sección (asignar_estudiantes_a_curso): intersecar con las otras secciones vs grupo de secciones."""
+    print("== Grupos de secciones: validación al guardar los alumnos de todas las secciones ==")
+    print(f"{'secciones':>10} {'alumnos':>8} {'intersección ms':>16} {'grupo ms':>9}")
+    for n_secciones in (5, 20, 80):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoJSON(sincronizar=False))
+        uid = poblar(proto, sistema, 1, alumnos=40 * n_secciones, cursos=0, sesiones_por_curso=0)[0]
+        datos = sistema.datos_por_usuario[uid]
+        ruts = sorted(datos["estudiantes"])
+        for i in range(n_secciones):
+            codigo = f"MAT-{i + 1}"
+            datos["cursos"][codigo] = proto.Curso(codigo, f"Matemática - Sección {i + 1}", "", ruts[40 * i:40 * (i + 1)])
+        sistema._indexar_globalmente(uid, datos)
+        sistema._invalidar_indices(uid)
+        cursos = list(datos["cursos"].values())
+
+        # Copia de la validación original: intersecar los alumnos con cada una de las otras secciones
+        t0 = time.perf_counter()
+        for curso in cursos:
+            codigos = sistema._codigos_base.secciones(proto.base_de_codigo(curso.codigo), uid) - {curso.codigo}
+            for otra in sorted(codigos):
+                assert not datos["cursos"][otra].estudiantes_ruts.intersection(curso.estudiantes_ruts)
+        t_interseccion = (time.perf_counter() - t0) * 1000
+
+        grupos = sistema._indice_grupos(uid) # Se construye una vez al primer uso (no se mide)
+        t0 = time.perf_counter()
+        for curso in cursos:
+            grupo = grupos.grupo(curso.codigo)
+            for rut in curso.estudiantes_ruts:
+                assert grupo.otra_seccion(rut, curso.codigo) is None
+        t_grupo = (time.perf_counter() - t0) * 1000
+        print(f"{n_secciones:>10} {40 * n_secciones:>8} {t_interseccion:>16.2f} {t_grupo:>9.2f}")
+
+
+def bench_resumen(proto):
+    """Vista de porcentajes de un curso: ordenar a todos los alumnos y consultar uno por uno vs resumen_asistencia_curso."""
+    print("== Resumen de asistencia de un curso (refrescar_lista_porcentajes) ==")
+    print(f"{'alumnos':>8} {'inscritos':>10} {'por alumno ms':>14} {'resumen ms':>11}")
+    for alumnos, cursos in ((100, 3), (1000, 10), (5000, 20)):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoJSON(sincronizar=False))
+        uid = poblar(proto, sistema, 1, alumnos=alumnos, cursos=0, sesiones_por_curso=0)[0]
+        datos = sistema.datos_por_usuario[uid]
+        ruts = sorted(datos["estudiantes"])
+        inscritos = alumnos // cursos
+        for c in range(cursos):
+            codigo = f"C{c}"
+            datos["cursos"][codigo] = proto.Curso(codigo, f"Curso {c}", "", ruts[c * inscritos:(c + 1) * inscritos])
+        for _ in range(40):
+            for c in range(cursos):
+                sistema.iniciar_sesion(uid, f"C{c}")
+        codigo = "C0"
+
+        # Copia del bucle original de la GUI: todos los alumnos ordenados, una consulta por inscrito
+        t0 = time.perf_counter()
+        curso = sistema._obtener_datos_usuario(uid)["cursos"][codigo]
+        originales = []
+        for rut, st in sorted(sistema._obtener_datos_usuario(uid)["estudiantes"].items(), key=lambda x: x[1].nombre):
+            if rut in curso.estudiantes_ruts:
+                originales.append((rut, sistema.porcentaje_asistencia_por_estudiante(uid, codigo, rut)))
+        t_por_alumno = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        filas = sistema.resumen_asistencia_curso(uid, codigo)
+        t_resumen = (time.perf_counter() - t0) * 1000
+        assert sorted((f["rut"], f["porcentaje"]) for f in filas) == sorted(originales)
+        print(f"{alumnos:>8} {inscritos:>10} {t_por_alumno:>14.2f} {t_resumen:>11.2f}")
+
+
+def bench_riesgo(proto):
+    """Reporte institucional de alumnos en riesgo (--reporte-riesgo, shards): un proceso vs uno por CPU."""
+    print("== Reporte de alumnos en riesgo: 1000 profesores, ~600k marcas de asistencia ==")
+    carpeta_temporal()
+    sistema = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoJSON(sincronizar=False))
+    poblar(proto, sistema, 1000, alumnos=30, cursos=4, sesiones_por_curso=5)
+    proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoShards(sincronizar=False)) # Migración (no se mide)
+    print(f"{'procesos':>9} {'segundos':>9} {'filas':>7} {'CSV MB':>7}")
+    for procesos in (1, max(os.cpu_count() or 1, 2)):
+        # Proceso aparte, igual que desde la línea de comandos (incluye arrancar e importar)
+        t0 = time.perf_counter()
+        salida = subprocess.run([sys.executable, RUTA_PROTOTIPO, "--reporte-riesgo", "riesgo.csv", "--procesos", str(procesos)],
+                                capture_output=True, text=True, check=True).stdout
+        duracion = time.perf_counter() - t0
+        filas = int(salida.split()[0])
+        print(f"{procesos:>9} {duracion:>9.2f} {filas:>7} {tamano_mb('riesgo.csv'):>7.2f}")
+
+
+def bench_tendencia(proto):
+    """Tendencia semanal de un curso: agrupar las sesiones en cada consulta vs resúmenes mantenidos por delta."""
+    print("== Resúmenes por semana: tendencia de asistencia de un curso ==")
+    print(f"{'alumnos':>8} {'sesiones':>9} {'recorrido ms':>13} {'resumen ms':>11}")
+    for alumnos, sesiones_por_curso in ((30, 40), (100, 200), (300, 1000)):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoJSON(sincronizar=False))
+        uid = poblar(proto, sistema, 1, alumnos=alumnos, cursos=1, sesiones_por_curso=sesiones_por_curso)[0]
+        codigo, curso = next(iter(sistema.datos_por_usuario[uid]["cursos"].items()))
+
+        # Las sesiones originales guardaban sets de RUTs: se arman antes de medir
+        sesiones = [(s.fecha, s.ruts_presentes, s.ruts_justificados) for s in sistema.obtener_sesiones_por_curso(uid, codigo)]
+
+        # Agrupación directa: una pasada por las sesiones del curso y sus sets en cada consulta
+        t0 = time.perf_counter()
+        semanas = {}
+        for fecha, presentes, justificados in sesiones:
+            dia = fecha.date()
+            sumas = semanas.setdefault(dia - timedelta(days=dia.weekday()), [0, 0, 0, 0])
+            sumas[0] += 1
+            sumas[1] += len(presentes)
+            sumas[2] += len(justificados)
+            sumas[3] += len(presentes | justificados)
+        originales = [sumas[3] / sumas[0] / len(curso.estudiantes_ruts) * 100.0 for _, sumas in sorted(semanas.items())]
+        t_recorrido = (time.perf_counter() - t0) * 1000
+
+        sistema._contadores_asistencia(uid) # Se construyen una vez al primer uso (no se mide)
+        t0 = time.perf_counter()
+        filas = sistema.tendencia_asistencia(uid, codigo, "semana")
+        t_resumen = (time.perf_counter() - t0) * 1000
+        assert [f["porcentaje"] for f in filas] == originales
+        print(f"{alumnos:>8} {sesiones_por_curso:>9} {t_recorrido:>13.2f} {t_resumen:>11.3f}")
+
+
+def bench_exportar(proto):
+    """Exportar el historial de toda la institución (shards): armar todas las filas y luego escribir vs generador en streaming."""
+    import csv
+    import tracemalloc
+    print("== Exportación de asistencia en streaming (CSV, shards sin cargar) ==")
+    print(f"{'usuarios':>9} {'filas':>8} {'lista s':>8} {'lista MB':>9} {'stream s':>9} {'stream MB':>10}")
+    for n_usuarios in (20, 100):
+        carpeta_temporal()
+        sistema = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoJSON(sincronizar=False))
+        poblar(proto, sistema, n_usuarios, alumnos=30, cursos=4, sesiones_por_curso=50)
+        proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoShards(sincronizar=False)) # Migración (no se mide)
+
+        # Enfoque directo: cargar a todos los usuarios, armar la lista completa de filas y escribirla
+        shards = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoShards(sincronizar=False))
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        datos_por_usuario = dict(shards._iterar_datos_todos_usuarios())
+        filas = []
+        for uid, datos in sorted(datos_por_usuario.items()):
+            for sesion in sorted(datos["sesiones"].values(), key=lambda s: (s.codigo_curso, s.fecha, s.id)):
+                curso = datos["cursos"][sesion.codigo_curso]
+                presentes, justificados = sesion.ruts_presentes, sesion.ruts_justificados
+                for rut in sorted(curso.estudiantes_ruts | presentes | justificados):
+                    estado = "presente" if rut in presentes else "justificado" if rut in justificados else "ausente"
+                    filas.append((uid, curso.codigo, sesion.id, sesion.fecha.isoformat(), rut, datos["estudiantes"][rut].nombre, estado))
+        with open("lista.csv", "w", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerows(filas)
+        t_lista = time.perf_counter() - t0
+        _, pico_lista = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        n_filas = len(filas)
+        del filas, datos_por_usuario
+
+        shards = proto.SistemaAsistencia(almacenamiento=proto.AlmacenamientoShards(sincronizar=False))
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        n = shards.exportar_asistencia("stream.csv")
+        t_stream = time.perf_counter() - t0
+        _, pico_stream = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert n == n_filas
+        print(f"{n_usuarios:>9} {n:>8} {t_lista:>8.2f} {pico_lista / 2**20:>9.1f} {t_stream:>9.2f} {pico_stream / 2**20:>10.1f}")
+
+
+def medir_carga(proto, cargador: str, ruta: str):
+    """Se ejecuta en un proceso aparte (--medir-carga) para que el RSS pico sea solo de esta carga."""
+    def rss_pico_mb() -> float:
+        try:
+            import resource
+        except ImportError: # Windows
+            return float("nan")
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+    
+    base = rss_pico_mb()
+    t0 = time.perf_counter()
+    if cargador == "original":
+        # Copia del cargar_todo original: json.load del árbol completo y luego los objetos
+        with open(ruta, "r", encoding="utf-8") as f:
+            raw_datos = json.load(f)
+        datos = {int(uid): proto.datos_usuario_desde_dict(d) for uid, d in raw_datos.items()}
+    else:
+        datos = dict(proto.iterar_datos_stream(ruta))
+    duracion = (time.perf_counter() - t0) * 1000
+    sesiones = sum(len(d["sesiones"]) for d in datos.values())
+    print(json.dumps({"ms": duracion, "rss_mb": rss_pico_mb() - base, "sesiones": sesiones}))
+
+
+def bench_carga(proto):
+    """Tiempo y RSS pico de la carga: json.load + objetos vs lector en streaming."""
+    print("== Carga en streaming: archivo sintético de 100k sesiones ==")
+    carpeta_temporal()
+    sistema = proto.SistemaAsistencia()
+    poblar(proto, sistema, 100, alumnos=30, cursos=4, sesiones_por_curso=250)
+    ruta = os.path.abspath(proto.ARCHIVO_DATOS)
+    print(f"datos.json: {tamano_mb(ruta):.1f} MB")
+    print(f"{'cargador':>10} {'sesiones':>9} {'ms':>8} {'RSS pico MB':>12}")
+    for cargador in ("original", "stream"):
+        salida = subprocess.run([sys.executable, os.path.abspath(__file__), "--medir-carga", cargador, ruta],
+                                capture_output=True, text=True, check=True).stdout
+        r = json.loads(salida.strip().splitlines()[-1])
+        print(f"{cargador:>10} {r['sesiones']:>9} {r['ms']:>8.0f} {r['rss_mb']:>12.1f}")
+
+
+BENCHMARKS = {
+    "journal": bench_journal,
+    "shards": bench_shards,
+    "atomico": bench_atomico,
+    "stream": bench_stream,
+    "carga": bench_carga,
+    "fragmentos": bench_fragmentos,
+    "binario": bench_binario,
+    "transaccion": bench_transaccion,
+    "sesiones_curso": bench_sesiones_curso,
+    "rango": bench_rango,
+    "registro_ruts": bench_registro_ruts,
+    "codigos_base": bench_codigos_base,
+    "nombres": bench_nombres,
+    "alumnos": bench_alumnos,
+    "contadores": bench_contadores,
+    "matriz": bench_matriz,
+    "memoria": bench_memoria,
+    "busqueda": bench_busqueda,
+    "secciones": bench_secciones,
+    "resumen": bench_resumen,
+    "riesgo": bench_riesgo,
+    "tendencia": bench_tendencia,
+    "exportar": bench_exportar,
+}
+
+
+def main():
+    proto = cargar_prototipo()
+    if sys.argv[1:2] == ["--medir-carga"]:
+        medir_carga(proto, sys.argv[2], sys.argv[3])
+        return
+    nombres = sys.argv[1:] or list(BENCHMARKS)
+    for nombre in nombres:
+        if nombre not in BENCHMARKS:
+            print(f"Benchmark desconocido: {nombre}. Opciones: {', '.join(BENCHMARKS)}")
+            continue
+        BENCHMARKS[nombre](proto)
+        print()
+
+
+if __name__ == "__main__":
+    main()